@@ -1,95 +1,196 @@
 import os
 import subprocess
-from concurrent.futures import ProcessPoolExecutor, as_completed
-from threading import Lock
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import telemetry
+
+# MAFFT jobs are plain subprocesses, so the pool is made of threads that only wait on them.
+# Workers never touch the log files: they hand their result back and the parent thread
+# alone appends to the log / skipped list, so entries can't interleave.
+
+# Alignment strategies. "auto" leaves the choice to MAFFT; "adaptive" picks L-INS-i for
+# small inputs and FFT-NS-2 for anything larger than the ACCURATE_MAX_* limits.
+MAFFT_STRATEGIES = {
+    "auto": ["--auto"],
+    "linsi": ["--localpair", "--maxiterate", "1000"],  # L-INS-i: accurate, slow
+    "fftnsi": ["--retree", "2", "--maxiterate", "2"],  # FFT-NS-i
+    "fftns2": ["--retree", "2", "--maxiterate", "0"],  # FFT-NS-2: fast
+}
+ACCURATE_MAX_SEQUENCES = 200
+ACCURATE_MAX_LENGTH = 2000
 
-# Global locks for writing safely from parallel processes
-log_lock = Lock()
-skipped_lock = Lock()
 
 def count_fasta_sequences(file_path):
     with open(file_path) as f:
         return sum(1 for line in f if line.startswith(">"))
 
 
-def run_single_mafft_job(input_folder, output_folder, filename, log_file, skipped_file):
-    input_path = os.path.join(input_folder, filename)
-    base_name = filename.replace("filtered_hits_", "")
-    output_filename = f"MSA_{base_name}"
-    output_path = os.path.join(output_folder, output_filename)
+def fasta_job_size(file_path):
+    # (sequence count, longest sequence) of an unaligned FASTA
+    n_sequences = 0
+    longest = 0
+    length = 0
+    with open(file_path) as f:
+        for line in f:
+            if line.startswith(">"):
+                n_sequences += 1
+                longest = max(longest, length)
+                length = 0
+            else:
+                length += len(line.strip())
+    return n_sequences, max(longest, length)
+
+
+def choose_mafft_options(n_sequences, longest, strategy="auto"):
+    if strategy == "adaptive":
+        small = n_sequences <= ACCURATE_MAX_SEQUENCES and longest <= ACCURATE_MAX_LENGTH
+        strategy = "linsi" if small else "fftns2"
+    return MAFFT_STRATEGIES[strategy]
+
 
-    # Skip files with fewer than 2 sequences
-    if count_fasta_sequences(input_path) < 2:
-        with skipped_lock:
-            with open(skipped_file, "a") as skipped:
+def run_mafft_job(input_path, output_path, mafft_threads=1, options=("--auto",)):
+    # Runs in a pool thread. Output goes to a temp file that only replaces the MSA on success.
+    tmp_path = f"{output_path}.tmp"
+    item = os.path.basename(input_path)
+    try:
+        with telemetry.span("05", "mafft_job", item=item, reads=[input_path], writes=[output_path]):
+            with open(tmp_path, "w") as out:
+                result = telemetry.run_subprocess(
+                    ["mafft", "--thread", str(mafft_threads), *options, input_path],
+                    "05",
+                    item=item,
+                    stdout=out,
+                    stderr=subprocess.PIPE
+                )
+            if result.returncode == 0:
+                os.replace(tmp_path, output_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return result.returncode, result.stderr
+
+
+def run_mafft_jobs(jobs, log_file, skipped_file, max_workers=4, total_threads=None, strategy="auto", cache=None):
+    # jobs: list of (filename, input_path, output_path).
+    # Returns {filename: "aligned" / "cached" / "skipped" / "failed"}.
+    # cache: optional mafft_cache.AlignmentCache; hits are copied without running MAFFT.
+    total_threads = total_threads or os.cpu_count() or 1
+    mafft_threads = max(1, total_threads // max_workers)  # keep workers × --thread within the core budget
+    statuses = {}
+
+    with open(log_file, "a") as log, open(skipped_file, "a") as skipped:
+        # Skip files with fewer than 2 sequences; schedule the rest largest first to cut tail latency
+        planned = []
+        for filename, input_path, output_path in jobs:
+            n_sequences, longest = fasta_job_size(input_path)
+            if n_sequences < 2:
                 skipped.write(f"{filename}\n")
-        with log_lock:
-            with open(log_file, "a") as log:
                 log.write(f"[{filename}] Skipped: Less than 2 sequences.\n")
-        return f"{filename} skipped"
+                statuses[filename] = "skipped"
+                continue
 
-    # Run MAFFT
-    try:
-        result = subprocess.run(
-            ["mafft", "--auto", input_path],
-            stdout=open(output_path, "w"),
-            stderr=subprocess.PIPE,
-            text=True
-        )
-        if result.stderr:
-            with log_lock:
-                with open(log_file, "a") as log:
-                    log.write(f"\n[{filename}]\n{result.stderr}\n")
-        return f"{filename} aligned"
-    except Exception as e:
-        with log_lock:
-            with open(log_file, "a") as log:
-                log.write(f"\n[{filename}] Failed to run MAFFT: {str(e)}\n")
-        return f"{filename} failed"
-
-
-def run_mafft_on_folder_parallel(input_folder, output_folder, log_file, skipped_file, max_workers=4):
+            options = choose_mafft_options(n_sequences, longest, strategy)
+            cache_key = cache.key(input_path, options) if cache is not None else None
+            if cache_key is not None and cache.fetch(cache_key, output_path):
+                statuses[filename] = "cached"
+                continue
+            planned.append((n_sequences * longest, filename, input_path, output_path, options, cache_key))
+        planned.sort(reverse=True)
+
+        total_jobs = len(jobs)
+        done = len(statuses)
+        cached = sum(1 for status in statuses.values() if status == "cached")
+        print(f"Total files to process: {total_jobs} ({done - cached} skipped, {cached} from cache, "
+              f"{len(planned)} to align, {max_workers} workers × {mafft_threads} MAFFT threads)")
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(run_mafft_job, input_path, output_path, mafft_threads, options): (filename, output_path, cache_key)
+                for _, filename, input_path, output_path, options, cache_key in planned
+            }
+            for future in as_completed(futures):
+                filename, output_path, cache_key = futures[future]
+                done += 1
+                try:
+                    returncode, stderr = future.result()
+                except Exception as e:
+                    log.write(f"\n[{filename}] Failed to run MAFFT: {str(e)}\n")
+                    statuses[filename] = "failed"
+                else:
+                    if stderr:
+                        log.write(f"\n[{filename}]\n{stderr}\n")
+                    if returncode != 0:
+                        log.write(f"[{filename}] MAFFT exited with code {returncode}\n")
+                    statuses[filename] = "aligned" if returncode == 0 else "failed"
+                    if returncode == 0 and cache_key is not None:
+                        cache.store(cache_key, output_path)
+                log.flush()
+                print(f"[{done}/{total_jobs}] {filename} {statuses[filename]}")
+                telemetry.queue_depth("05", "mafft_jobs", total_jobs - done)
+
+    return statuses
+
+
+def run_mafft_on_folder_parallel(input_folder, output_folder, log_file, skipped_file, max_workers=4, total_threads=None,
+                                 strategy="auto", cache_dir=None):
     os.makedirs(output_folder, exist_ok=True)
 
     faa_files = [f for f in os.listdir(input_folder) if f.endswith(".faa") and f.startswith("filtered_hits_")]
-    total_files = len(faa_files)
+
+    # Queries resolved by exact_match_prefilter.py already have their MSA
+    from exact_match_prefilter import load_resolved_list
+    resolved = {f"filtered_hits_{query_id}.faa" for query_id in load_resolved_list(input_folder)}
+    if resolved:
+        faa_files = [f for f in faa_files if f not in resolved]
+        print(f"{len(resolved)} queries resolved by the exact-match prefilter, not realigned")
+    jobs = [
+        (f, os.path.join(input_folder, f), os.path.join(output_folder, f"MSA_{f.replace('filtered_hits_', '')}"))
+        for f in faa_files
+    ]
 
     # Clear logs
     open(log_file, "w").close()
     open(skipped_file, "w").close()
 
-    print(f"Total files to process: {total_files}")
+    cache = None
+    if cache_dir:
+        from mafft_cache import AlignmentCache
+        cache = AlignmentCache(cache_dir)
 
-    with ProcessPoolExecutor(max_workers=max_workers) as executor:
-        futures = [
-            executor.submit(run_single_mafft_job, input_folder, output_folder, f, log_file, skipped_file)
-            for f in faa_files
-        ]
-        for i, future in enumerate(as_completed(futures), 1):
-            try:
-                result = future.result()
-                print(f"[{i}/{total_files}] {result}")
-            except Exception as e:
-                print(f"[{i}/{total_files}] Error: {str(e)}")
+    return run_mafft_jobs(jobs, log_file, skipped_file, max_workers=max_workers, total_threads=total_threads,
+                          strategy=strategy, cache=cache)
 
 
-# Ask user for input
-if __name__ == "__main__":
-    input_folder = input("Enter the input folder name: ").strip()
-    output_folder = input("Enter the output folder name: ").strip()
-    log_file = input("Enter the name for the log file (e.g., mafft_errors.log): ").strip()
-    skipped_file = input("Enter the name for the skipped file list (e.g., skipped_files.txt): ").strip()
-    
-    try:
-        max_workers = int(input("Enter the number of parallel workers (e.g., 4 or 8): ").strip())
-    except ValueError:
-        print("Invalid input for max_workers. Defaulting to 4.")
-        max_workers = 4
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Align every filtered_hits_*.faa file of a folder with MAFFT.",
+                                     fromfile_prefix_chars="@")
+    parser.add_argument("input_folder")
+    parser.add_argument("output_folder")
+    parser.add_argument("--log-file", default="mafft_errors.log")
+    parser.add_argument("--skipped-file", default="skipped_files.txt")
+    parser.add_argument("--workers", type=int, default=4, help="Parallel MAFFT jobs")
+    parser.add_argument("--threads", type=int, default=os.cpu_count(), help="Total CPU cores for MAFFT")
+    parser.add_argument("--strategy", choices=["adaptive", *MAFFT_STRATEGIES], default="auto")
+    parser.add_argument("--cache-dir", help="Alignment cache folder (disabled when omitted)")
+    telemetry.add_trace_arguments(parser)
+    args = parser.parse_args(argv)
+
+    telemetry.start_trace(args)
 
     run_mafft_on_folder_parallel(
-        input_folder=input_folder,
-        output_folder=output_folder,
-        log_file=log_file,
-        skipped_file=skipped_file,
-        max_workers=max_workers
-    )
\ No newline at end of file
+        input_folder=args.input_folder,
+        output_folder=args.output_folder,
+        log_file=args.log_file,
+        skipped_file=args.skipped_file,
+        max_workers=args.workers,
+        total_threads=args.threads,
+        strategy=args.strategy,
+        cache_dir=args.cache_dir
+    )
+    telemetry.finish_trace(args)
+
+
+if __name__ == "__main__":
+    main()
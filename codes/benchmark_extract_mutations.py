@@ -0,0 +1,66 @@
+import time
+import argparse
+import numpy as np
+
+from extract_mutations_06 import find_mutations, find_mutations_dicts, load_alignment_matrix
+
+AMINO_ACIDS = np.frombuffer(b"ACDEFGHIKLMNPQRSTVWY", dtype=np.uint8)
+
+
+# Synthetic MSA: a random query plus hits carrying point substitutions, deletions and
+# a few query-gap (insertion) columns, roughly what MAFFT gives for close orthologs
+def synthetic_alignment(n_sequences, n_columns, mutation_rate=0.01, gap_rate=0.005, seed=0):
+    rng = np.random.default_rng(seed)
+    query = rng.choice(AMINO_ACIDS, n_columns)
+    matrix = np.tile(query, (n_sequences, 1))
+
+    hits = matrix[1:]
+    substituted = rng.random(hits.shape) < mutation_rate
+    hits[substituted] = rng.choice(AMINO_ACIDS, substituted.sum())
+    hits[rng.random(hits.shape) < gap_rate] = ord("-")
+
+    insertion_columns = rng.random(n_columns) < gap_rate
+    matrix[0, insertion_columns] = ord("-")
+    matrix[1:, insertion_columns] = np.where(rng.random((n_sequences - 1, insertion_columns.sum())) < 0.5,
+                                             ord("-"), rng.choice(AMINO_ACIDS, (n_sequences - 1, insertion_columns.sum())))
+    return [row.tobytes().decode() for row in matrix]
+
+
+def time_call(func, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def run_benchmark(sizes, repeat=3):
+    print(f"{'sequences':>9} {'columns':>8} {'mutations':>9} {'dicts (s)':>10} {'numpy (s)':>10} {'speedup':>8}")
+    for n_sequences, n_columns in sizes:
+        aligned_sequences = synthetic_alignment(n_sequences, n_columns)
+
+        dict_time, expected = time_call(lambda: find_mutations_dicts(aligned_sequences), repeat)
+        numpy_time, result = time_call(lambda: find_mutations(load_alignment_matrix(aligned_sequences)), repeat)
+        if result != expected:
+            raise AssertionError(f"NumPy engine output differs for {n_sequences} x {n_columns}")
+
+        print(f"{n_sequences:>9} {n_columns:>8} {len(expected[0]):>9} {dict_time:>10.4f} {numpy_time:>10.4f} "
+              f"{dict_time / numpy_time:>7.1f}x")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the dict and NumPy mutation extraction engines on synthetic MSAs.",
+                                     fromfile_prefix_chars="@")
+    parser.add_argument("--sequences", type=int, nargs="+", default=[10, 100, 100, 500])
+    parser.add_argument("--columns", type=int, nargs="+", default=[300, 300, 1500, 3000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    if len(args.sequences) != len(args.columns):
+        parser.error("--sequences and --columns need the same number of values")
+    run_benchmark(list(zip(args.sequences, args.columns)), repeat=args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,422 @@
+import os
+import sys
+import csv
+import json
+import time
+import shutil
+import argparse
+import platform
+import subprocess
+import numpy as np
+
+from benchmark_extract_mutations import AMINO_ACIDS, synthetic_alignment
+
+# End-to-end throughput benchmark on synthetic data, no blastp / mafft needed.
+#
+# "generate" writes a dataset at the requested scale (e.g. 5000 queries × 100 strains):
+#   reference.faa         query proteome (every 10th description says "plasmid")   stage 02 input, stage 04 queries
+#   all_genomes.faa       one ortholog per query and strain, ">GCA_... WP_..." headers (offset index prebuilt)
+#   blast_xml/<id>.xml    one BLAST XML per query: every strain's ortholog plus a few low-identity decoys
+#   msa/MSA_<id>.faa      one alignment per query (query + one row per strain); some queries fully conserved
+#   dataset.json          the generation parameters; an existing dataset with the same ones is reused
+#
+# "run" times each stage in its own Python process, calling the real stage functions:
+#   02            split_reference_proteins
+#   04            BLASTProcessor.process_all_xml_files (-> process_xml_file per query)
+#   06            extract_mutations
+#   06_positions  map_alignment_to_original_positions over every MSA query row
+#   10            build_summary_with_hit_defs on the stage 04 / 06 outputs of the same run
+# Wall time covers the stage call only (imports and input preloading excluded); peak RSS is the
+# stage process (or its largest worker). Results are appended to a JSON history (by default
+# <dataset>/benchmark_history.json, kept when the dataset is regenerated) and compared with the
+# last run on the same dataset and worker count, so slowdowns between versions stand out.
+
+STAGES = ["02", "04", "06", "06_positions", "10"]
+STAGE_PREREQUISITES = {"10": ["04", "06"]}
+HISTORY_FILE = "benchmark_history.json"
+REGRESSION_RATIO = 1.10  # flag stages at least 10% slower than the previous comparable run
+
+XML_HEADER = """<?xml version="1.0"?>
+<!DOCTYPE BlastOutput PUBLIC "-//NCBI//NCBI BlastOutput/EN" "http://www.ncbi.nlm.nih.gov/dtd/NCBI_BlastOutput.dtd">
+<BlastOutput>
+  <BlastOutput_program>blastp</BlastOutput_program>
+  <BlastOutput_version>BLASTP 2.12.0+</BlastOutput_version>
+  <BlastOutput_reference>synthetic</BlastOutput_reference>
+  <BlastOutput_db>all_genomes</BlastOutput_db>
+  <BlastOutput_query-ID>Query_1</BlastOutput_query-ID>
+  <BlastOutput_query-def>{query_def}</BlastOutput_query-def>
+  <BlastOutput_query-len>{query_len}</BlastOutput_query-len>
+  <BlastOutput_param>
+    <Parameters>
+      <Parameters_matrix>BLOSUM62</Parameters_matrix>
+      <Parameters_expect>10</Parameters_expect>
+      <Parameters_gap-open>11</Parameters_gap-open>
+      <Parameters_gap-extend>1</Parameters_gap-extend>
+      <Parameters_filter>F</Parameters_filter>
+    </Parameters>
+  </BlastOutput_param>
+<BlastOutput_iterations>
+<Iteration>
+  <Iteration_iter-num>1</Iteration_iter-num>
+  <Iteration_query-ID>Query_1</Iteration_query-ID>
+  <Iteration_query-def>{query_def}</Iteration_query-def>
+  <Iteration_query-len>{query_len}</Iteration_query-len>
+<Iteration_hits>
+"""
+
+XML_HIT = """<Hit>
+  <Hit_num>{num}</Hit_num>
+  <Hit_id>gnl|BL_ORD_ID|{num}</Hit_id>
+  <Hit_def>{hit_def}</Hit_def>
+  <Hit_accession>{num}</Hit_accession>
+  <Hit_len>{align_len}</Hit_len>
+  <Hit_hsps>
+<Hsp>
+  <Hsp_num>1</Hsp_num>
+  <Hsp_bit-score>{score}</Hsp_bit-score>
+  <Hsp_score>{score}</Hsp_score>
+  <Hsp_evalue>{evalue}</Hsp_evalue>
+  <Hsp_query-from>1</Hsp_query-from>
+  <Hsp_query-to>{align_len}</Hsp_query-to>
+  <Hsp_hit-from>1</Hsp_hit-from>
+  <Hsp_hit-to>{align_len}</Hsp_hit-to>
+  <Hsp_query-frame>0</Hsp_query-frame>
+  <Hsp_hit-frame>0</Hsp_hit-frame>
+  <Hsp_identity>{identities}</Hsp_identity>
+  <Hsp_positive>{identities}</Hsp_positive>
+  <Hsp_gaps>0</Hsp_gaps>
+  <Hsp_align-len>{align_len}</Hsp_align-len>
+  <Hsp_qseq>A</Hsp_qseq>
+  <Hsp_hseq>A</Hsp_hseq>
+  <Hsp_midline>A</Hsp_midline>
+</Hsp>
+  </Hit_hsps>
+</Hit>
+"""
+
+XML_FOOTER = """</Iteration_hits>
+</Iteration>
+</BlastOutput_iterations>
+</BlastOutput>
+"""
+
+
+def dataset_paths(dataset):
+    return {
+        "reference": os.path.join(dataset, "reference.faa"),
+        "genomes": os.path.join(dataset, "all_genomes.faa"),
+        "xml": os.path.join(dataset, "blast_xml"),
+        "msa": os.path.join(dataset, "msa"),
+        "meta": os.path.join(dataset, "dataset.json"),
+    }
+
+
+def write_wrapped(handle, header, sequence, line_length=60):
+    handle.write(f">{header}\n")
+    for i in range(0, len(sequence), line_length):
+        handle.write(sequence[i:i + line_length] + "\n")
+
+
+def generate_dataset(dataset, queries, strains, length=300, mutation_rate=0.01, conserved_fraction=0.2,
+                     decoys=3, seed=0):
+    params = {"queries": queries, "strains": strains, "length": length, "mutation_rate": mutation_rate,
+              "conserved_fraction": conserved_fraction, "decoys": decoys, "seed": seed}
+    paths = dataset_paths(dataset)
+    if os.path.exists(paths["meta"]):
+        with open(paths["meta"]) as f:
+            if json.load(f) == params:
+                print(f"Reusing synthetic dataset in {dataset}")
+                return params
+    # Regenerate from scratch, keeping only the benchmark history stored alongside
+    if os.path.isdir(dataset):
+        for name in os.listdir(dataset):
+            path = os.path.join(dataset, name)
+            if name == HISTORY_FILE:
+                continue
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+    os.makedirs(paths["xml"])
+    os.makedirs(paths["msa"])
+
+    rng = np.random.default_rng(seed)
+    strain_ids = [f"GCA_{900000000 + s:09d}.1" for s in range(strains)]
+    query_ids = [f"WP_{100000000 + q:09d}.1" for q in range(queries)]
+    lengths = rng.integers(int(length * 0.6), int(length * 1.4) + 1, queries)
+    conserved = rng.random(queries) < conserved_fraction
+
+    # === Step 1: Query proteome and per-strain orthologs ===
+    with open(paths["reference"], "w") as reference, open(paths["genomes"], "w") as genomes:
+        for q, (query_id, n) in enumerate(zip(query_ids, lengths)):
+            origin = "plasmid-encoded protein" if q % 10 == 0 else "chromosomal protein"
+            query_def = f"{query_id} synthetic {origin} {q} [Klebsiella pneumoniae]"
+            query = rng.choice(AMINO_ACIDS, n)
+            write_wrapped(reference, query_def, query.tobytes().decode())
+
+            orthologs = np.tile(query, (strains, 1))
+            if not conserved[q]:
+                substituted = rng.random(orthologs.shape) < mutation_rate
+                orthologs[substituted] = rng.choice(AMINO_ACIDS, substituted.sum())
+            identities = (orthologs == query).sum(axis=1)
+
+            # === Step 2: One BLAST XML per query, orthologs first, then low-identity decoys ===
+            hits = []
+            for s, strain_id in enumerate(strain_ids):
+                hit_def = f"{strain_id} {query_id[:-2]}_{s}.1 synthetic ortholog {q}"
+                write_wrapped(genomes, hit_def, orthologs[s].tobytes().decode())
+                hits.append((hit_def, int(identities[s]), int(n), "0.0"))
+            for d in range(min(decoys, strains)):
+                other = int(rng.integers(queries))
+                hits.append((f"{strain_ids[d]} {query_ids[other][:-2]}_{d}.1 synthetic ortholog {other}",
+                             int(n * 0.4), int(n * 0.5), "1e-03"))
+            with open(os.path.join(paths["xml"], f"{query_id}.xml"), "w") as xml:
+                xml.write(XML_HEADER.format(query_def=query_def, query_len=n))
+                for num, (hit_def, hit_identities, align_len, evalue) in enumerate(hits, 1):
+                    xml.write(XML_HIT.format(num=num, hit_def=hit_def, identities=hit_identities,
+                                             align_len=align_len, score=2 * hit_identities, evalue=evalue))
+                xml.write(XML_FOOTER)
+
+            # === Step 3: One alignment per query, as MAFFT would give for close orthologs ===
+            aligned = synthetic_alignment(strains + 1, int(n), mutation_rate=0 if conserved[q] else mutation_rate,
+                                          gap_rate=0 if conserved[q] else 0.005, seed=seed + q)
+            with open(os.path.join(paths["msa"], f"MSA_{query_id}.faa"), "w") as msa:
+                write_wrapped(msa, query_def, aligned[0])
+                for s, strain_id in enumerate(strain_ids):
+                    write_wrapped(msa, f"{strain_id} {query_id[:-2]}_{s}.1 synthetic ortholog {q}", aligned[s + 1])
+
+            if (q + 1) % 500 == 0:
+                print(f"  {q + 1}/{queries} queries generated")
+
+    # Built once here so stage 04 measures filtering, not the one-off index build
+    from fasta_index import FastaIndex
+    FastaIndex(paths["genomes"]).load_or_build()
+
+    with open(paths["meta"], "w") as f:
+        json.dump(params, f, indent=2)
+    print(f"Synthetic dataset written to {dataset}: {queries} queries × {strains} strains")
+    return params
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    import resource
+
+    scale = 1 if sys.platform == "darwin" else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    workers = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(own, workers) * scale / 1024 ** 2
+
+
+def count_csv_rows(path):
+    with open(path, newline="") as f:
+        return max(0, sum(1 for _ in csv.reader(f)) - 1)
+
+
+def run_stage(stage, dataset, workdir, workers=1):
+    # Runs inside the stage process; returns (seconds, records processed)
+    paths = dataset_paths(dataset)
+    filtered = os.path.join(workdir, "filtered_hits")
+    results = os.path.join(workdir, "mutation_results")
+
+    if stage == "02":
+        from extract_chromosomal_plasmid_faa_02 import split_reference_proteins
+
+        start = time.perf_counter()
+        total, _, _ = split_reference_proteins(paths["reference"], os.path.join(workdir, "plasmid_proteins.faa"),
+                                               os.path.join(workdir, "chromosomal_proteins.faa"))
+        return time.perf_counter() - start, total
+
+    if stage == "04":
+        from blast_hit_filtering_04 import BLASTProcessor
+
+        start = time.perf_counter()
+        BLASTProcessor(paths["xml"], paths["genomes"], filtered, paths["reference"]).process_all_xml_files(workers)
+        return time.perf_counter() - start, len(os.listdir(paths["xml"]))
+
+    if stage == "06":
+        from extract_mutations_06 import extract_mutations
+
+        start = time.perf_counter()
+        extract_mutations(paths["msa"], results, workers=workers)
+        return time.perf_counter() - start, len(os.listdir(paths["msa"]))
+
+    if stage == "06_positions":
+        from fasta_index import iter_fasta
+        from extract_mutations_06 import map_alignment_to_original_positions
+
+        query_rows = []
+        for name in sorted(os.listdir(paths["msa"])):
+            with open(os.path.join(paths["msa"], name)) as handle:
+                query_rows.append(next(iter_fasta(handle))[1])
+        start = time.perf_counter()
+        for query_row in query_rows:
+            map_alignment_to_original_positions(query_row)
+        return time.perf_counter() - start, len(query_rows)
+
+    if stage == "10":
+        from extract_mutation_summary_10 import build_summary_with_hit_defs
+
+        summary_csv = os.path.join(results, "mutation_summary.csv")
+        start = time.perf_counter()
+        build_summary_with_hit_defs(summary_csv, os.path.join(filtered, "filtered_hits_csv"), paths["reference"],
+                                    results)
+        return time.perf_counter() - start, count_csv_rows(summary_csv)
+
+    raise ValueError(f"Unknown stage: {stage}")
+
+
+def measure_stage(stage, dataset, workdir, workers=1):
+    # One fresh interpreter per stage, so memory and warm caches never leak from one stage to the next
+    command = [sys.executable, os.path.abspath(__file__), "stage", stage, dataset, workdir, "--workers", str(workers)]
+    start = time.perf_counter()
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    process_seconds = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(f"Stage {stage} failed ({result.returncode}):\n{result.stderr.strip()}")
+    measurement = json.loads(result.stdout.strip().splitlines()[-1])
+    measurement["process_s"] = round(process_seconds, 4)
+    return measurement
+
+
+def load_history(history_file):
+    if not os.path.exists(history_file):
+        return []
+    with open(history_file) as f:
+        return json.load(f)
+
+
+def save_history(history_file, history):
+    tmp_path = f"{history_file}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(history, f, indent=2)
+    os.replace(tmp_path, history_file)
+
+
+def git_revision():
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    except OSError:
+        return None
+    return result.stdout.strip() or None
+
+
+def previous_run(history, dataset_params, workers):
+    for entry in reversed(history):
+        if entry["dataset"] == dataset_params and entry["workers"] == workers:
+            return entry
+    return None
+
+
+def run_benchmark(dataset, dataset_params, stages, workers=1, repeat=1, history_file=HISTORY_FILE, label=None,
+                  keep=False):
+    selected = [stage for stage in STAGES if stage in stages]
+    needed = [stage for stage in STAGES
+              if stage in selected or any(stage in STAGE_PREREQUISITES.get(s, []) for s in selected)]
+
+    measurements = {}
+    for attempt in range(repeat):
+        workdir = os.path.join(dataset, "runs", f"{os.getpid()}_{attempt}")
+        shutil.rmtree(workdir, ignore_errors=True)
+        os.makedirs(workdir)
+        for stage in needed:
+            measurement = measure_stage(stage, dataset, workdir, workers)
+            if stage not in selected:
+                continue  # only run to feed a later stage
+            best = measurements.get(stage)
+            if best is None or measurement["wall_s"] < best["wall_s"]:
+                measurement["peak_rss_mb"] = max(measurement["peak_rss_mb"], best["peak_rss_mb"] if best else 0)
+                measurements[stage] = measurement
+            else:
+                best["peak_rss_mb"] = max(best["peak_rss_mb"], measurement["peak_rss_mb"])
+        if not keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    history = load_history(history_file)
+    previous = previous_run(history, dataset_params, workers)
+    entry = {
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "label": label,
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "workers": workers,
+        "repeat": repeat,
+        "dataset": dataset_params,
+        "stages": measurements,
+    }
+    history.append(entry)
+    save_history(history_file, history)
+
+    # Print summary
+    print(f"\n{'stage':<13} {'wall (s)':>9} {'peak RSS (MB)':>14} {'records':>8} {'records/s':>11}  vs previous")
+    for stage, m in measurements.items():
+        change = ""
+        if previous and stage in previous["stages"] and previous["stages"][stage]["wall_s"] > 0:
+            ratio = m["wall_s"] / previous["stages"][stage]["wall_s"]
+            change = f"{ratio:.2f}x" + ("  SLOWER" if ratio >= REGRESSION_RATIO else "")
+        print(f"{stage:<13} {m['wall_s']:>9.3f} {m['peak_rss_mb']:>14.1f} {m['records']:>8} "
+              f"{m['records_per_s']:>11.1f}  {change}")
+    if previous:
+        print(f"Compared with the run of {previous['date']} (revision {previous['revision']})")
+    print(f"Results appended to: {history_file}")
+    return entry
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time stages 02, 04, 06 and 10 on synthetic Klebsiella-scale data.",
+                                     fromfile_prefix_chars="@")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    def add_dataset_arguments(subparser):
+        subparser.add_argument("--dataset", default="benchmark_data", help="Folder for the synthetic dataset")
+        subparser.add_argument("--queries", type=int, default=500)
+        subparser.add_argument("--strains", type=int, default=100)
+        subparser.add_argument("--length", type=int, default=300, help="Mean protein length")
+        subparser.add_argument("--mutation-rate", type=float, default=0.01)
+        subparser.add_argument("--seed", type=int, default=0)
+
+    generate = subparsers.add_parser("generate", help="Only write the synthetic dataset")
+    add_dataset_arguments(generate)
+
+    run = subparsers.add_parser("run", help="Generate (or reuse) the dataset and time the stages")
+    add_dataset_arguments(run)
+    run.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES)
+    run.add_argument("--workers", type=int, default=1, help="Worker processes for stages 04 and 06")
+    run.add_argument("--repeat", type=int, default=1, help="Best wall time of this many runs")
+    run.add_argument("--history", help=f"JSON file the results are appended to (default: <dataset>/{HISTORY_FILE})")
+    run.add_argument("--label", help="Free text stored with the results, e.g. a branch name")
+    run.add_argument("--keep", action="store_true", help="Keep the stage outputs under <dataset>/runs")
+
+    stage = subparsers.add_parser("stage", help="Time one stage in this process (used by 'run')")
+    stage.add_argument("stage", choices=STAGES)
+    stage.add_argument("dataset")
+    stage.add_argument("workdir")
+    stage.add_argument("--workers", type=int, default=1)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "stage":
+        # Stage output is silenced; the last stdout line is the measurement read by measure_stage()
+        with open(os.devnull, "w") as devnull:
+            stdout, sys.stdout = sys.stdout, devnull
+            try:
+                seconds, records = run_stage(args.stage, os.path.abspath(args.dataset),
+                                             os.path.abspath(args.workdir), args.workers)
+            finally:
+                sys.stdout = stdout
+        print(json.dumps({"wall_s": round(seconds, 4), "peak_rss_mb": round(peak_rss_mb(), 1), "records": records,
+                          "records_per_s": round(records / seconds, 1) if seconds > 0 else 0.0}))
+        return
+
+    dataset = os.path.abspath(args.dataset)
+    dataset_params = generate_dataset(dataset, args.queries, args.strains, length=args.length,
+                                      mutation_rate=args.mutation_rate, seed=args.seed)
+    if args.command == "run":
+        run_benchmark(dataset, dataset_params, args.stages, workers=args.workers, repeat=args.repeat,
+                      history_file=args.history or os.path.join(dataset, HISTORY_FILE), label=args.label, keep=args.keep)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,73 +1,424 @@
 import os
 import csv
-from Bio import SeqIO
-from Bio.Blast import NCBIXML
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from fasta_index import FastaIndex, QueryIndex
+import telemetry
+
+# Hit acceptance thresholds
+MIN_IDENTITY = 0.90
+MIN_COVERAGE = 0.70
+MAX_EVALUE = 1e-5
+
+# Column layout expected for tabular BLAST output, e.g. blastp -outfmt "6 qseqid qlen stitle nident length evalue"
+# (outfmt 7 with the same columns also works, comment lines are skipped)
+TABULAR_FIELDS = ["qseqid", "qlen", "stitle", "nident", "length", "evalue"]
+TABULAR_OUTFMT = "6 " + " ".join(TABULAR_FIELDS)
+
+# Per-query hit CSVs ("<query>_hit_defs.csv") and the optional consolidated table keyed by Protein_Id
+HIT_DEF_CSV_HEADER = ["Hit_Def", "Identity", "Coverage", "E-value"]
+HIT_DEF_CSV_SUFFIX = "_hit_defs.csv"
+HIT_DEFS_TABLE_HEADER = ["Protein_Id"] + HIT_DEF_CSV_HEADER
+HIT_DEFS_TABLE_NAME = "hit_defs_table.csv"
+
+# Per-XML HSP cache: "<cache_dir>/<xml name>.<folder digest>.hsp.npz" holds the parsed HSP table with the
+# path, size and mtime of the XML it came from, so refiltering at other thresholds skips XML parsing;
+# stale entries are re-parsed. The folder digest keeps XMLs of the same name from different folders apart.
+HSP_CACHE_SUFFIX = ".hsp.npz"
+
+
+def new_hsp_table(query_def, query_length):
+    # One query's HSPs as parallel columns; hit_index points into hit_defs
+    return {
+        "query_def": query_def,
+        "query_length": query_length,
+        "hit_defs": [],
+        "hit_index": [],
+        "identities": [],
+        "align_length": [],
+        "evalue": [],
+    }
+
+
+def finish_hsp_table(table):
+    table["hit_index"] = np.asarray(table["hit_index"], dtype=np.int32)
+    table["identities"] = np.asarray(table["identities"], dtype=np.int32)
+    table["align_length"] = np.asarray(table["align_length"], dtype=np.int32)
+    table["evalue"] = np.asarray(table["evalue"], dtype=np.float64)
+    return table
+
+
+def hsp_table_from_record(blast_record):
+    table = new_hsp_table(blast_record.query, blast_record.query_length)
+    for i, hit in enumerate(blast_record.alignments):
+        table["hit_defs"].append(hit.hit_def)
+        for hsp in hit.hsps:
+            table["hit_index"].append(i)
+            table["identities"].append(hsp.identities)
+            table["align_length"].append(hsp.align_length)
+            table["evalue"].append(hsp.expect)
+    return finish_hsp_table(table)
+
+
+def iter_xml_hsp_tables(xml_path):
+    # Streams records one query at a time, so multi-query XML never sits in memory as a whole
+    from Bio.Blast import NCBIXML
+
+    with open(xml_path, "r") as file:
+        for blast_record in NCBIXML.parse(file):
+            yield hsp_table_from_record(blast_record)
+
+
+def iter_tabular_hsp_tables(tabular_path):
+    # BLAST writes tabular rows grouped by query, so a query is complete once the next one starts
+    table = None
+    hit_positions = {}
+    with open(tabular_path, "r") as file:
+        for line in file:
+            if not line.strip() or line.startswith("#"):
+                continue
+            qseqid, qlen, stitle, nident, length, evalue = line.rstrip("\n").split("\t")
+            if table is None or table["query_def"] != qseqid:
+                if table is not None:
+                    yield finish_hsp_table(table)
+                table = new_hsp_table(qseqid, int(qlen))
+                hit_positions = {}
+            if stitle not in hit_positions:
+                hit_positions[stitle] = len(table["hit_defs"])
+                table["hit_defs"].append(stitle)
+            table["hit_index"].append(hit_positions[stitle])
+            table["identities"].append(int(nident))
+            table["align_length"].append(int(length))
+            table["evalue"].append(float(evalue))
+    if table is not None:
+        yield finish_hsp_table(table)
+
+
+def xml_stamp(xml_path):
+    stat = os.stat(xml_path)
+    return np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+
+
+def hsp_cache_path(cache_dir, xml_path):
+    folder_digest = hashlib.blake2b(os.path.dirname(os.path.abspath(xml_path)).encode(), digest_size=6).hexdigest()
+    return os.path.join(cache_dir, f"{os.path.basename(xml_path)}.{folder_digest}{HSP_CACHE_SUFFIX}")
+
+
+def save_hsp_table(path, table, stamp, source):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as handle:
+        np.savez_compressed(
+            handle,
+            source=np.array(os.path.abspath(source)),
+            stamp=stamp,
+            query_def=np.array(table["query_def"]),
+            query_length=np.array(table["query_length"], dtype=np.int64),
+            hit_defs=np.array(table["hit_defs"], dtype=str),
+            hit_index=table["hit_index"],
+            identities=table["identities"],
+            align_length=table["align_length"],
+            evalue=table["evalue"],
+        )
+    os.replace(tmp_path, path)
+
+
+def load_hsp_table(path, stamp=None):
+    # None when the entry is missing, or stale for the given XML stamp
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        if stamp is not None and not np.array_equal(data["stamp"], stamp):
+            return None
+        return {
+            "query_def": str(data["query_def"]),
+            "query_length": int(data["query_length"]),
+            "hit_defs": data["hit_defs"].tolist(),
+            "hit_index": data["hit_index"],
+            "identities": data["identities"],
+            "align_length": data["align_length"],
+            "evalue": data["evalue"],
+        }
+
+
+def read_xml_hsp_table(xml_path, cache_dir=None):
+    # HSP table of a single-query XML, through the cache when one is given
+    from Bio.Blast import NCBIXML
+
+    if cache_dir is not None:
+        stamp = xml_stamp(xml_path)
+        cache_path = hsp_cache_path(cache_dir, xml_path)
+        table = load_hsp_table(cache_path, stamp)
+        if table is not None:
+            return table
+
+    with open(xml_path, "r") as file:
+        table = hsp_table_from_record(NCBIXML.read(file))
+    if cache_dir is not None:
+        save_hsp_table(cache_path, table, stamp, xml_path)
+    return table
+
+
+def _cache_xml_worker(args):
+    read_xml_hsp_table(*args)
+
+
+def cache_hsp_tables(xml_folder, cache_dir, workers=1):
+    # Parse every XML of a folder into the cache (entries still current are left alone)
+    os.makedirs(cache_dir, exist_ok=True)
+    jobs = [(os.path.join(xml_folder, f), cache_dir) for f in sorted(os.listdir(xml_folder)) if f.endswith(".xml")]
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(_cache_xml_worker, jobs, chunksize=max(1, len(jobs) // (workers * 8))))
+    else:
+        for job in jobs:
+            _cache_xml_worker(job)
+    return len(jobs)
+
+
+def cached_source(path):
+    # Absolute path of the XML a cache entry was parsed from (None for entries without one)
+    with np.load(path) as data:
+        return str(data["source"]) if "source" in data.files else None
+
+
+def load_hsp_columns(cache_dir, xml_folder=None):
+    # Every current cached table as flat per-HSP columns; "pair" numbers the (query, hit) pairs across all
+    # tables. Entries whose XML is gone or changed since it was parsed, or (with xml_folder) lies in another
+    # folder, are left out and counted in "skipped_entries".
+    columns = {name: [] for name in ("query", "pair", "identities", "align_length", "query_length", "evalue")}
+    query_defs = []
+    n_pairs = 0
+    skipped = 0
+    folder = os.path.abspath(xml_folder) if xml_folder else None
+    for name in sorted(os.listdir(cache_dir)):
+        if not name.endswith(HSP_CACHE_SUFFIX):
+            continue
+        path = os.path.join(cache_dir, name)
+        source = cached_source(path)
+        table = None
+        if source and os.path.exists(source) and (folder is None or os.path.dirname(source) == folder):
+            table = load_hsp_table(path, xml_stamp(source))
+        if table is None:
+            skipped += 1
+            continue
+        n = len(table["hit_index"])
+        columns["query"].append(np.full(n, len(query_defs), dtype=np.int32))
+        columns["pair"].append(table["hit_index"].astype(np.int64) + n_pairs)
+        columns["identities"].append(table["identities"])
+        columns["align_length"].append(table["align_length"])
+        columns["query_length"].append(np.full(n, table["query_length"], dtype=np.int32))
+        columns["evalue"].append(table["evalue"])
+        query_defs.append(table["query_def"])
+        n_pairs += len(table["hit_defs"])
+
+    columns = {name: np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64) for name, parts in columns.items()}
+    columns["pair_query"] = np.zeros(n_pairs, dtype=np.int64)
+    columns["pair_query"][columns["pair"]] = columns["query"]
+    columns["query_defs"] = query_defs
+    columns["skipped_entries"] = skipped
+    return columns
+
+
+def sweep_thresholds(columns, min_identities, min_coverages, max_evalues):
+    # Accepted hits and queries with at least one hit for every threshold combination.
+    # Same rule as filter_hsps: a hit counts when any one of its HSPs passes all three thresholds.
+    identity = columns["identities"] / columns["align_length"]
+    coverage = columns["align_length"] / columns["query_length"]
+    pairs = columns["pair"]
+    n_pairs = len(columns["pair_query"])
+    n_queries = len(columns["query_defs"])
+
+    rows = []
+    for min_identity in min_identities:
+        identity_passed = identity >= min_identity
+        for min_coverage in min_coverages:
+            passed_so_far = identity_passed & (coverage >= min_coverage)
+            for max_evalue in max_evalues:
+                passed = passed_so_far & (columns["evalue"] < max_evalue)
+                accepted = np.zeros(n_pairs, dtype=bool)
+                accepted[pairs[passed]] = True
+                hits_per_query = np.bincount(columns["pair_query"][accepted], minlength=n_queries)
+                rows.append([min_identity, min_coverage, max_evalue, int(accepted.sum()),
+                             int((hits_per_query > 0).sum())])
+    return rows
+
+
+def iter_hsp_tables(blast_file, fmt="xml"):
+    if fmt == "xml":
+        return iter_xml_hsp_tables(blast_file)
+    if fmt == "tabular":
+        return iter_tabular_hsp_tables(blast_file)
+    raise ValueError(f"Unknown BLAST output format: {fmt} (expected 'xml' or 'tabular')")
+
+
+def filter_hsps(table, min_identity=MIN_IDENTITY, min_coverage=MIN_COVERAGE, max_evalue=MAX_EVALUE):
+    # Thresholds are applied to all HSPs at once; a hit is accepted through its first passing HSP
+    identity = table["identities"] / table["align_length"]
+    coverage = table["align_length"] / table["query_length"]
+    passed = np.flatnonzero((identity >= min_identity) & (coverage >= min_coverage) & (table["evalue"] < max_evalue))
+
+    _, first = np.unique(table["hit_index"][passed], return_index=True)
+    accepted = passed[first]
+
+    return [
+        (table["hit_defs"][table["hit_index"][i]], float(identity[i]), float(coverage[i]), float(table["evalue"][i]))
+        for i in accepted
+    ]
+
+
+# === Process pool workers: each worker builds its own processor (and mmap) once ===
+_worker_processor = None
+
+
+def _init_worker(processor_args, processor_options, query_index):
+    global _worker_processor
+    _worker_processor = BLASTProcessor(*processor_args, query_index=query_index, **processor_options)
+    _worker_processor.genome_index.open()
+
+
+def _process_xml_file_worker(xml_file):
+    _worker_processor.process_xml_file(xml_file)
+    return xml_file
+
+
+# Used by job_scheduler.py pools shared between replicons: one processor per set of folders, per process
+_worker_processors = {}
+
+
+def filter_xml_file(processor_args, processor_options, xml_file):
+    key = (processor_args, tuple(sorted(processor_options.items())))
+    processor = _worker_processors.get(key)
+    if processor is None:
+        processor = _worker_processors[key] = BLASTProcessor(*processor_args, **processor_options)
+        processor.genome_index.open()
+    processor.process_xml_file(xml_file)
+    return xml_file
+
+
+def _process_hsp_table_worker(table):
+    with telemetry.span("04", "process_hsp_table", item=table["query_def"]) as record:
+        record["writes"] = _worker_processor.process_hsp_table(table)
+    return table["query_def"]
+
 
 class BLASTProcessor:
-    def __init__(self, xml_folder, fasta_file, output_folder, query_fasta):
+    def __init__(self, xml_folder, fasta_file, output_folder, query_fasta, query_index=None,
+                 min_identity=MIN_IDENTITY, min_coverage=MIN_COVERAGE, max_evalue=MAX_EVALUE, hsp_cache_dir=None):
         self.xml_folder = xml_folder  # Folder containing BLAST XML files
         self.fasta_file = fasta_file  # Combined FASTA of all genome proteins
         self.output_folder = output_folder  # Output folder for results
         self.query_fasta = query_fasta  # FASTA file with query proteins
         self.csv_output_folder = os.path.join(self.output_folder, "filtered_hits_csv")
+        self.genome_index = FastaIndex(self.fasta_file)  # header -> byte span index, reused across runs
+        self.query_index = query_index if query_index is not None else QueryIndex(self.query_fasta)  # shared with workers
+        self.min_identity = min_identity  # hit acceptance thresholds
+        self.min_coverage = min_coverage
+        self.max_evalue = max_evalue
+        self.hsp_cache_dir = hsp_cache_dir  # per-XML HSP cache folder (disabled when None)
 
         os.makedirs(self.output_folder, exist_ok=True)
         os.makedirs(self.csv_output_folder, exist_ok=True)
+        if self.hsp_cache_dir is not None:
+            os.makedirs(self.hsp_cache_dir, exist_ok=True)
+
+    def _processor_args(self):
+        return (self.xml_folder, self.fasta_file, self.output_folder, self.query_fasta)
+
+    def _processor_options(self):
+        return {"min_identity": self.min_identity, "min_coverage": self.min_coverage, "max_evalue": self.max_evalue,
+                "hsp_cache_dir": self.hsp_cache_dir}
 
-    def process_all_xml_files(self):
+    def process_all_xml_files(self, workers=1):
         xml_files = [f for f in os.listdir(self.xml_folder) if f.endswith(".xml")]
         if not xml_files:
             print("No XML files found.")
             return
 
-        for i, xml_file in enumerate(xml_files, 1):
-            print(f"\n => Processing file {i}/{len(xml_files)}: {xml_file}")
-            self.process_xml_file(xml_file)
+        if workers > 1:
+            # Build/refresh the index once here so workers only load it
+            self.genome_index.load_or_build()
+            initargs = (self._processor_args(), self._processor_options(), self.query_index)
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=initargs) as executor:
+                futures = [executor.submit(_process_xml_file_worker, f) for f in xml_files]
+                for i, future in enumerate(as_completed(futures), 1):
+                    print(f"\n => Processed file {i}/{len(xml_files)}: {future.result()}")
+                    telemetry.queue_depth("04", "xml_files", len(xml_files) - i)
+        else:
+            with self.genome_index:
+                for i, xml_file in enumerate(xml_files, 1):
+                    print(f"\n => Processing file {i}/{len(xml_files)}: {xml_file}")
+                    self.process_xml_file(xml_file)
 
         print("\n All BLAST XML files processed. Filtered outputs saved to:", self.output_folder)
 
+    def process_blast_output(self, blast_file, fmt="xml", workers=1):
+        # One large multi-query BLAST output (XML or tabular); outputs are named after each query id
+        tables = iter_hsp_tables(blast_file, fmt)
+        processed = 0
+
+        if workers > 1:
+            self.genome_index.load_or_build()
+            max_pending = workers * 4  # keep only a few parsed queries in flight
+            initargs = (self._processor_args(), self._processor_options(), self.query_index)
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=initargs) as executor:
+                pending = set()
+                for table in tables:
+                    pending.add(executor.submit(_process_hsp_table_worker, table))
+                    if len(pending) >= max_pending:
+                        done = next(as_completed(pending))
+                        pending.remove(done)
+                        done.result()
+                        processed += 1
+                    telemetry.queue_depth("04", "queries", len(pending))
+                for i, future in enumerate(as_completed(pending), 1):
+                    future.result()
+                    processed += 1
+                    telemetry.queue_depth("04", "queries", len(pending) - i)
+        else:
+            with self.genome_index:
+                for table in tables:
+                    with telemetry.span("04", "process_hsp_table", item=table["query_def"]) as record:
+                        record["writes"] = self.process_hsp_table(table)
+                    processed += 1
+
+        print(f"\n {processed} queries processed from {blast_file}. Filtered outputs saved to:", self.output_folder)
+
     def process_xml_file(self, xml_file):
         xml_path = os.path.join(self.xml_folder, xml_file)
-        with open(xml_path, "r") as file:
-            blast_record = NCBIXML.read(file)
+        with telemetry.span("04", "process_xml_file", item=xml_file, reads=[xml_path]) as record:
+            table = read_xml_hsp_table(xml_path, self.hsp_cache_dir)
+            record["writes"] = self.process_hsp_table(table, os.path.splitext(xml_file)[0])
 
-        query_def = blast_record.query
+    def process_hsp_table(self, table, csv_base_name=None):
+        # Returns the files written: the hit FASTA (when the query is known) and the hit CSV
+        query_def = table["query_def"]
         print(f"Query definition: {query_def}")  # Debug line to see the query_def
-        query_length = blast_record.query_length
-        hit_details = []
 
-        for hit in blast_record.alignments:
-            for hsp in hit.hsps:
-                identity = hsp.identities / hsp.align_length
-                coverage = hsp.align_length / query_length
-                evalue = hsp.expect
+        with telemetry.profiled("04", "process_hsp_table"):
+            hit_details = filter_hsps(table, self.min_identity, self.min_coverage, self.max_evalue)
+            hit_def_list = set(hit[0] for hit in hit_details)
+            query_id = self.extract_sequences(query_def, hit_def_list)
 
-                if identity >= 0.90 and coverage >= 0.70 and evalue < 1e-5:
-                    hit_details.append((hit.hit_def, identity, coverage, evalue))
-                    break  # Accept hit if one HSP satisfies the condition
+            if csv_base_name is None:
+                csv_base_name = query_id or query_def.split()[0]
+            csv_file = self.write_hit_defs_to_csv(hit_details, csv_base_name)
 
-        hit_def_list = set(hit[0] for hit in hit_details)
-        self.extract_sequences(query_def, hit_def_list, xml_file)
-        self.write_hit_defs_to_csv(hit_details, xml_file)
+        written = [csv_file]
+        if query_id:
+            written.insert(0, os.path.join(self.output_folder, f"filtered_hits_{query_id}.faa"))
+        return written
 
-    def extract_sequences(self, query_def, hit_def_list, xml_file):
+    def extract_sequences(self, query_def, hit_def_list):
         def write_wrapped_sequence(handle, header, sequence, line_length=60):
             handle.write(f">{header}\n")
             for i in range(0, len(sequence), line_length):
                 handle.write(sequence[i:i+line_length] + "\n")
-        query_id = None
-        query_sequence = None
-
-        with open(self.query_fasta, "r") as query_file:
-            for record in SeqIO.parse(query_file, "fasta"):
-                if query_def and query_def in record.description:
-                    query_id = record.id
-                    query_sequence = str(record.seq)
-                    break
+        query_id, query_sequence = self.query_index.lookup(query_def)
 
         if not query_id:
             print(f"Query sequence not found for {query_def}")
-            return
+            return None
 
         output_file = os.path.join(self.output_folder, f"filtered_hits_{query_id}.faa")
 
@@ -75,33 +426,88 @@ class BLASTProcessor:
             # Write query sequence first with wrapped format
             write_wrapped_sequence(outfile, query_def, query_sequence)
 
-            # Extract matching sequences from all_genomes.fasta
-            with open(self.fasta_file, "r") as infile:
-                write_seq = False
-                for line in infile:
-                    if line.startswith(">"):
-                        header = line.strip()[1:]
-                        write_seq = any(hit_def == header for hit_def in hit_def_list)
-                    if write_seq:
-                        outfile.write(line)
-
-    def write_hit_defs_to_csv(self, hit_details, xml_file):
-        base_name = os.path.splitext(xml_file)[0]
+            # Copy matching records from all_genomes.fasta via the offset index
+            self.genome_index.write_records(outfile, hit_def_list)
+
+        return query_id
+
+    def write_hit_defs_to_csv(self, hit_details, base_name):
         csv_file = os.path.join(self.csv_output_folder, f"{base_name}_hit_defs.csv")
         with open(csv_file, "w", newline="") as f:
             writer = csv.writer(f)
-            writer.writerow(["Hit_Def", "Identity", "Coverage", "E-value"])
+            writer.writerow(HIT_DEF_CSV_HEADER)
             for hit_def, identity, coverage, evalue in sorted(hit_details):
                 writer.writerow([hit_def, f"{identity:.4f}", f"{coverage:.4f}", f"{evalue:.2e}"])
+        return csv_file
+
+
+def iter_hit_def_rows(csv_folder):
+    # One directory scan over all per-query CSVs; yields [protein_id, hit_def, identity, coverage, evalue]
+    with os.scandir(csv_folder) as entries:
+        names = sorted(entry.name for entry in entries if entry.name.endswith(HIT_DEF_CSV_SUFFIX))
+    for name in names:
+        protein_id = name[:-len(HIT_DEF_CSV_SUFFIX)]
+        with open(os.path.join(csv_folder, name), newline="") as f:
+            reader = csv.reader(f)
+            next(reader, None)  # skip header
+            for row in reader:
+                yield [protein_id] + row
+
+
+def consolidate_hit_defs(csv_folder, output_csv=None):
+    # Merge every per-query hit CSV into one table keyed by Protein_Id (next to the folder by default)
+    if output_csv is None:
+        output_csv = os.path.join(os.path.dirname(os.path.abspath(csv_folder)), HIT_DEFS_TABLE_NAME)
+    tmp_path = f"{output_csv}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(HIT_DEFS_TABLE_HEADER)
+        writer.writerows(iter_hit_def_rows(csv_folder))
+    os.replace(tmp_path, output_csv)
+    return output_csv
+
 
-xml_folder = input("Enter the path to the folder containing BLAST XML files: ").strip()
-fasta_file = input("Enter the path to the combined genome proteins FASTA file: ").strip()
-output_folder = input("Enter the path where you want to save the output files: ").strip()
-query_fasta = input("Enter the path to the query FASTA file: ").strip()
+def main(argv=None):
+    import argparse
 
-# Run the processor
-processor = BLASTProcessor(xml_folder, fasta_file, output_folder, query_fasta)
-processor.process_all_xml_files()
+    parser = argparse.ArgumentParser(description="Filter BLAST hits and extract the hit sequences of every query.",
+                                     fromfile_prefix_chars="@")
+    parser.add_argument("blast_input", help="Folder of BLAST XML files, or one multi-query BLAST output file")
+    parser.add_argument("fasta_file", help="Combined genome proteins FASTA file")
+    parser.add_argument("output_folder", help="Where to save the output files")
+    parser.add_argument("query_fasta", help="Query FASTA file")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes")
+    parser.add_argument("--format", choices=["xml", "tabular"],
+                        help="Format of a single BLAST output file (default: from the file extension)")
+    parser.add_argument("--consolidate", action="store_true", help="Also write all hit definitions into one table")
+    parser.add_argument("--min-identity", type=float, default=MIN_IDENTITY)
+    parser.add_argument("--min-coverage", type=float, default=MIN_COVERAGE)
+    parser.add_argument("--max-evalue", type=float, default=MAX_EVALUE)
+    parser.add_argument("--hsp-cache", help="Per-XML HSP cache folder; refiltering reads it instead of the XML")
+    telemetry.add_trace_arguments(parser)
+    args = parser.parse_args(argv)
+
+    telemetry.start_trace(args)
+
+    # Run the processor
+    options = {"min_identity": args.min_identity, "min_coverage": args.min_coverage, "max_evalue": args.max_evalue,
+               "hsp_cache_dir": args.hsp_cache}
+    if os.path.isdir(args.blast_input):
+        processor = BLASTProcessor(args.blast_input, args.fasta_file, args.output_folder, args.query_fasta, **options)
+        processor.process_all_xml_files(workers=args.workers)
+    else:
+        fmt = args.format or ("xml" if args.blast_input.endswith(".xml") else "tabular")
+        processor = BLASTProcessor(os.path.dirname(args.blast_input), args.fasta_file, args.output_folder,
+                                   args.query_fasta, **options)
+        processor.process_blast_output(args.blast_input, fmt=fmt, workers=args.workers)
+
+    if args.consolidate:
+        print("Hit definition table saved to:", consolidate_hit_defs(processor.csv_output_folder))
+    telemetry.finish_trace(args)
+
+
+if __name__ == "__main__":
+    main()
 
 """
 EXPLANATION:
@@ -110,23 +516,47 @@ EXPLANATION:
    - Takes paths for BLAST XMLs, combined FASTA of proteins, query FASTA, and output folder.
 
 2. **process_all_xml_files**:
-   - Iterates over all XML files and processes each one.
-
-3. **process_xml_file**:
-   - Parses each BLAST XML result file.
-   - Checks each HSP per hit for:
-     - Identity ≥ 90%
-     - Query coverage ≥ 70%
-     - E-value < 1e-5
+   - Iterates over all XML files (one query each) and processes each one.
+   - With workers > 1 the files are spread over a process pool.
+
+3. **process_blast_output**:
+   - Streams one large multi-query BLAST output instead of thousands of small files:
+     XML through NCBIXML.parse, or tabular output (-outfmt 6/7) with the TABULAR_FIELDS columns.
+   - Each query's HSPs are handed to a process pool worker with workers > 1.
+   - Output files are named after the query id.
+
+4. **process_xml_file / process_hsp_table**:
+   - Parses each BLAST XML result file into an HSP table (one row per HSP).
+   - Checks all HSPs at once (NumPy) against the processor's thresholds (defaults):
+     - Identity ≥ 90% (min_identity)
+     - Query coverage ≥ 70% (min_coverage)
+     - E-value < 1e-5 (max_evalue)
+   - Accepts a hit through its first HSP that satisfies the condition.
    - Adds accepted hit info as a tuple: (hit_def, identity, coverage, evalue).
    - Then extracts sequences and writes hit info to CSV.
 
-4. **extract_sequences**:
-   - Uses query_def to find and write the query sequence.
-   - Then parses the all-genomes FASTA file line by line.
-   - Writes sequences where the header exactly matches one in the hit_def list.
+5. **extract_sequences**:
+   - Uses query_def to find and write the query sequence. The query FASTA is loaded once
+     into a QueryIndex (id / description lookup tables) when the processor is created,
+     with a memoized substring search as fallback.
+   - Looks up each hit_def in the all-genomes FASTA index (fasta_index.py).
+     The index (header -> byte offset/length) is built once into "<fasta>.idx"
+     and reused across runs until the FASTA changes.
+   - Copies the matching records straight out of the memory-mapped FASTA,
+     in file order, so the output is the same as a full line-by-line scan.
 
-5. **write_hit_defs_to_csv**:
+6. **write_hit_defs_to_csv**:
    - Saves the list of accepted hit definitions and associated identity, coverage, and e-value into a CSV file.
-   - The CSV filename corresponds to the XML filename used.
-"""
\ No newline at end of file
+   - The CSV filename corresponds to the XML filename used (or the query id for multi-query outputs).
+
+7. **consolidate_hit_defs** (optional):
+   - Scans filtered_hits_csv once and writes every hit row into one table keyed by Protein_Id
+     (hit_defs_table.csv next to the folder), so stage 10 can join it without opening one file per protein.
+
+8. **HSP cache** (optional, hsp_cache_dir / --hsp-cache):
+   - The first parse of each XML stores its HSP table (hit defs, identities, alignment lengths, query length,
+     e-values) as "<xml name>.<folder digest>.hsp.npz", stamped with the XML's path, size and mtime.
+   - Refiltering at other thresholds loads these instead of parsing the XML again.
+   - sweep_thresholds() scans all cached HSPs at once for a grid of thresholds (see sweep_hit_thresholds.py);
+     entries whose XML is missing or changed are not counted.
+"""
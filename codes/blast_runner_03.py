@@ -1,38 +1,52 @@
 import os
-from Bio import SeqIO
+import re
+import time
+import heapq
 import subprocess
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-# ---- User Inputs ----
-protein_type = input("Which proteins do you want to BLAST? (plasmid/chromosomal): ").strip().lower()
+import telemetry
 
-# Validate input
-while protein_type not in ["plasmid", "chromosomal"]:
-    protein_type = input("Please enter 'plasmid' or 'chromosomal': ").strip().lower()
+ITERATION_QUERY_FIELD = re.compile(r"<Iteration_(query-ID|query-def|query-len)>(.*)</Iteration_\1>")
 
-query_fasta = input(f"Enter your {protein_type} protein FASTA file: ").strip()
-blast_db = input("Enter BLAST database path: ").strip()
-output_dir = input(f"Enter output directory for {protein_type} XML results: ").strip()
-threads = int(input("Enter number of threads to use (e.g. 12): ").strip())
+BLAST_RETRIES = 2  # extra attempts after a non-zero blastp exit
+RETRY_DELAY = 2.0  # seconds, times the attempt number
 
-# ---- Setup Output Folder ----
-os.makedirs(output_dir, exist_ok=True)
-temp_fasta_dir = os.path.join(output_dir, f"temp_fastas_{protein_type}")
-os.makedirs(temp_fasta_dir, exist_ok=True)
 
 # ---- Prepare Individual FASTA Files ----
-print(f"\nSplitting {protein_type} protein sequences into individual FASTA files...")
-fasta_paths = []
+def split_query_fasta(query_fasta, temp_fasta_dir):
+    from Bio import SeqIO
 
-for record in SeqIO.parse(query_fasta, "fasta"):
-    fasta_path = os.path.join(temp_fasta_dir, f"{record.id}.fasta")
-    SeqIO.write(record, fasta_path, "fasta")
-    fasta_paths.append(fasta_path)
+    os.makedirs(temp_fasta_dir, exist_ok=True)
+    fasta_paths = []
+
+    for record in SeqIO.parse(query_fasta, "fasta"):
+        fasta_path = os.path.join(temp_fasta_dir, f"{record.id}.fasta")
+        SeqIO.write(record, fasta_path, "fasta")
+        fasta_paths.append(fasta_path)
+
+    return fasta_paths
+
+
+# ---- blastp with retries: a failed attempt's partial output is removed and stderr is kept ----
+def run_blastp(cmd, output_path, item, retries=BLAST_RETRIES):
+    # Returns (last CompletedProcess with stderr as text, attempts); returncode != 0 when every attempt failed
+    for attempt in range(1, retries + 2):
+        if attempt > 1:
+            time.sleep(RETRY_DELAY * (attempt - 1))
+        result = telemetry.run_subprocess(cmd, "03", item=item, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        if result.returncode == 0:
+            return result, attempt
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        error = result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "no stderr"
+        print(f"blastp failed for {item} (attempt {attempt}, exit code {result.returncode}): {error}")
+    return result, attempt
 
-print(f"Total sequences to BLAST: {len(fasta_paths)}")
 
 # ---- BLAST Function ----
-def run_blast(fasta_file):
+def run_blast(fasta_file, blast_db, output_dir, retries=BLAST_RETRIES):
+    # Raises RuntimeError with blastp's stderr when every attempt fails
     base_name = os.path.splitext(os.path.basename(fasta_file))[0]
     xml_output = os.path.join(output_dir, f"{base_name}.xml")
 
@@ -43,12 +57,201 @@ def run_blast(fasta_file):
         "-out", xml_output,
         "-outfmt", "5"
     ]
-    subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    result, _ = run_blastp(cmd, xml_output, base_name, retries)
+    if result.returncode != 0:
+        raise RuntimeError(f"blastp failed for {base_name} with exit code {result.returncode}:\n{result.stderr}")
+    return xml_output
+
+
+def run_blast_per_query(query_fasta, blast_db, output_dir, threads, protein_type):
+    # One blastp process per protein (original mode)
+    os.makedirs(output_dir, exist_ok=True)
+    temp_fasta_dir = os.path.join(output_dir, f"temp_fastas_{protein_type}")
+
+    print(f"\nSplitting {protein_type} protein sequences into individual FASTA files...")
+    fasta_paths = split_query_fasta(query_fasta, temp_fasta_dir)
+    print(f"Total sequences to BLAST: {len(fasta_paths)}")
+
+    print(f"\nRunning BLASTP on {len(fasta_paths)} {protein_type} proteins using {threads} threads...\n")
+    failed = []
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        futures = {executor.submit(run_blast, fasta_file, blast_db, output_dir): fasta_file
+                   for fasta_file in fasta_paths}
+        for i, future in enumerate(as_completed(futures), 1):
+            try:
+                future.result()
+            except RuntimeError as e:  # one failed query must not stop the others
+                failed.append(futures[future])
+                print(e)
+            telemetry.queue_depth("03", "blastp", len(futures) - i)
+
+    if failed:
+        print(f"\n{len(failed)} of {len(fasta_paths)} queries failed after retries: "
+              f"{', '.join(os.path.basename(path) for path in failed)}")
+    return failed
+
+
+# ---- Batched Mode ----
+def make_balanced_batches(records, n_batches):
+    # Longest-first greedy assignment: each protein goes to the batch with the fewest residues so far
+    n_batches = max(1, min(n_batches, len(records)))
+    heap = [(0, i) for i in range(n_batches)]
+    batches = [[] for _ in range(n_batches)]
+
+    for record in sorted(records, key=lambda r: len(r.seq), reverse=True):
+        residues, i = heapq.heappop(heap)
+        batches[i].append(record)
+        heapq.heappush(heap, (residues + len(record.seq), i))
+
+    return [batch for batch in batches if batch]
+
+
+def run_blast_batch(batch_fasta, blast_db, batch_xml, num_threads, retries=BLAST_RETRIES):
+    # Same retries as the per-query mode; returns (CompletedProcess, attempts)
+    cmd = [
+        "blastp",
+        "-query", batch_fasta,
+        "-db", blast_db,
+        "-out", batch_xml,
+        "-outfmt", "5",
+        "-num_threads", str(num_threads)
+    ]
+    return run_blastp(cmd, batch_xml, os.path.basename(batch_fasta), retries)
+
+
+def demultiplex_blast_xml(batch_xml, query_ids, output_dir):
+    # Split a multi-query XML (one <Iteration> per query, in query order) into {query_id}.xml files.
+    # Each file gets the shared header with the BlastOutput_query-* fields of its own query,
+    # so it reads like the output of a single-query blastp run.
+    header_lines = []
+    iteration_lines = None
+    written = []
+
+    with open(batch_xml, "r") as handle:
+        for line in handle:
+            stripped = line.strip()
+            if iteration_lines is None:
+                if stripped == "<Iteration>":
+                    iteration_lines = [line]
+                elif not written:
+                    header_lines.append(line)
+                continue
+
+            iteration_lines.append(line)
+            if stripped == "</Iteration>":
+                if len(written) == len(query_ids):
+                    raise ValueError(f"{batch_xml} has more iterations than the {len(query_ids)} batch queries")
+                query_id = query_ids[len(written)]
+                header = "".join(header_lines)
+                for iteration_line in iteration_lines:
+                    match = ITERATION_QUERY_FIELD.match(iteration_line.strip())
+                    if match:
+                        field, value = match.groups()
+                        header = re.sub(
+                            rf"<BlastOutput_{field}>.*?</BlastOutput_{field}>",
+                            lambda _: f"<BlastOutput_{field}>{value}</BlastOutput_{field}>",
+                            header, count=1
+                        )
+                with open(os.path.join(output_dir, f"{query_id}.xml"), "w") as out:
+                    out.write(header)
+                    out.writelines(iteration_lines)
+                    out.write("</BlastOutput_iterations>\n</BlastOutput>\n")
+                written.append(query_id)
+                iteration_lines = None
+
+    if len(written) != len(query_ids):
+        raise ValueError(f"{batch_xml} has {len(written)} iterations for {len(query_ids)} batch queries")
+    return written
+
+
+def run_blast_batched(query_fasta, blast_db, output_dir, threads, n_batches, protein_type, demultiplex=True):
+    # Few blastp processes over length-balanced multi-query batches, so the database is loaded once per batch.
+    # With demultiplex=True the per-query {query_id}.xml layout expected by stage 04 is written as well;
+    # otherwise the batch XML files can be filtered directly with BLASTProcessor.process_blast_output.
+    from Bio import SeqIO
+
+    os.makedirs(output_dir, exist_ok=True)
+    batch_dir = os.path.join(output_dir, f"temp_batches_{protein_type}")
+    os.makedirs(batch_dir, exist_ok=True)
+
+    records = list(SeqIO.parse(query_fasta, "fasta"))
+    batches = make_balanced_batches(records, n_batches)
+    concurrent_batches = max(1, min(len(batches), threads))
+    threads_per_batch = max(1, threads // len(batches)) if batches else 1
+
+    print(f"Total sequences to BLAST: {len(records)} in {len(batches)} batches "
+          f"({concurrent_batches} at a time, {threads_per_batch} threads each)")
+
+    def run_one(i, batch):
+        batch_fasta = os.path.join(batch_dir, f"batch_{i:03d}.fasta")
+        batch_xml = os.path.join(batch_dir, f"batch_{i:03d}.xml")
+        SeqIO.write(batch, batch_fasta, "fasta")
+
+        start = time.perf_counter()
+        result, attempts = run_blast_batch(batch_fasta, blast_db, batch_xml, threads_per_batch)
+        elapsed = time.perf_counter() - start
+
+        timing = {
+            "batch": i,
+            "queries": len(batch),
+            "residues": sum(len(record.seq) for record in batch),
+            "seconds": round(elapsed, 2),
+            "returncode": result.returncode,
+            "attempts": attempts,
+        }
+        # A failed batch is reported in its timing entry, so the other batches' timings are kept
+        if result.returncode != 0:
+            timing["error"] = f"blastp exited with code {result.returncode}: {result.stderr.strip()}"
+            print(f"Batch {i}: blastp failed after {attempts} attempt(s)\n{result.stderr}")
+        elif demultiplex:
+            try:
+                demultiplex_blast_xml(batch_xml, [record.id for record in batch], output_dir)
+            except ValueError as e:  # iteration count does not match the batch queries
+                timing["error"] = str(e)
+                print(f"Batch {i}: {e}")
+
+        print(f"Batch {i}/{len(batches)}: {timing['queries']} queries, {timing['residues']} residues, "
+              f"{timing['seconds']:.2f}s")
+        return timing
+
+    with ThreadPoolExecutor(max_workers=concurrent_batches) as executor:
+        timings = list(executor.map(run_one, range(1, len(batches) + 1), batches))
+
+    return timings
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run blastp for every query protein (one job per protein, or batched).",
+                                     fromfile_prefix_chars="@")
+    parser.add_argument("protein_type", choices=["plasmid", "chromosomal"], help="Which proteins are BLASTed")
+    parser.add_argument("query_fasta", help="Query protein FASTA file")
+    parser.add_argument("blast_db", help="BLAST database path")
+    parser.add_argument("output_dir", help="Output directory for the XML results")
+    parser.add_argument("--threads", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--mode", choices=["per-query", "batched"], default="per-query")
+    parser.add_argument("--batches", type=int, default=4, help="Number of query batches in batched mode")
+    telemetry.add_trace_arguments(parser)
+    args = parser.parse_args(argv)
+
+    telemetry.start_trace(args)
+
+    if args.mode == "batched":
+        timings = run_blast_batched(args.query_fasta, args.blast_db, args.output_dir, args.threads, args.batches,
+                                    args.protein_type)
+        failed = [timing for timing in timings if "error" in timing]
+        for timing in failed:
+            print(f"Batch {timing['batch']} failed ({timing['queries']} queries): {timing['error']}")
+    else:
+        failed = run_blast_per_query(args.query_fasta, args.blast_db, args.output_dir, args.threads,
+                                     args.protein_type)
 
-# ---- Run BLAST in Parallel ----
-print(f"\nRunning BLASTP on {len(fasta_paths)} {protein_type} proteins using {threads} threads...\n")
+    print(f"\nAll BLASTP results for {args.protein_type} proteins saved as XML in:", args.output_dir)
+    telemetry.finish_trace(args)
+    if failed:
+        raise SystemExit(1)
 
-with ThreadPoolExecutor(max_workers=threads) as executor:
-    executor.map(run_blast, fasta_paths)
 
-print(f"\nAll BLASTP results for {protein_type} proteins saved as XML in:", output_dir)
\ No newline at end of file
+if __name__ == "__main__":
+    main()
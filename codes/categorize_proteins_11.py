@@ -0,0 +1,123 @@
+import os
+import re
+import glob
+
+# Sorts the mutated proteins of stage 10 (mutation_summary_with_hit_defs.csv) into functional
+# categories and enzyme types, driven by a rules file (protein_category_rules.tsv next to this script):
+#   <table><TAB><label><TAB><regex>      table is "category" or "enzyme"
+# All rules of a table are compiled into one alternation with a named group per rule, so every
+# definition is classified by a single regex scan. Among the rules that match, the one listed first
+# wins; a keyword inside a longer match (e.g. "transferase" in "acetyltransferase") is not counted.
+# The Hit Def is classified, or the Reference_Def when no hit definition is known.
+#
+# Outputs in <output_folder>:
+#   categorized_protein_csvs/<Label>.csv                       + Category column
+#   top_mutated_enzymes/NN_<label>_detailed_mutations.csv      + Enzyme_Type column
+# Rows are ranked by Number of Mutations; enzyme files are numbered by total mutations per type.
+
+DEFAULT_RULES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "protein_category_rules.tsv")
+TABLES = {"category": ("categorized_protein_csvs", "Category"), "enzyme": ("top_mutated_enzymes", "Enzyme_Type")}
+
+
+def load_category_rules(rules_file):
+    # {table: [(label, regex), ...]} in file order
+    rules = {table: [] for table in TABLES}
+    with open(rules_file) as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if not line.strip() or line.startswith("#"):
+                continue
+            table, label, pattern = line.split("\t")
+            if table not in rules:
+                raise ValueError(f"Unknown rule table: {table}")
+            rules[table].append((label, pattern))
+    return rules
+
+
+class RuleMatcher:
+    def __init__(self, rules):
+        self.labels = [label for label, _ in rules]
+        alternatives = [f"(?P<r{i}>{pattern})" for i, (_, pattern) in enumerate(rules)]
+        self.regex = re.compile("|".join(alternatives), re.IGNORECASE) if alternatives else None
+
+    def classify(self, text):
+        # Label of the first-listed rule found in text, or None
+        if self.regex is None or not isinstance(text, str):
+            return None
+        best = None
+        for match in self.regex.finditer(text):
+            rule = int(match.lastgroup[1:])
+            if best is None or rule < best:
+                best = rule
+        return None if best is None else self.labels[best]
+
+    def classify_all(self, texts):
+        # One scan per distinct text
+        labels = {text: self.classify(text) for text in set(texts)}
+        return [labels[text] for text in texts]
+
+
+def label_file_name(label):
+    return re.sub(r"[^\w.-]+", "_", label).strip("_")
+
+
+def categorize_proteins(summary_csv, output_folder, rules_file=DEFAULT_RULES, top_enzymes=None):
+    import pandas as pd
+
+    rules = load_category_rules(rules_file)
+
+    # === Step 1: Load the stage 10 table and pick the text to classify ===
+    df = pd.read_csv(summary_csv)
+    hit_defs = df["Hit Def"].where(df["Hit Def"].notna() & (df["Hit Def"] != "Unknown"), df["Reference_Def"])
+    texts = hit_defs.fillna("").astype(str).tolist()
+
+    outputs = {}
+    for table, (folder_name, column) in TABLES.items():
+        folder = os.path.join(output_folder, folder_name)
+        os.makedirs(folder, exist_ok=True)
+
+        # === Step 2: Classify every definition with the table's combined regex ===
+        labelled = df.assign(**{column: RuleMatcher(rules[table]).classify_all(texts)})
+        labelled = labelled[labelled[column].notna()]
+
+        # === Step 3: Rank labels by total mutations, rows by mutation count ===
+        totals = labelled.groupby(column)["Number of Mutations"].sum().sort_values(ascending=False, kind="stable")
+        if table == "enzyme":
+            for old_file in glob.glob(os.path.join(folder, "*_detailed_mutations.csv")):
+                os.remove(old_file)  # numbering changes between runs
+            if top_enzymes is not None:
+                totals = totals.head(top_enzymes)
+
+        paths = []
+        for rank, label in enumerate(totals.index, 1):
+            rows = labelled[labelled[column] == label].sort_values("Number of Mutations", ascending=False,
+                                                                    kind="stable")
+            if table == "enzyme":
+                file_name = f"{rank:02d}_{label_file_name(label)}_detailed_mutations.csv"
+            else:
+                file_name = f"{label_file_name(label)}.csv"
+            path = os.path.join(folder, file_name)
+            rows.to_csv(path, index=False)
+            paths.append(path)
+            print(f"  {label:<25} {len(rows):>5} proteins {int(totals[label]):>7} mutations → {path}")
+        outputs[table] = paths
+
+    return outputs
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Sort mutated proteins into categories and ranked enzyme tables.",
+                                     fromfile_prefix_chars="@")
+    parser.add_argument("summary_csv", help="mutation_summary_with_hit_defs.csv (stage 10 output)")
+    parser.add_argument("output_folder")
+    parser.add_argument("--rules", default=DEFAULT_RULES, help="Category rules file")
+    parser.add_argument("--top-enzymes", type=int, help="Only write the N most mutated enzyme types")
+    args = parser.parse_args(argv)
+
+    categorize_proteins(args.summary_csv, args.output_folder, args.rules, args.top_enzymes)
+
+
+if __name__ == "__main__":
+    main()
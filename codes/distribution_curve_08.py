@@ -1,49 +1,66 @@
-import pandas as pd
-import seaborn as sns
-import matplotlib.pyplot as plt
-
-# Step 1: Load the CSV file
-file_path = "distribution_curve_plasmid.csv"  # Change this if your file name is different
-df = pd.read_csv(file_path)
-
-# Step 2: Normalize column names
-df.columns = [col.strip().lower() for col in df.columns]
-
-# Step 3: Rename columns for consistency (optional, based on your current column names)
-df = df.rename(columns={
-    'id': 'protein_id',
-    'length': 'length',
-    'mutation_status': 'mutation_status'
-})
-
-# Step 4: Clean 'length' column and drop invalid entries
-df['length'] = pd.to_numeric(df['length'], errors='coerce')
-df = df.dropna(subset=['length'])
-
-# Step 5: Normalize mutation_status values (make lowercase, remove spaces)
-df['mutation_status'] = df['mutation_status'].str.strip().str.lower()
-
-# Step 6: Plot KDE (Density) curve for mutation vs no mutation
-plt.figure(figsize=(10, 6))
-
-# KDE for mutated proteins
-sns.kdeplot(
-    data=df[df["mutation_status"] == "mutation"],
-    x="length", label="Mutated", fill=True,
-    color="red", alpha=0.6
-)
-
-# KDE for non-mutated proteins
-sns.kdeplot(
-    data=df[df["mutation_status"] == "no mutation"],
-    x="length", label="Non-mutated", fill=True,
-    color="green", alpha=0.6
-)
-
-# Step 7: Plot styling
-plt.title("Protein Length Distribution: Mutated vs Non-mutated")
-plt.xlabel("Protein Length (amino acids)")
-plt.ylabel("Density")
-plt.legend()
-plt.tight_layout()
-plt.show()
\ No newline at end of file
+from plot_common import cached_kde_curve, save_or_show
+
+FILE_PATH = "distribution_curve_plasmid.csv"
+
+
+def plot_length_distribution(file_path, output_file=None, kde_cache=None):
+    import pandas as pd
+    import matplotlib.pyplot as plt
+
+    # Step 1: Load the CSV file
+    df = pd.read_csv(file_path)
+
+    # Step 2: Normalize column names
+    df.columns = [col.strip().lower() for col in df.columns]
+
+    # Step 3: Rename columns for consistency (optional, based on your current column names)
+    df = df.rename(columns={
+        'id': 'protein_id',
+        'length': 'length',
+        'mutation_status': 'mutation_status'
+    })
+
+    # Step 4: Clean 'length' column and drop invalid entries
+    df['length'] = pd.to_numeric(df['length'], errors='coerce')
+    df = df.dropna(subset=['length'])
+
+    # Step 5: Normalize mutation_status values (make lowercase, remove spaces)
+    df['mutation_status'] = df['mutation_status'].str.strip().str.lower()
+
+    # Step 6: Plot KDE (Density) curve for mutation vs no mutation
+    # (curves computed once with NumPy and cached, see plot_common.py)
+    plt.figure(figsize=(10, 6))
+
+    for status, label, color in [("mutation", "Mutated", "red"), ("no mutation", "Non-mutated", "green")]:
+        curve = cached_kde_curve(df.loc[df["mutation_status"] == status, "length"].to_numpy(), kde_cache)
+        if curve is None:
+            continue
+        support, density = curve
+        plt.fill_between(support, density, color=color, alpha=0.6, label=label)
+        plt.plot(support, density, color=color)
+
+    # Step 7: Plot styling
+    plt.title("Protein Length Distribution: Mutated vs Non-mutated")
+    plt.xlabel("Protein Length (amino acids)")
+    plt.ylabel("Density")
+    plt.legend()
+    plt.tight_layout()
+
+    # Step 8: Save when an output file (or list of files) is given, otherwise show
+    save_or_show(plt, output_file)
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Protein length density of mutated vs non-mutated proteins.",
+                                     fromfile_prefix_chars="@")
+    parser.add_argument("file_path", nargs="?", default=FILE_PATH, help="Stage 07 length table")
+    parser.add_argument("--output", nargs="+", help="Save to these files (e.g. curve.png curve.svg) instead of showing")
+    args = parser.parse_args(argv)
+
+    plot_length_distribution(args.file_path, args.output)
+
+
+if __name__ == "__main__":
+    main()
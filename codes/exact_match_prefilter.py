@@ -0,0 +1,270 @@
+import os
+import csv
+import hashlib
+import numpy as np
+
+from fasta_index import FastaIndex, iter_fasta
+from blast_hit_filtering_04 import HIT_DEF_CSV_HEADER
+from extract_mutations_06 import SUMMARY_CSV_HEADER
+
+# Fast path in front of BLAST (stage 03) for queries that are unchanged in every strain.
+#
+# 1. Every strain protein of all_genomes.faa is hashed by sequence; a query whose exact sequence
+#    occurs in every strain (strain = first header token, the assembly accession) is a candidate.
+# 2. A k-mer index of the candidates is matched against each distinct strain sequence. A candidate
+#    sharing at least MIN_SHARED_FRACTION of its k-mers with any non-identical strain protein may
+#    get a >= 90 % identity BLAST hit (a paralog, a fragment) that would show up as mutations, so it
+#    still goes through BLAST. With 10 % mismatches at most, spread as evenly as possible, a hit
+#    keeps about half of its 5-mers, well above the threshold.
+# 3. The remaining candidates are resolved without BLAST / MAFFT. For each, the same files stages
+#    04 and 05 would write are produced directly: filtered_hits_<id>.faa (query + identical strain
+#    proteins, copied via the genome offset index), filtered_hits_csv/<id>_hit_defs.csv (identity
+#    and coverage 1.0; the E-value is left empty, no BLAST search produced one, and stage 10 reads
+#    it as NA) and MSA_<id>.faa (the identical sequences need no alignment), so stage 06 reports
+#    them as "No mutations found".
+#
+# Also written: <hits_dir>/prefilter_resolved.txt (resolved query ids, skipped by stage 05),
+# <hits_dir>/prefilter_summary.csv (their stage 06 summary rows) and, optionally, a FASTA of
+# the divergent queries to hand to blast_runner_03.py.
+
+KMER_SIZE = 5
+MIN_SHARED_FRACTION = 0.1
+CHUNK_RESIDUES = 4 * 1024 ** 2  # distinct strain sequences are k-mer matched in batches of this size
+RESOLVED_LIST_NAME = "prefilter_resolved.txt"
+SUMMARY_NAME = "prefilter_summary.csv"
+
+# Residue letters -> 1..26 (5 bits each); anything else is 0 and breaks a k-mer
+_RESIDUE_CODES = np.zeros(256, dtype=np.int64)
+for _i, _letter in enumerate(b"ABCDEFGHIJKLMNOPQRSTUVWXYZ", 1):
+    _RESIDUE_CODES[_letter] = _i
+    _RESIDUE_CODES[_letter + 32] = _i
+
+
+def sequence_key(sequence):
+    return hashlib.blake2b(sequence.upper().encode(), digest_size=16).digest()
+
+
+def strain_of(header):
+    parts = header.split(None, 1)
+    return parts[0] if parts else ""
+
+
+def hash_genome_proteins(genomes_fasta):
+    # One pass: sequence key -> strain protein headers (file order), and the set of strains
+    by_sequence = {}
+    strains = set()
+    with open(genomes_fasta) as handle:
+        for header, sequence in iter_fasta(handle):
+            by_sequence.setdefault(sequence_key(sequence), []).append(header)
+            strains.add(strain_of(header))
+    return by_sequence, strains
+
+
+def conserved_queries(queries, by_sequence, strains):
+    # query_id -> identical strain protein headers, for queries found unchanged in every strain
+    conserved = {}
+    for query_id, (_, sequence) in queries.items():
+        headers = by_sequence.get(sequence_key(sequence))
+        if headers and {strain_of(header) for header in headers} >= strains:
+            conserved[query_id] = headers
+    return conserved
+
+
+def kmer_codes(residues, k=KMER_SIZE):
+    # residues: uint8 array -> (int64 code of every k-mer start, valid mask); k-mers over a 0 code are invalid
+    codes = _RESIDUE_CODES[residues]
+    n = len(codes) - k + 1
+    if n <= 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=bool)
+    kmers = np.zeros(n, dtype=np.int64)
+    for j in range(k):
+        kmers = (kmers << 5) | codes[j:j + n]
+    zeros = np.concatenate(([0], np.cumsum(codes == 0)))
+    return kmers, zeros[k:] - zeros[:n] == 0
+
+
+def build_kmer_table(sequences, k=KMER_SIZE):
+    # Sorted (k-mer code, sequence number) pairs, one per distinct k-mer of each sequence
+    codes, owners = [], []
+    for i, sequence in enumerate(sequences):
+        kmers, valid = kmer_codes(np.frombuffer(sequence.encode(), dtype=np.uint8), k)
+        kmers = np.unique(kmers[valid])
+        codes.append(kmers)
+        owners.append(np.full(len(kmers), i, dtype=np.int64))
+    codes = np.concatenate(codes) if codes else np.zeros(0, dtype=np.int64)
+    owners = np.concatenate(owners) if owners else np.zeros(0, dtype=np.int64)
+    order = np.argsort(codes, kind="stable")
+    return codes[order], owners[order]
+
+
+def shared_kmer_pairs(batch, table_codes, table_owners, k=KMER_SIZE):
+    # batch: list of sequences. Returns (batch index, owner, shared k-mer count) arrays for every pair
+    # that shares at least one k-mer. Sequences are joined with a 0 byte so no k-mer spans two of them.
+    joined = np.frombuffer(b"\0".join(sequence.encode() for sequence in batch), dtype=np.uint8)
+    kmers, valid = kmer_codes(joined, k)
+    positions = np.flatnonzero(valid)
+    left = np.searchsorted(table_codes, kmers[positions], side="left")
+    right = np.searchsorted(table_codes, kmers[positions], side="right")
+    hit = right > left
+    positions, left, counts = positions[hit], left[hit], (right - left)[hit]
+    if not len(positions):
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty
+
+    starts = np.cumsum([0] + [len(sequence) + 1 for sequence in batch[:-1]])
+    sequence_index = np.searchsorted(starts, positions, side="right") - 1
+    # Expand each matched k-mer to all table rows holding it
+    total = counts.sum()
+    rows = np.repeat(left - (np.cumsum(counts) - counts), counts) + np.arange(total)
+    n_owners = int(table_owners.max()) + 1
+    pairs, shared = np.unique(np.repeat(sequence_index, counts) * n_owners + table_owners[rows], return_counts=True)
+    return pairs // n_owners, pairs % n_owners, shared
+
+
+def ambiguous_candidates(genomes_fasta, candidates, candidate_sequences, k=KMER_SIZE,
+                         min_shared_fraction=MIN_SHARED_FRACTION):
+    # Candidates sharing enough k-mers with some strain protein that is not an identical copy of them
+    table_codes, table_owners = build_kmer_table(candidate_sequences, k)
+    thresholds = np.array([max(1, int(np.ceil(min_shared_fraction * max(1, len(s) - k + 1))))
+                           for s in candidate_sequences])
+    candidate_keys = [sequence_key(sequence) for sequence in candidate_sequences]
+    ambiguous = set()
+
+    def check(batch, batch_keys):
+        batch_index, owners, shared = shared_kmer_pairs(batch, table_codes, table_owners, k)
+        for i, owner, count in zip(batch_index.tolist(), owners.tolist(), shared.tolist()):
+            if count >= thresholds[owner] and batch_keys[i] != candidate_keys[owner]:
+                ambiguous.add(candidates[owner])
+
+    # Each distinct strain sequence is matched once, however many strains carry it
+    seen = set()
+    batch, batch_keys, residues = [], [], 0
+    with open(genomes_fasta) as handle:
+        for _, sequence in iter_fasta(handle):
+            key = sequence_key(sequence)
+            if key in seen:
+                continue
+            seen.add(key)
+            batch.append(sequence)
+            batch_keys.append(key)
+            residues += len(sequence)
+            if residues >= CHUNK_RESIDUES:
+                check(batch, batch_keys)
+                batch, batch_keys, residues = [], [], 0
+    if batch:
+        check(batch, batch_keys)
+    return ambiguous
+
+
+def write_wrapped(handle, header, sequence, line_length=60):
+    handle.write(f">{header}\n")
+    for i in range(0, len(sequence), line_length):
+        handle.write(sequence[i:i + line_length] + "\n")
+
+
+def write_resolved_query(query_id, description, sequence, hit_headers, genome_index, hits_dir, msa_dir):
+    # The stage 04 hit FASTA / CSV and the stage 05 MSA of a query identical in every strain
+    hits_path = os.path.join(hits_dir, f"filtered_hits_{query_id}.faa")
+    with open(hits_path, "w") as outfile:
+        write_wrapped(outfile, description, sequence)
+        genome_index.write_records(outfile, hit_headers)
+
+    csv_path = os.path.join(hits_dir, "filtered_hits_csv", f"{query_id}_hit_defs.csv")
+    with open(csv_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(HIT_DEF_CSV_HEADER)
+        for hit_def in sorted(set(hit_headers)):
+            writer.writerow([hit_def, f"{1.0:.4f}", f"{1.0:.4f}", ""])
+
+    msa_path = os.path.join(msa_dir, f"MSA_{query_id}.faa")
+    tmp_path = f"{msa_path}.{os.getpid()}.tmp"
+    with open(hits_path) as records, open(tmp_path, "w") as msa:
+        n_records = 0
+        for header, record_sequence in iter_fasta(records):
+            write_wrapped(msa, header, record_sequence)
+            n_records += 1
+    os.replace(tmp_path, msa_path)
+    return n_records - 1
+
+
+def load_resolved_list(hits_dir):
+    path = os.path.join(hits_dir, RESOLVED_LIST_NAME)
+    if not os.path.exists(path):
+        return set()
+    with open(path) as f:
+        return {line.strip() for line in f if line.strip()}
+
+
+def prefilter_queries(query_fasta, genomes_fasta, hits_dir, msa_dir, divergent_fasta=None, k=KMER_SIZE,
+                      min_shared_fraction=MIN_SHARED_FRACTION, queries=None):
+    # Returns ({resolved query id: hit count}, [divergent query ids]); queries: optional preloaded
+    # {id: (description, sequence)} of query_fasta
+    if queries is None:
+        with open(query_fasta) as handle:
+            queries = {description.split(None, 1)[0]: (description, sequence)
+                       for description, sequence in iter_fasta(handle) if description}
+    os.makedirs(os.path.join(hits_dir, "filtered_hits_csv"), exist_ok=True)
+    os.makedirs(msa_dir, exist_ok=True)
+
+    # === Step 1: Exact-sequence hash of every strain protein ===
+    by_sequence, strains = hash_genome_proteins(genomes_fasta)
+    conserved = conserved_queries(queries, by_sequence, strains)
+    print(f"{len(queries)} queries, {len(strains)} strains, {len(by_sequence)} distinct strain sequences; "
+          f"{len(conserved)} queries identical in every strain")
+
+    # === Step 2: K-mer check for similar, non-identical strain proteins ===
+    candidates = list(conserved)
+    ambiguous = set()
+    if candidates:
+        ambiguous = ambiguous_candidates(genomes_fasta, candidates, [queries[q][1] for q in candidates],
+                                         k, min_shared_fraction)
+    print(f"{len(ambiguous)} of them have similar non-identical strain proteins and stay on the BLAST path")
+
+    # === Step 3: Write hits and MSAs of the resolved queries ===
+    resolved = {}
+    with FastaIndex(genomes_fasta) as genome_index:
+        for query_id in candidates:
+            if query_id in ambiguous:
+                continue
+            description, sequence = queries[query_id]
+            resolved[query_id] = write_resolved_query(query_id, description, sequence, conserved[query_id],
+                                                      genome_index, hits_dir, msa_dir)
+
+    with open(os.path.join(hits_dir, RESOLVED_LIST_NAME), "w") as f:
+        f.writelines(f"{query_id}\n" for query_id in resolved)
+    with open(os.path.join(hits_dir, SUMMARY_NAME), "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(SUMMARY_CSV_HEADER)
+        writer.writerows([f"MSA_{query_id}.faa", "No mutations found", 0, hits] for query_id, hits in resolved.items())
+
+    divergent = [query_id for query_id in queries if query_id not in resolved]
+    if divergent_fasta:
+        with open(divergent_fasta, "w") as out:
+            for query_id in divergent:
+                write_wrapped(out, *queries[query_id])
+
+    print(f"Resolved without BLAST: {len(resolved)}; divergent queries left for BLAST: {len(divergent)}")
+    return resolved, divergent
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Resolve queries identical in every strain without BLAST / MAFFT.",
+                                     fromfile_prefix_chars="@")
+    parser.add_argument("query_fasta", help="Query proteins (stage 02 output)")
+    parser.add_argument("genomes_fasta", help="Combined FASTA of all strain proteins")
+    parser.add_argument("hits_dir", help="Stage 04 output folder (filtered_hits_*.faa)")
+    parser.add_argument("msa_dir", help="Stage 05 output folder (MSA_*.faa)")
+    parser.add_argument("--divergent-fasta", help="Write the queries still needing BLAST here (stage 03 input)")
+    parser.add_argument("--kmer-size", type=int, default=KMER_SIZE)
+    parser.add_argument("--min-shared-fraction", type=float, default=MIN_SHARED_FRACTION,
+                        help="Share of a query's k-mers a non-identical strain protein needs to keep it on the BLAST path")
+    args = parser.parse_args(argv)
+
+    prefilter_queries(args.query_fasta, args.genomes_fasta, args.hits_dir, args.msa_dir, args.divergent_fasta,
+                      k=args.kmer_size, min_shared_fraction=args.min_shared_fraction)
+
+
+if __name__ == "__main__":
+    main()
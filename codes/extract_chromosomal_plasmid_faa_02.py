@@ -1,29 +1,199 @@
-from Bio import SeqIO
-
-# Input and output FASTA files
-input_fasta = "reference.faa"
-plasmid_output = "plasmid_proteins.faa"
-non_plasmid_output = "chromosomal_proteins.faa"
-
-# Counters
-total = 0
-plasmid_count = 0
-non_plasmid_count = 0
-
-# Open both output files
-with open(plasmid_output, "w") as plasmid_handle, open(non_plasmid_output, "w") as non_plasmid_handle:
-    for record in SeqIO.parse(input_fasta, "fasta"):
-        total += 1
-        if "plasmid" in record.description.lower():
-            plasmid_count += 1
-            SeqIO.write(record, plasmid_handle, "fasta")
+import os
+import re
+import gzip
+
+from fasta_index import iter_fasta
+
+# Streaming FASTA splitter. Records are read line by line (plain or .gz inputs) and routed to
+# any number of outputs by an ordered list of rules; the first rule that matches wins.
+#
+# Rules file (tab separated, "#" starts a comment):
+#   <type><TAB><pattern><TAB><output template>
+# Types:
+#   contains   case-insensitive substring of the header
+#   regex      re.search on the header; named groups can be used in the template
+#   accession  first header token in a comma-separated list, or in a file with one accession per line
+#   default    everything not matched so far (pattern left empty)
+# Templates are str.format strings with {accession} (first header token), {input} (input file
+# name without .faa/.gz) and the regex named groups, e.g. "per_plasmid/{input}_{plasmid}.faa".
+# Records that match no rule are dropped.
+
+# Default input and output FASTA files
+INPUT_FASTA = "reference.faa"
+PLASMID_OUTPUT = "plasmid_proteins.faa"
+NON_PLASMID_OUTPUT = "chromosomal_proteins.faa"
+
+LINE_LENGTH = 60  # same wrapping as Bio.SeqIO.write
+BUFFER_BYTES = 4 * 1024 ** 2  # flush an output once this much text is pending
+TOTAL_BUFFER_BYTES = 64 * 1024 ** 2  # flush everything once all outputs together hold this much
+
+
+def default_rules(plasmid_output, non_plasmid_output):
+    # The original split: "plasmid" anywhere in the description, everything else is chromosomal
+    return [("contains", "plasmid", plasmid_output), ("default", "", non_plasmid_output)]
+
+
+def load_rules(rules_file):
+    rules = []
+    with open(rules_file) as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if not line.strip() or line.lstrip().startswith("#"):
+                continue
+            rule_type, pattern, template = line.split("\t")
+            rules.append((rule_type.strip(), pattern, template.strip()))
+    return rules
+
+
+def compile_rules(rules):
+    # (type, pattern, template) -> (match function, template); match returns a dict of template fields or None
+    compiled = []
+    for rule_type, pattern, template in rules:
+        if rule_type == "contains":
+            needle = pattern.lower()
+            match = lambda header, needle=needle: {} if needle in header.lower() else None
+        elif rule_type == "regex":
+            regex = re.compile(pattern)
+
+            def match(header, regex=regex):
+                found = regex.search(header)
+                return found.groupdict() if found else None
+        elif rule_type == "accession":
+            if os.path.isfile(pattern):
+                with open(pattern) as f:
+                    accessions = {line.strip() for line in f if line.strip()}
+            else:
+                accessions = {a.strip() for a in pattern.split(",") if a.strip()}
+            match = lambda header, accessions=accessions: {} if header.split(None, 1)[0] in accessions else None
+        elif rule_type == "default":
+            match = lambda header: {}
         else:
-            non_plasmid_count += 1
-            SeqIO.write(record, non_plasmid_handle, "fasta")
-
-# Print summary
-print(f"Total sequences in input file        : {total}")
-print(f"Plasmid-encoded proteins extracted   : {plasmid_count}")
-print(f"Chromosomal proteins extracted       : {non_plasmid_count}")
-print(f"Plasmid output written to            : {plasmid_output}")
-print(f"Non-plasmid output written to        : {non_plasmid_output}")
\ No newline at end of file
+            raise ValueError(f"Unknown rule type: {rule_type}")
+        compiled.append((match, template))
+    return compiled
+
+
+def open_fasta(path):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt")
+    return open(path)
+
+
+def format_record(description, sequence, line_length=LINE_LENGTH):
+    lines = [f">{description}\n"]
+    lines.extend(sequence[i:i + line_length] + "\n" for i in range(0, len(sequence), line_length))
+    return "".join(lines)
+
+
+class BufferedOutputs:
+    # Collects formatted records per output path and writes them in large chunks.
+    # Files are only open while a chunk is written, so thousands of outputs never exhaust file handles.
+    def __init__(self):
+        self.pending = {}  # path -> list of record strings
+        self.pending_bytes = {}
+        self.total_bytes = 0
+        self.started = set()  # outputs already truncated in this run
+        self.counts = {}
+
+    def write(self, path, text):
+        self.pending.setdefault(path, []).append(text)
+        self.pending_bytes[path] = self.pending_bytes.get(path, 0) + len(text)
+        self.total_bytes += len(text)
+        self.counts[path] = self.counts.get(path, 0) + 1
+        if self.pending_bytes[path] >= BUFFER_BYTES:
+            self.flush(path)
+        elif self.total_bytes >= TOTAL_BUFFER_BYTES:
+            self.flush()
+
+    def start(self, path):
+        # Create (or empty) an output even if no record ends up in it
+        if path not in self.started:
+            folder = os.path.dirname(path)
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+            open(path, "w").close()
+            self.started.add(path)
+
+    def flush(self, path=None):
+        for out_path in [path] if path is not None else list(self.pending):
+            chunks = self.pending.pop(out_path, [])
+            self.start(out_path)
+            with open(out_path, "a") as handle:
+                handle.writelines(chunks)
+            self.total_bytes -= self.pending_bytes.pop(out_path, 0)
+
+
+def split_fasta_files(input_files, rules):
+    # Route every record of every input through the rules in a single pass.
+    # Returns ({output path: record count}, total records, dropped records).
+    compiled = compile_rules(rules)
+    outputs = BufferedOutputs()
+    for _, template in compiled:
+        if "{" not in template:
+            outputs.start(template)  # fixed outputs always exist, like the original two files
+    total = 0
+    dropped = 0
+
+    for input_file in input_files:
+        input_name = os.path.basename(input_file)
+        for suffix in (".gz", ".faa", ".fasta", ".fa"):
+            if input_name.endswith(suffix):
+                input_name = input_name[:-len(suffix)]
+
+        with open_fasta(input_file) as handle:
+            for description, sequence in iter_fasta(handle):
+                total += 1
+                for match, template in compiled:
+                    fields = match(description)
+                    if fields is not None:
+                        accession = description.split(None, 1)[0] if description else ""
+                        path = template.format(accession=accession, input=input_name, **fields)
+                        outputs.write(path, format_record(description, sequence))
+                        break
+                else:
+                    dropped += 1
+
+    outputs.flush()
+    return outputs.counts, total, dropped
+
+
+def split_reference_proteins(input_fasta, plasmid_output, non_plasmid_output):
+    counts, total, _ = split_fasta_files([input_fasta], default_rules(plasmid_output, non_plasmid_output))
+    plasmid_count = counts.get(plasmid_output, 0)
+    non_plasmid_count = counts.get(non_plasmid_output, 0)
+
+    # Print summary
+    print(f"Total sequences in input file        : {total}")
+    print(f"Plasmid-encoded proteins extracted   : {plasmid_count}")
+    print(f"Chromosomal proteins extracted       : {non_plasmid_count}")
+    print(f"Plasmid output written to            : {plasmid_output}")
+    print(f"Non-plasmid output written to        : {non_plasmid_output}")
+
+    return total, plasmid_count, non_plasmid_count
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Split protein FASTA files into plasmid / chromosomal (or rule-based) outputs.",
+                                     fromfile_prefix_chars="@")
+    parser.add_argument("inputs", nargs="*", default=[INPUT_FASTA], help="Input FASTA files (.faa or .faa.gz)")
+    parser.add_argument("--rules", help="Rules file routing records to outputs (see the top of this script)")
+    parser.add_argument("--plasmid-output", default=PLASMID_OUTPUT)
+    parser.add_argument("--chromosomal-output", default=NON_PLASMID_OUTPUT)
+    args = parser.parse_args(argv)
+
+    if not args.rules and len(args.inputs) == 1:
+        split_reference_proteins(args.inputs[0], args.plasmid_output, args.chromosomal_output)
+        return
+
+    rules = load_rules(args.rules) if args.rules else default_rules(args.plasmid_output, args.chromosomal_output)
+    counts, total, dropped = split_fasta_files(args.inputs, rules)
+    print(f"Total sequences in input files       : {total}")
+    for path, count in sorted(counts.items()):
+        print(f"{count:>10}  {path}")
+    print(f"Records matching no rule (dropped)   : {dropped}")
+
+
+if __name__ == "__main__":
+    main()
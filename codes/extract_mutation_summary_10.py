@@ -1,90 +1,80 @@
 import os
-import csv
-from Bio import SeqIO
-
-# === Take input from user ===
-summary_csv = input("Enter path to mutation summary CSV file: ").strip()
-hit_def_folder = input("Enter path to folder containing hit definition CSVs: ").strip()
-combined_fasta_file = input("Enter path to reference FASTA (.faa) file: ").strip()
-output_folder = input("Enter output folder path: ").strip()
-
-# === Auto-generated output filenames ===
-output_mutation_csv = os.path.join(output_folder, "mutation_summary_with_hit_defs.csv")
-output_non_mutation_csv = os.path.join(output_folder, "non_mutation_summary_with_hit_defs.csv")
-
-# === Step 1: Read FASTA headers into a dictionary: {protein_id: description} ===
-reference_defs = {}
-with open(combined_fasta_file) as fasta:
-    for line in fasta:
-        if line.startswith(">"):
-            line = line.strip()
-            parts = line[1:].split(maxsplit=1)
-            if len(parts) == 2:
-                protein_id, description = parts
-            else:
-                protein_id = parts[0]
-                description = "Unknown"
-            reference_defs[protein_id] = description
-
-# === Step 2: Load full sequences from FASTA for length lookup ===
-seq_records = SeqIO.to_dict(SeqIO.parse(combined_fasta_file, "fasta"))
-
-# === Step 3: Containers for outputs ===
-mutation_rows = []
-non_mutation_rows = []
-
-# === Step 4: Process mutation summary ===
-with open(summary_csv, newline="") as f:
-    reader = csv.DictReader(f)
-    for row in reader:
-        msa_filename = row["MSA File"]
-        status = row["Status"]
-        num_mutations = row["Number of Mutations"]
-
-        # Extract protein_id
-        protein_id = msa_filename.replace("MSA_", "").replace(".faa", "")
-
-        # Get Hit Def
-        hit_def_path = os.path.join(hit_def_folder, f"{protein_id}_hit_defs.csv")
-        if os.path.exists(hit_def_path):
-            with open(hit_def_path, newline="") as hitfile:
-                hit_reader = csv.reader(hitfile)
-                next(hit_reader, None)  # skip header
-                try:
-                    hit_def = next(hit_reader)[0]
-                except StopIteration:
-                    hit_def = "Unknown"
-        else:
-            hit_def = "Unknown"
-
-        # Get Reference Def
-        reference_def = reference_defs.get(protein_id, "Unknown")
-
-        # Get sequence length
-        length = len(seq_records[protein_id].seq) if protein_id in seq_records else "Unknown"
-
-        # Prepare output row
-        record = [protein_id, reference_def, hit_def,
-                  status.replace("Mutations found", "Mutated").replace("No mutations", "Not Mutated"),
-                  num_mutations, length]
-
-        if status == "Mutations found":
-            mutation_rows.append(record)
-        else:
-            non_mutation_rows.append(record)
-
-# === Step 5: Write outputs with length included ===
-headers = ["Protein_Id", "Reference_Def", "Hit Def", "Status", "Number of Mutations", "Length"]
-
-with open(output_mutation_csv, "w", newline="") as f:
-    writer = csv.writer(f)
-    writer.writerow(headers)
-    writer.writerows(mutation_rows)
-
-with open(output_non_mutation_csv, "w", newline="") as f:
-    writer = csv.writer(f)
-    writer.writerow(headers)
-    writer.writerows(non_mutation_rows)
-
-print("  →", output_mutation_csv)
-print("  →", output_non_mutation_csv)
\ No newline at end of file
+
+from blast_hit_filtering_04 import HIT_DEFS_TABLE_HEADER, iter_hit_def_rows
+from protein_index import ProteinIndex
+
+HEADERS = ["Protein_Id", "Reference_Def", "Hit Def", "Status", "Number of Mutations", "Length"]
+
+
+def load_hit_defs(hit_defs):
+    # hit_defs: the consolidated hit table (CSV file) or the folder of per-query "<id>_hit_defs.csv" files
+    import pandas as pd
+
+    if os.path.isfile(hit_defs):
+        return pd.read_csv(hit_defs, dtype=str, keep_default_na=False)
+    return pd.DataFrame(list(iter_hit_def_rows(hit_defs)), columns=HIT_DEFS_TABLE_HEADER)
+
+
+def top_hit_defs(hits):
+    # Best hit per protein: highest identity, then lowest e-value (hit name breaks exact ties)
+    import pandas as pd
+
+    ranked = hits.assign(
+        identity=pd.to_numeric(hits["Identity"], errors="coerce"),
+        evalue=pd.to_numeric(hits["E-value"], errors="coerce"),
+    ).sort_values(["Protein_Id", "identity", "evalue", "Hit_Def"], ascending=[True, False, True, True])
+    return ranked.drop_duplicates("Protein_Id")[["Protein_Id", "Hit_Def"]]
+
+
+def build_summary_with_hit_defs(summary_csv, hit_def_folder, combined_fasta_file, output_folder):
+    import pandas as pd
+
+    # === Auto-generated output filenames ===
+    output_mutation_csv = os.path.join(output_folder, "mutation_summary_with_hit_defs.csv")
+    output_non_mutation_csv = os.path.join(output_folder, "non_mutation_summary_with_hit_defs.csv")
+
+    # === Step 1: Read the mutation summary ===
+    summary = pd.read_csv(summary_csv, dtype=str, keep_default_na=False)
+    summary["Protein_Id"] = (summary["MSA File"].str.replace("MSA_", "", regex=False)
+                             .str.replace(".faa", "", regex=False))
+
+    # === Step 2: Look up reference descriptions and lengths in the protein index ===
+    protein_index = ProteinIndex(combined_fasta_file)
+    summary["Reference_Def"] = protein_index.descriptions_for(summary["Protein_Id"], missing="Unknown")
+    summary["Length"] = protein_index.lengths_for(summary["Protein_Id"], missing="Unknown")
+
+    # === Step 3: Join the top hit of every protein in one merge ===
+    top_hits = top_hit_defs(load_hit_defs(hit_def_folder))
+    summary = summary.merge(top_hits, on="Protein_Id", how="left")
+    summary["Hit Def"] = summary["Hit_Def"].fillna("Unknown")
+
+    # === Step 4: Split mutated / non-mutated proteins ===
+    mutated = summary["Status"] == "Mutations found"
+    summary["Status"] = (summary["Status"].str.replace("Mutations found", "Mutated", regex=False)
+                         .str.replace("No mutations", "Not Mutated", regex=False))
+
+    # === Step 5: Write outputs with length included ===
+    summary[mutated][HEADERS].to_csv(output_mutation_csv, index=False, lineterminator="\r\n")
+    summary[~mutated][HEADERS].to_csv(output_non_mutation_csv, index=False, lineterminator="\r\n")
+
+    print("  →", output_mutation_csv)
+    print("  →", output_non_mutation_csv)
+    return output_mutation_csv, output_non_mutation_csv
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Mutation summary with reference and top hit definitions and lengths.",
+                                     fromfile_prefix_chars="@")
+    parser.add_argument("summary_csv", help="Stage 06 mutation_summary.csv")
+    parser.add_argument("hit_def_folder", help="Folder of hit definition CSVs, or the consolidated hit table")
+    parser.add_argument("combined_fasta_file", help="Reference protein FASTA (.faa)")
+    parser.add_argument("output_folder")
+    args = parser.parse_args(argv)
+
+    build_summary_with_hit_defs(args.summary_csv, args.hit_def_folder, args.combined_fasta_file, args.output_folder)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,14 @@
-from Bio import SeqIO
+import numpy as np
 import csv
 import os
+from itertools import repeat
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+
+import telemetry
+
+# Replicon names used for the pipeline workdirs and the mutation store partitions
+REPLICONS = ["chromosomal", "plasmid"]
 
 # Function to determine conservative/non-conservative substitution
 def get_substitution_type(original, mutated):
@@ -29,106 +37,394 @@ def map_alignment_to_original_positions(query_sequence):
             position_map.append(original_pos)
     return position_map
 
-# Main processing function
-def extract_mutations(msa_folder, output_root_folder):
-    mutation_folder = os.path.join(output_root_folder, "mutations")
-    os.makedirs(mutation_folder, exist_ok=True)
+MUTATION_CSV_HEADER = [
+    "Aligned Position", "Original Position", "Query Residue",
+    "Mutation Type / Mutated Residue", "Count", "Total Sequences",
+    "Percentage", "Substitution Type"
+]
+SUMMARY_CSV_HEADER = ["MSA File", "Status", "Number of Mutations" , "Total_hits"]
 
-    summary_log = []
-
-    for msa_filename in os.listdir(msa_folder):
-        if not msa_filename.endswith(".faa"):
-            continue
 
-        msa_path = os.path.join(msa_folder, msa_filename)
+GAP = ord("-")
+TILE_COLUMNS = 1024  # alignment columns per tile in streaming mode
 
-        with open(msa_path, "r") as handle:
-            records = list(SeqIO.parse(handle, "fasta"))
-            if not records:
-                continue
-            aligned_sequences = [str(record.seq) for record in records]
-            query_sequence = aligned_sequences[0]
 
-        original_positions = map_alignment_to_original_positions(query_sequence)
-        aa_matrix = [{} for _ in range(len(query_sequence))]
+# Original pure-Python column profile (list of per-column dicts); kept as the reference
+# implementation that the NumPy engine is checked and benchmarked against
+def find_mutations_dicts(aligned_sequences):
+    query_sequence = aligned_sequences[0]
+    original_positions = map_alignment_to_original_positions(query_sequence)
+    aa_matrix = [{} for _ in range(len(query_sequence))]
 
-        for seq in aligned_sequences:
-            for index, aa in enumerate(seq):
-                aa_matrix[index][aa] = aa_matrix[index].get(aa, 0) + 1
+    for seq in aligned_sequences:
+        for index, aa in enumerate(seq):
+            aa_matrix[index][aa] = aa_matrix[index].get(aa, 0) + 1
 
-        total_sequences = len(aligned_sequences)
-        total_hits = total_sequences - 1
-        mutations = []
+    total_sequences = len(aligned_sequences)
+    total_hits = total_sequences - 1
+    mutations = []
 
-        for index, count_dict in enumerate(aa_matrix):
-            query_residue = query_sequence[index]
-            aligned_pos = index + 1
-            original_pos = original_positions[index]
+    for index, count_dict in enumerate(aa_matrix):
+        query_residue = query_sequence[index]
+        aligned_pos = index + 1
+        original_pos = original_positions[index]
 
-            # Deletions
-            if query_residue != "-" and "-" in count_dict:
-                del_count = count_dict.get("-", 0)
-                percentage = round((del_count / total_hits) * 100, 2)
-                mutations.append([
-                    aligned_pos, original_pos, query_residue,
-                    "deletion", del_count, total_hits, f"{percentage}%", "Deletion"
-                ])
+        # Deletions
+        if query_residue != "-" and "-" in count_dict:
+            del_count = count_dict.get("-", 0)
+            percentage = round((del_count / total_hits) * 100, 2)
+            mutations.append([
+                aligned_pos, original_pos, query_residue,
+                "deletion", del_count, total_hits, f"{percentage}%", "Deletion"
+            ])
 
-            # Insertions
-            if query_residue == "-":
-                for aa, count in count_dict.items():
-                    if aa != "-":
-                        percentage = round((count / total_hits) * 100, 2)
-                        mutations.append([
-                            aligned_pos, "N/A", "-", f"insertion: {aa}",
-                            count, total_hits, f"{percentage}%", "Insertion"
-                        ])
-
-            # Substitutions
-            if query_residue != "-":
-                filtered_residues = {
-                    aa: count for aa, count in count_dict.items()
-                    if aa != "-" and aa != query_residue
-                }
-                for aa, count in filtered_residues.items():
+        # Insertions
+        if query_residue == "-":
+            for aa, count in count_dict.items():
+                if aa != "-":
                     percentage = round((count / total_hits) * 100, 2)
-                    substitution_type = get_substitution_type(query_residue, aa)
                     mutations.append([
-                        aligned_pos, original_pos, query_residue, aa,
-                        count, total_hits, f"{percentage}%", substitution_type
+                        aligned_pos, "N/A", "-", f"insertion: {aa}",
+                        count, total_hits, f"{percentage}%", "Insertion"
                     ])
 
+        # Substitutions
+        if query_residue != "-":
+            filtered_residues = {
+                aa: count for aa, count in count_dict.items()
+                if aa != "-" and aa != query_residue
+            }
+            for aa, count in filtered_residues.items():
+                percentage = round((count / total_hits) * 100, 2)
+                substitution_type = get_substitution_type(query_residue, aa)
+                mutations.append([
+                    aligned_pos, original_pos, query_residue, aa,
+                    count, total_hits, f"{percentage}%", substitution_type
+                ])
+
+    return mutations, total_hits
+
+
+# Alignment as a (sequences × columns) uint8 matrix, query in row 0
+def load_alignment_matrix(aligned_sequences):
+    width = len(aligned_sequences[0])
+    if any(len(seq) != width for seq in aligned_sequences):
+        raise ValueError("Aligned sequences have different lengths")
+    data = "".join(aligned_sequences).encode("ascii")
+    return np.frombuffer(data, dtype=np.uint8).reshape(len(aligned_sequences), width)
+
+
+# Residue counts per column in a single bincount pass: (columns × 256)
+def column_counts(matrix):
+    n_columns = matrix.shape[1]
+    keys = matrix.astype(np.intp) + np.arange(n_columns, dtype=np.intp) * 256
+    return np.bincount(keys.ravel(), minlength=n_columns * 256).reshape(n_columns, 256)
+
+
+# NumPy column-profile engine; produces exactly the rows of find_mutations_dicts.
+# aligned_offset / original_offset shift the reported positions when the matrix is a
+# slice of a wider alignment.
+def find_mutations(matrix, aligned_offset=0, original_offset=0):
+    n_sequences, n_columns = matrix.shape
+    total_hits = n_sequences - 1
+    query = matrix[0]
+    query_gap = query == GAP
+    original_positions = original_offset + np.cumsum(~query_gap)
+    counts = column_counts(matrix)
+
+    # Every residue seen in a column other than the query residue is a mutation:
+    # '-' under a residue is a deletion, a residue under '-' an insertion, anything else a substitution
+    present = counts > 0
+    present[np.arange(n_columns), query] = False
+    columns, residues = np.nonzero(present)
+    insertion = query_gap[columns]
+    deletion = ~insertion & (residues == GAP)
+
+    # Original row order: by column, deletion first, then residues in order of first appearance
+    first_row = (matrix[:, columns] == residues).argmax(axis=0)
+    order = np.lexsort((first_row, ~deletion, columns))
+
+    # Only the output rows are built in Python, from plain lists
+    columns, residues = columns[order], residues[order]
+    rows = zip(
+        (aligned_offset + columns + 1).tolist(),
+        original_positions[columns].tolist(),
+        query[columns].tolist(),
+        residues.tolist(),
+        counts[columns, residues].tolist(),
+        insertion[order].tolist(),
+        deletion[order].tolist(),
+    )
+
+    mutations = []
+    for aligned_pos, original_pos, query_code, residue_code, count, is_insertion, is_deletion in rows:
+        percentage = round((count / total_hits) * 100, 2)
+        aa = chr(residue_code)
+
+        if is_insertion:
+            mutations.append([
+                aligned_pos, "N/A", "-", f"insertion: {aa}",
+                count, total_hits, f"{percentage}%", "Insertion"
+            ])
+            continue
+
+        query_residue = chr(query_code)
+        if is_deletion:
+            mutations.append([
+                aligned_pos, original_pos, query_residue,
+                "deletion", count, total_hits, f"{percentage}%", "Deletion"
+            ])
+        else:
+            mutations.append([
+                aligned_pos, original_pos, query_residue, aa,
+                count, total_hits, f"{percentage}%", get_substitution_type(query_residue, aa)
+            ])
+
+    return mutations, total_hits
+
+
+# MSA_<protein_id>.faa / MSA_<protein_id>.csv -> protein_id
+def protein_id_from_msa(filename):
+    return filename.replace("MSA_", "").replace(".faa", "").replace(".csv", "")
+
+
+# Write a CSV through a temp file in the same folder, so a crash never leaves a truncated file
+def write_csv_atomic(path, header, rows):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, mode="w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(header)
+        writer.writerows(rows)
+    os.replace(tmp_path, path)
+
+
+# Streaming mode: the MSA is read in column tiles straight from the file (msa_tiles.py) and each
+# tile's rows go to the CSV as soon as they are found, so memory is bounded by
+# sequences × tile_columns instead of the alignment width. Tiles are cut on column boundaries and
+# find_mutations orders rows by column, so the output is identical to the in-memory path.
+# Returns (mutation count, total hits, rows kept when keep_rows), or None for an empty file.
+def stream_msa_mutations(msa_path, output_path=None, tile_columns=TILE_COLUMNS, keep_rows=False):
+    from msa_tiles import MSALayout
+
+    with MSALayout(msa_path) as layout:
+        if not len(layout):
+            return None
+        total_hits = len(layout) - 1
+        n_mutations = 0
+        kept = []
+        tmp_path = f"{output_path}.{os.getpid()}.tmp" if output_path else None
+        file = open(tmp_path, mode="w", newline="") if tmp_path else None
+        try:
+            writer = csv.writer(file) if file else None
+            if writer:
+                writer.writerow(MUTATION_CSV_HEADER)
+            original_offset = 0
+            for start, tile in layout.tiles(tile_columns):
+                mutations, _ = find_mutations(tile, aligned_offset=start, original_offset=original_offset)
+                original_offset += int(np.count_nonzero(tile[0] != GAP))
+                n_mutations += len(mutations)
+                if writer:
+                    writer.writerows(mutations)
+                if keep_rows:
+                    kept.extend(mutations)
+        except BaseException:
+            if file:
+                file.close()
+                os.remove(tmp_path)
+            raise
+        if file:
+            file.close()
+            # As with the in-memory path, the CSV only exists when there are mutations
+            if n_mutations:
+                os.replace(tmp_path, output_path)
+            else:
+                os.remove(tmp_path)
+    return n_mutations, total_hits, kept
+
+
+# Process a single MSA file: writes its mutation CSV (if any and a folder is given)
+# and returns (summary row, mutation rows); (None, []) for an empty file.
+# With carriers=True a third item holds the MSA's (strains, carrier matrix), see strain_bitsets.py.
+# With tile_columns set the MSA is streamed (stream_msa_mutations); carriers need the whole
+# matrix and always take the in-memory path, as do MSAs without fixed-width lines.
+def extract_msa_mutations(msa_path, mutation_folder=None, carriers=False, tile_columns=None, keep_rows=True):
+    msa_filename = os.path.basename(msa_path)
+    with telemetry.span("06", "extract_msa_mutations", item=msa_filename, reads=[msa_path]) as record:
+        with telemetry.profiled("06", "extract_msa_mutations"):
+            result = None
+            if tile_columns and not carriers:
+                result = _stream_msa_mutations(msa_path, mutation_folder, tile_columns, keep_rows)
+            if result is None:
+                result = _extract_msa_mutations(msa_path, mutation_folder, carriers)
+        if mutation_folder is not None and result[0] and result[0][2]:
+            record["writes"] = [os.path.join(mutation_folder, msa_filename.replace(".faa", ".csv"))]
+    return result
+
+
+def _stream_msa_mutations(msa_path, mutation_folder, tile_columns, keep_rows):
+    # None (fall back to the in-memory path) for ragged line layouts
+    from msa_tiles import IrregularLayoutError
+
+    msa_filename = os.path.basename(msa_path)
+    output_path = None
+    if mutation_folder is not None:
+        output_path = os.path.join(mutation_folder, msa_filename.replace(".faa", ".csv"))
+    try:
+        streamed = stream_msa_mutations(msa_path, output_path, tile_columns, keep_rows)
+    except IrregularLayoutError:
+        return None
+    if streamed is None:
+        return None, []
+
+    n_mutations, total_hits, mutations = streamed
+    if n_mutations:
+        print(f"Processed: {msa_filename} → mutations")
+        return [msa_filename, "Mutations found", n_mutations , total_hits], mutations
+    return [msa_filename, "No mutations found", 0 , total_hits], mutations
+
+
+def _extract_msa_mutations(msa_path, mutation_folder, carriers):
+    from Bio import SeqIO
+
+    msa_filename = os.path.basename(msa_path)
+
+    with open(msa_path, "r") as handle:
+        records = list(SeqIO.parse(handle, "fasta"))
+        if not records:
+            return (None, [], ([], None)) if carriers else (None, [])
+        aligned_sequences = [str(record.seq) for record in records]
+
+    matrix = load_alignment_matrix(aligned_sequences)
+    mutations, total_hits = find_mutations(matrix)
+
+    if mutations:
+        summary_row = [msa_filename, "Mutations found", len(mutations) , total_hits]
+
         # Write mutation CSV only if mutations found
-        if mutations:
+        if mutation_folder is not None:
             csv_filename = msa_filename.replace(".faa", ".csv")
             output_path = os.path.join(mutation_folder, csv_filename)
-            summary_log.append([msa_filename, "Mutations found", len(mutations) , total_hits])
-
-            with open(output_path, mode="w", newline="") as file:
-                writer = csv.writer(file)
-                writer.writerow([
-                    "Aligned Position", "Original Position", "Query Residue",
-                    "Mutation Type / Mutated Residue", "Count", "Total Sequences",
-                    "Percentage", "Substitution Type"
-                ])
-                writer.writerows(mutations)
 
-            print(f"Processed: {msa_filename} → mutations")
-        else:
-            # Log non-mutated proteins
-            summary_log.append([msa_filename, "No mutations found", 0 , total_hits])
+            write_csv_atomic(output_path, MUTATION_CSV_HEADER, mutations)
+
+        print(f"Processed: {msa_filename} → mutations")
+    else:
+        # Log non-mutated proteins
+        summary_row = [msa_filename, "No mutations found", 0 , total_hits]
+
+    if carriers:
+        from strain_bitsets import msa_carriers
+
+        return summary_row, mutations, msa_carriers([record.description for record in records], matrix, mutations)
+    return summary_row, mutations
+
+
+def process_msa_file(msa_path, mutation_folder, tile_columns=None):
+    return extract_msa_mutations(msa_path, mutation_folder, tile_columns=tile_columns, keep_rows=False)[0]
+
+
+def write_mutation_summary(summary_log, summary_path):
+    write_csv_atomic(summary_path, SUMMARY_CSV_HEADER, summary_log)
+
+
+# Main processing function.
+# With store_root set, all mutation rows also go to the columnar store (mutation_store.py)
+# under the given replicon partition; write_csvs=False then skips the per-protein CSVs.
+# With bitset_path set, the strains carrying each mutation are saved there (strain_bitsets.py),
+# in the bit order of `strains` (e.g. the data_summary.tsv accessions) when given.
+# With tile_columns set, each MSA is streamed in column tiles of that width (see stream_msa_mutations).
+def extract_mutations(msa_folder, output_root_folder, workers=1, store_root=None, replicon=REPLICONS[0],
+                      write_csvs=True, bitset_path=None, strains=None, tile_columns=None):
+    mutation_folder = os.path.join(output_root_folder, "mutations")
+    if write_csvs:
+        os.makedirs(mutation_folder, exist_ok=True)
+    else:
+        mutation_folder = None
+
+    # Sorted so the summary order does not depend on the filesystem or on worker timing
+    msa_paths = [
+        os.path.join(msa_folder, msa_filename)
+        for msa_filename in sorted(os.listdir(msa_folder))
+        if msa_filename.endswith(".faa")
+    ]
+
+    # Mutation rows only travel back from the workers when the store or the bitsets need them
+    if bitset_path is not None:
+        task = partial(extract_msa_mutations, carriers=True)
+    elif store_root is not None:
+        task = partial(extract_msa_mutations, tile_columns=tile_columns)
+    else:
+        task = partial(process_msa_file, tile_columns=tile_columns)
+
+    if workers > 1:
+        # One MSA per task; map() hands results back in input order
+        chunksize = max(1, len(msa_paths) // (workers * 8))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(task, msa_paths, repeat(mutation_folder), chunksize=chunksize))
+    else:
+        results = [task(msa_path, mutation_folder) for msa_path in msa_paths]
+
+    if store_root is not None:
+        from mutation_store import MutationStoreWriter
+
+        store = MutationStoreWriter(store_root, replicon)
+        for summary_row, mutations, *_ in results:
+            if mutations:
+                store.add(protein_id_from_msa(summary_row[0]), mutations)
+        print(f"Mutation store written to: {store.write()}")
+
+    if bitset_path is not None:
+        from strain_bitsets import StrainBitsetWriter
+
+        bitsets = StrainBitsetWriter(strains)
+        for summary_row, mutations, (msa_strains, carriers) in results:
+            if mutations:
+                bitsets.add(protein_id_from_msa(summary_row[0]), mutations, msa_strains, carriers)
+        print(f"Strain bitsets written to: {bitsets.write(bitset_path)}")
+
+    if store_root is not None or bitset_path is not None:
+        results = [result[0] for result in results]
+
+    summary_log = [summary_row for summary_row in results if summary_row is not None]
 
     # Write final summary
     summary_path = os.path.join(output_root_folder, "mutation_summary.csv")
-    with open(summary_path, mode="w", newline="") as summary_file:
-        writer = csv.writer(summary_file)
-        writer.writerow(["MSA File", "Status", "Number of Mutations" , "Total_hits"])
-        writer.writerows(summary_log)
+    write_mutation_summary(summary_log, summary_path)
 
     print(f"\nMutation summary written to: {summary_path}")
 
-# Run script with user input
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Extract substitutions, insertions and deletions from MSA files.",
+                                     fromfile_prefix_chars="@")
+    parser.add_argument("msa_folder", help="Folder containing MSA (.faa) files")
+    parser.add_argument("output_folder", help="Output folder for the mutation results")
+    parser.add_argument("--workers", type=int, default=1, help="Parallel worker processes")
+    parser.add_argument("--store", dest="store_root", help="Also write the columnar mutation store here")
+    parser.add_argument("--replicon", default=REPLICONS[0], help="Store partition for these mutations")
+    parser.add_argument("--no-csvs", dest="write_csvs", action="store_false", help="Skip the per-protein CSVs")
+    parser.add_argument("--bitsets", dest="bitset_path", help="Also save per-mutation strain bitsets (.npz)")
+    parser.add_argument("--strains-tsv", help="data_summary.tsv fixing the strain order of the bitsets")
+    parser.add_argument("--tile-columns", type=int, nargs="?", const=TILE_COLUMNS,
+                        help=f"Stream each MSA in column tiles of this width (default {TILE_COLUMNS}); "
+                             "bounds memory for very wide alignments")
+    telemetry.add_trace_arguments(parser)
+    args = parser.parse_args(argv)
+
+    telemetry.start_trace(args)
+
+    strains = None
+    if args.strains_tsv:
+        from merge_genome_proteins_01 import read_assembly_accessions
+        strains = read_assembly_accessions(args.strains_tsv)
+
+    extract_mutations(args.msa_folder, args.output_folder, workers=args.workers, store_root=args.store_root,
+                      replicon=args.replicon, write_csvs=args.write_csvs, bitset_path=args.bitset_path,
+                      strains=strains, tile_columns=args.tile_columns)
+    telemetry.finish_trace(args)
+
+
+# Run script with command-line arguments
 if __name__ == "__main__":
-    msa_input_folder = input("Enter path to your folder containing MSA (.faa) files: ").strip()
-    output_folder = input("Enter path for output folder to store mutation results: ").strip()
-    extract_mutations(msa_input_folder, output_folder)
\ No newline at end of file
+    main()
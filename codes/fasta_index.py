@@ -0,0 +1,210 @@
+import os
+import mmap
+
+
+# Persistent header -> byte span index for a large FASTA file (e.g. all_genomes.faa).
+# The index is written next to the FASTA as "<fasta>.idx" and is rebuilt
+# automatically when the FASTA size or modification time changes.
+#
+# Index file layout (tab separated):
+#   #fasta_index<TAB><fasta size><TAB><fasta mtime_ns>
+#   <header><TAB><byte offset><TAB><byte length>
+#   ...
+# One line per record; offset/length cover the whole record (header line included),
+# so a record can be copied verbatim with a single slice of the memory-mapped file.
+
+INDEX_MAGIC = "#fasta_index"
+
+
+def iter_fasta(handle):
+    # Minimal FASTA reader yielding (description, sequence), same fields as SeqRecord.description / str(seq)
+    description = None
+    chunks = []
+    for line in handle:
+        if line.startswith(">"):
+            if description is not None:
+                yield description, "".join(chunks)
+            description = line[1:].rstrip()
+            chunks = []
+        elif description is not None:
+            chunks.append(line.strip())
+    if description is not None:
+        yield description, "".join(chunks)
+
+
+class QueryIndex:
+    # Query FASTA loaded once into lookup tables, so each BLAST query_def resolves in constant time.
+    # Plain dicts only: the index pickles cheaply and is handed read-only to pool workers.
+    def __init__(self, query_fasta):
+        self.query_fasta = query_fasta
+        self.records = {}  # id -> (description, sequence)
+        self.by_description = {}  # full description line -> id
+        self.by_title = {}  # description without the leading id -> id
+        self._substring_matches = {}
+
+        with open(query_fasta, "r") as handle:
+            for description, sequence in iter_fasta(handle):
+                parts = description.split(None, 1)
+                query_id = parts[0] if parts else ""
+                # First record wins, as with the old "scan and break" lookup
+                self.records.setdefault(query_id, (description, sequence))
+                self.by_description.setdefault(description, query_id)
+                if len(parts) == 2:
+                    self.by_title.setdefault(parts[1], query_id)
+
+    def __len__(self):
+        return len(self.records)
+
+    def find_id(self, query_def):
+        if not query_def:
+            return None
+        # Exact matches: BLAST XML query def, tabular qseqid, or a defline parsed into ID + def
+        for table in (self.by_description, self.records, self.by_title):
+            if query_def in table:
+                return query_def if table is self.records else table[query_def]
+        # Fallback: first description containing query_def (memoized)
+        if query_def not in self._substring_matches:
+            self._substring_matches[query_def] = next(
+                (query_id for query_id, (description, _) in self.records.items() if query_def in description),
+                None,
+            )
+        return self._substring_matches[query_def]
+
+    def lookup(self, query_def):
+        # Returns (query_id, sequence), or (None, None) when the query is unknown
+        query_id = self.find_id(query_def)
+        if query_id is None:
+            return None, None
+        return query_id, self.records[query_id][1]
+
+
+class FastaIndex:
+    def __init__(self, fasta_file, index_file=None):
+        self.fasta_file = fasta_file
+        self.index_file = index_file or f"{fasta_file}.idx"
+        self.entries = {}  # header -> list of (offset, length), duplicates kept in file order
+        self._handle = None
+        self._mmap = None
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __len__(self):
+        return sum(len(spans) for spans in self.entries.values())
+
+    def __contains__(self, header):
+        return header in self.entries
+
+    def _fasta_stamp(self):
+        stat = os.stat(self.fasta_file)
+        return str(stat.st_size), str(stat.st_mtime_ns)
+
+    def load_or_build(self):
+        if not self.load():
+            self.build()
+        return self
+
+    def load(self):
+        if not os.path.exists(self.index_file):
+            return False
+
+        with open(self.index_file, "r") as handle:
+            stamp = handle.readline().rstrip("\n").split("\t")
+            if stamp != [INDEX_MAGIC, *self._fasta_stamp()]:
+                return False
+
+            entries = {}
+            for line in handle:
+                header, offset, length = line.rstrip("\n").rsplit("\t", 2)
+                entries.setdefault(header, []).append((int(offset), int(length)))
+
+        self.entries = entries
+        return True
+
+    def build(self):
+        entries = {}
+        header = None
+        start = 0
+        offset = 0
+
+        with open(self.fasta_file, "rb") as handle:
+            for line in handle:
+                if line.startswith(b">"):
+                    if header is not None:
+                        entries.setdefault(header, []).append((start, offset - start))
+                    header = line[1:].decode().strip()
+                    start = offset
+                offset += len(line)
+            if header is not None:
+                entries.setdefault(header, []).append((start, offset - start))
+
+        self.entries = entries
+        self.save()
+
+    def extend(self, start):
+        # Index only the records appended from byte `start` on (the FASTA size the index was current for)
+        header = None
+        record_start = offset = start
+
+        with open(self.fasta_file, "rb") as handle:
+            handle.seek(start)
+            for line in handle:
+                if line.startswith(b">"):
+                    if header is not None:
+                        self.entries.setdefault(header, []).append((record_start, offset - record_start))
+                    header = line[1:].decode().strip()
+                    record_start = offset
+                offset += len(line)
+            if header is not None:
+                self.entries.setdefault(header, []).append((record_start, offset - record_start))
+
+        self.save()
+
+    def save(self):
+        tmp_file = f"{self.index_file}.tmp"
+        with open(tmp_file, "w") as handle:
+            handle.write("\t".join([INDEX_MAGIC, *self._fasta_stamp()]) + "\n")
+            for header, spans in self.entries.items():
+                for offset, length in spans:
+                    handle.write(f"{header}\t{offset}\t{length}\n")
+        os.replace(tmp_file, self.index_file)
+
+    def open(self):
+        if self._handle is not None:
+            return
+        self.load_or_build()
+        self._handle = open(self.fasta_file, "rb")
+        # mmap cannot map an empty file
+        if os.path.getsize(self.fasta_file) > 0:
+            self._mmap = mmap.mmap(self._handle.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+
+    def spans(self, headers):
+        # Set-based lookup, returned in FASTA file order so output matches a linear scan
+        spans = []
+        for header in set(headers):
+            spans.extend(self.entries.get(header, ()))
+        return sorted(spans)
+
+    def fetch(self, header):
+        self.open()
+        return [self._mmap[offset:offset + length] for offset, length in self.entries.get(header, ())]
+
+    def write_records(self, handle, headers):
+        # Copy the raw records for the given headers into a text handle; returns records written
+        self.open()
+        spans = self.spans(headers)
+        for offset, length in spans:
+            handle.write(self._mmap[offset:offset + length].decode())
+        return len(spans)
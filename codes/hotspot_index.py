@@ -0,0 +1,398 @@
+import os
+import sys
+import csv
+import time
+import sqlite3
+import argparse
+
+# Position-level mutation index: every stage 06 row of a run in one SQLite file (stdlib, no server),
+# keyed by (replicon, protein, original position), with aggregates computed once at build time:
+#   mutations    one row per stage 06 CSV row; indexed by protein + original position and by
+#                class / substitution type
+#   proteins     per protein: category / enzyme type (stage 11 rules on the stage 10 Hit Def),
+#                substitution / conservative / non-conservative / insertion / deletion counts,
+#                conservative ratio, densest window
+#   positions    per (protein, original position): variants, strains carrying a mutation there
+#                (sum of counts, also split by class / substitution type), the mutated residues,
+#                and the protein's labels
+#   substitutions  per (category, enzyme type, query residue, mutated residue, class): positions, strains
+#   windows      sliding-window density per protein: mutation rows whose original position falls
+#                in [start, start + window) divided by the window size; windows overlap by half
+#                and only windows holding mutations are stored. Insertions have no original
+#                position and are left out of the windows.
+#   categories   the protein aggregates summed per category / enzyme type
+# Each build replaces one replicon in a single transaction; queries read indexed tables only.
+
+WINDOW_SIZE = 10
+INDEX_NAME = "hotspots.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS mutations (
+    replicon TEXT, protein_id TEXT, aligned_position INTEGER, original_position INTEGER,
+    query_residue TEXT, mutated_residue TEXT, mutation_class TEXT, substitution_type TEXT,
+    count INTEGER, total_sequences INTEGER, percentage REAL);
+CREATE INDEX IF NOT EXISTS mutations_position ON mutations (protein_id, original_position);
+CREATE INDEX IF NOT EXISTS mutations_type ON mutations (mutation_class, substitution_type);
+CREATE INDEX IF NOT EXISTS mutations_replicon ON mutations (replicon);
+CREATE TABLE IF NOT EXISTS proteins (
+    replicon TEXT, protein_id TEXT, category TEXT, enzyme_type TEXT, definition TEXT,
+    mutations INTEGER, substitutions INTEGER, conservative INTEGER, non_conservative INTEGER,
+    insertions INTEGER, deletions INTEGER, conservative_ratio REAL,
+    max_density REAL, max_density_start INTEGER,
+    PRIMARY KEY (replicon, protein_id));
+CREATE INDEX IF NOT EXISTS proteins_category ON proteins (category);
+CREATE INDEX IF NOT EXISTS proteins_enzyme ON proteins (enzyme_type);
+CREATE TABLE IF NOT EXISTS positions (
+    replicon TEXT, protein_id TEXT, original_position INTEGER, query_residue TEXT,
+    variants INTEGER, strains INTEGER, residues TEXT, category TEXT, enzyme_type TEXT,
+    substitution_strains INTEGER, conservative_strains INTEGER, non_conservative_strains INTEGER,
+    deletion_strains INTEGER,
+    PRIMARY KEY (replicon, protein_id, original_position));
+CREATE INDEX IF NOT EXISTS positions_strains ON positions (strains, variants);
+CREATE INDEX IF NOT EXISTS positions_category ON positions (category, strains);
+CREATE INDEX IF NOT EXISTS positions_enzyme ON positions (enzyme_type, strains);
+CREATE TABLE IF NOT EXISTS substitutions (
+    replicon TEXT, category TEXT, enzyme_type TEXT, query_residue TEXT, mutated_residue TEXT,
+    mutation_class TEXT, substitution_type TEXT, positions INTEGER, strains INTEGER);
+CREATE TABLE IF NOT EXISTS windows (
+    replicon TEXT, protein_id TEXT, window_start INTEGER, window_end INTEGER,
+    mutations INTEGER, density REAL);
+CREATE INDEX IF NOT EXISTS windows_protein ON windows (protein_id, window_start);
+CREATE INDEX IF NOT EXISTS windows_density ON windows (density);
+CREATE TABLE IF NOT EXISTS categories (
+    replicon TEXT, label_table TEXT, label TEXT, proteins INTEGER,
+    mutations INTEGER, substitutions INTEGER, conservative INTEGER, non_conservative INTEGER,
+    insertions INTEGER, deletions INTEGER, conservative_ratio REAL, max_density REAL,
+    PRIMARY KEY (replicon, label_table, label));
+"""
+
+# Strain column of the positions table for a class / substitution type filter
+POSITION_STRAINS = {
+    ("substitution", None): "substitution_strains",
+    ("substitution", "Conservative"): "conservative_strains",
+    ("substitution", "Non-Conservative"): "non_conservative_strains",
+    (None, "Conservative"): "conservative_strains",
+    (None, "Non-Conservative"): "non_conservative_strains",
+    ("deletion", None): "deletion_strains",
+    ("deletion", "Deletion"): "deletion_strains",
+    (None, "Deletion"): "deletion_strains",
+}
+
+AGGREGATES = ["mutations", "substitutions", "conservative", "non_conservative", "insertions", "deletions"]
+
+
+def connect(db_path, read_only=False):
+    # Queries open the index read-only, so a mistyped path fails instead of creating an empty file
+    if read_only:
+        connection = sqlite3.connect(f"file:{os.path.abspath(db_path)}?mode=ro", uri=True)
+    else:
+        connection = sqlite3.connect(db_path)
+    connection.row_factory = sqlite3.Row
+    return connection
+
+
+def conservative_ratio(conservative, non_conservative):
+    # Share of conservative substitutions; None without substitutions
+    substitutions = conservative + non_conservative
+    return round(conservative / substitutions, 4) if substitutions else None
+
+
+def sliding_windows(positions, window=WINDOW_SIZE):
+    # positions: original positions of one protein's mutation rows (1-based, repeats allowed)
+    # -> [(start, end, mutations, density)] for half-overlapping windows holding mutations
+    import numpy as np
+
+    if not positions:
+        return []
+    positions = np.sort(np.asarray(positions, dtype=np.int64))
+    starts = np.arange(1, positions[-1] + 1, max(1, window // 2))
+    counts = np.searchsorted(positions, starts + window, side="left") - np.searchsorted(positions, starts)
+    keep = counts > 0
+    return [(start, start + window - 1, count, round(count / window, 4))
+            for start, count in zip(starts[keep].tolist(), counts[keep].tolist())]
+
+
+def read_protein_labels(summary_csv, rules_file):
+    # {protein_id: (category, enzyme type, definition)} with the stage 11 rules
+    from categorize_proteins_11 import RuleMatcher, load_category_rules
+
+    rules = load_category_rules(rules_file)
+    matchers = {table: RuleMatcher(rules[table]) for table in ("category", "enzyme")}
+    labels = {}
+    with open(summary_csv, newline="") as f:
+        for row in csv.DictReader(f):
+            hit_def = row.get("Hit Def")
+            definition = hit_def if hit_def and hit_def != "Unknown" else row.get("Reference_Def", "")
+            labels[row["Protein_Id"]] = (matchers["category"].classify(definition),
+                                         matchers["enzyme"].classify(definition), definition)
+    return labels
+
+
+def build_hotspot_index(db_path, mutation_folder, replicon, summary_csv=None, rules_file=None,
+                        window=WINDOW_SIZE):
+    # Loads one replicon's stage 06 CSVs (and labels from the stage 10 summary, when given)
+    from mutation_store import row_to_record
+    from extract_mutations_06 import protein_id_from_msa
+
+    labels = {}
+    if summary_csv and os.path.exists(summary_csv):
+        from categorize_proteins_11 import DEFAULT_RULES
+        labels = read_protein_labels(summary_csv, rules_file or DEFAULT_RULES)
+
+    os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+    connection = connect(db_path)
+    try:
+        with connection:
+            connection.executescript(SCHEMA)
+            for table in ("mutations", "proteins", "positions", "substitutions", "windows", "categories"):
+                connection.execute(f"DELETE FROM {table} WHERE replicon = ?", (replicon,))
+            connection.execute("INSERT OR REPLACE INTO meta VALUES ('window_size', ?)", (str(window),))
+
+            # === Step 1: Mutation rows, per-protein counts and windows ===
+            label_totals = {}
+            n_rows = 0
+            for csv_filename in sorted(os.listdir(mutation_folder)):
+                if not (csv_filename.startswith("MSA_") and csv_filename.endswith(".csv")):
+                    continue  # per-protein stage 06 tables only, not mutation_summary.csv
+                protein_id = protein_id_from_msa(csv_filename)
+                with open(os.path.join(mutation_folder, csv_filename), newline="") as f:
+                    reader = csv.reader(f)
+                    next(reader, None)  # skip header
+                    records = [row_to_record(protein_id, row) for row in reader]
+
+                connection.executemany(
+                    "INSERT INTO mutations VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(replicon, protein_id, r["aligned_position"], r["original_position"], r["query_residue"],
+                      r["mutated_residue"], r["mutation_class"], r["substitution_type"], r["count"],
+                      r["total_sequences"], r["percentage"]) for r in records])
+                n_rows += len(records)
+
+                classes = [r["mutation_class"] for r in records]
+                conservative = sum(r["substitution_type"] == "Conservative" for r in records)
+                totals = {
+                    "mutations": len(records),
+                    "substitutions": classes.count("substitution"),
+                    "conservative": conservative,
+                    "non_conservative": classes.count("substitution") - conservative,
+                    "insertions": classes.count("insertion"),
+                    "deletions": classes.count("deletion"),
+                }
+                windows = sliding_windows([r["original_position"] for r in records
+                                           if r["original_position"] is not None], window)
+                connection.executemany("INSERT INTO windows VALUES (?, ?, ?, ?, ?, ?)",
+                                       [(replicon, protein_id, *w) for w in windows])
+                densest = max(windows, key=lambda w: w[3], default=(None, None, 0, 0.0))
+
+                category, enzyme_type, definition = labels.get(protein_id, (None, None, None))
+                connection.execute(
+                    "INSERT INTO proteins VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (replicon, protein_id, category, enzyme_type, definition,
+                     *[totals[name] for name in AGGREGATES],
+                     conservative_ratio(totals["conservative"], totals["non_conservative"]),
+                     densest[3], densest[0]))
+
+                for label_table, label in (("category", category), ("enzyme", enzyme_type)):
+                    if label is None:
+                        continue
+                    total = label_totals.setdefault((label_table, label), dict.fromkeys(AGGREGATES, 0))
+                    total["proteins"] = total.get("proteins", 0) + 1
+                    total["max_density"] = max(total.get("max_density", 0.0), densest[3])
+                    for name in AGGREGATES:
+                        total[name] += totals[name]
+
+            # === Step 2: Position and substitution type aggregates, labels copied from the proteins ===
+            connection.execute("""
+                INSERT INTO positions
+                SELECT m.replicon, m.protein_id, m.original_position, MIN(m.query_residue), COUNT(*),
+                       SUM(m.count), GROUP_CONCAT(m.mutated_residue, ''), p.category, p.enzyme_type,
+                       SUM(CASE WHEN m.mutation_class = 'substitution' THEN m.count ELSE 0 END),
+                       SUM(CASE WHEN m.substitution_type = 'Conservative' THEN m.count ELSE 0 END),
+                       SUM(CASE WHEN m.substitution_type = 'Non-Conservative' THEN m.count ELSE 0 END),
+                       SUM(CASE WHEN m.mutation_class = 'deletion' THEN m.count ELSE 0 END)
+                FROM mutations m JOIN proteins p ON p.replicon = m.replicon AND p.protein_id = m.protein_id
+                WHERE m.replicon = ? AND m.original_position IS NOT NULL
+                GROUP BY m.protein_id, m.original_position""", (replicon,))
+            connection.execute("""
+                INSERT INTO substitutions
+                SELECT m.replicon, p.category, p.enzyme_type, m.query_residue, m.mutated_residue,
+                       m.mutation_class, m.substitution_type, COUNT(*), SUM(m.count)
+                FROM mutations m JOIN proteins p ON p.replicon = m.replicon AND p.protein_id = m.protein_id
+                WHERE m.replicon = ?
+                GROUP BY p.category, p.enzyme_type, m.query_residue, m.mutated_residue, m.mutation_class""",
+                               (replicon,))
+
+            # === Step 3: Category / enzyme aggregates ===
+            connection.executemany(
+                "INSERT INTO categories VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(replicon, label_table, label, total["proteins"], *[total[name] for name in AGGREGATES],
+                  conservative_ratio(total["conservative"], total["non_conservative"]), total["max_density"])
+                 for (label_table, label), total in sorted(label_totals.items())])
+    finally:
+        connection.close()
+    print(f"Hotspot index: {n_rows} mutation rows of {replicon} → {db_path}")
+    return n_rows
+
+
+def _where(conditions):
+    clauses = [clause for clause, value in conditions if value is not None]
+    params = [value for clause, value in conditions if value is not None]
+    return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+
+def query(db_path, sql, params=()):
+    connection = connect(db_path, read_only=True)
+    try:
+        return [dict(row) for row in connection.execute(sql, params)]
+    finally:
+        connection.close()
+
+
+# Hottest original positions across the selected proteins, by strains carrying a mutation there
+# (only strains with a mutation of the given class / substitution type, when filtered).
+# Insertions have no original position, so an insertion filter returns nothing.
+def hot_positions(db_path, replicon=None, category=None, enzyme_type=None, protein_id=None,
+                  mutation_class=None, substitution_type=None, limit=20):
+    if mutation_class is None and substitution_type is None:
+        strains = "strains"
+    elif (mutation_class, substitution_type) in POSITION_STRAINS:
+        strains = POSITION_STRAINS[(mutation_class, substitution_type)]
+    else:
+        return []
+    where, params = _where([("replicon = ?", replicon), ("category = ?", category),
+                            ("enzyme_type = ?", enzyme_type), ("protein_id = ?", protein_id)])
+    where += (" AND " if where else " WHERE ") + f"{strains} > 0"
+    return query(db_path, f"""
+        SELECT replicon, protein_id, original_position, query_residue, variants, {strains} AS strains,
+               residues, category, enzyme_type
+        FROM positions{where} ORDER BY {strains} DESC, variants DESC LIMIT ?""", params + [limit])
+
+
+# Substitution / indel types most frequent across the selected proteins
+def hot_substitutions(db_path, replicon=None, category=None, enzyme_type=None, limit=20):
+    where, params = _where([("replicon = ?", replicon), ("category = ?", category),
+                            ("enzyme_type = ?", enzyme_type)])
+    return query(db_path, f"""
+        SELECT query_residue, mutated_residue, mutation_class, substitution_type,
+               SUM(positions) AS positions, SUM(strains) AS strains
+        FROM substitutions{where}
+        GROUP BY query_residue, mutated_residue, mutation_class
+        ORDER BY positions DESC, strains DESC LIMIT ?""", params + [limit])
+
+
+# Densest sliding windows
+def hot_windows(db_path, replicon=None, category=None, enzyme_type=None, protein_id=None, limit=20):
+    where, params = _where([("w.replicon = ?", replicon), ("p.category = ?", category),
+                            ("p.enzyme_type = ?", enzyme_type), ("w.protein_id = ?", protein_id)])
+    return query(db_path, f"""
+        SELECT w.replicon, w.protein_id, w.window_start, w.window_end, w.mutations, w.density, p.category
+        FROM windows w JOIN proteins p ON p.replicon = w.replicon AND p.protein_id = w.protein_id
+        {where}
+        ORDER BY w.density DESC, w.protein_id, w.window_start LIMIT ?""", params + [limit])
+
+
+# Mutation rows of one protein, optionally within [start, end] original positions
+def protein_mutations(db_path, protein_id, start=None, end=None, replicon=None):
+    where, params = _where([("replicon = ?", replicon), ("protein_id = ?", protein_id),
+                            ("original_position >= ?", start), ("original_position <= ?", end)])
+    return query(db_path, f"SELECT * FROM mutations{where} ORDER BY replicon, aligned_position", params)
+
+
+def protein_aggregates(db_path, replicon=None, category=None, enzyme_type=None, protein_id=None, limit=20):
+    where, params = _where([("replicon = ?", replicon), ("category = ?", category),
+                            ("enzyme_type = ?", enzyme_type), ("protein_id = ?", protein_id)])
+    return query(db_path, f"SELECT * FROM proteins{where} ORDER BY mutations DESC, protein_id LIMIT ?",
+                 params + [limit])
+
+
+def category_aggregates(db_path, label_table="category", replicon=None):
+    where, params = _where([("label_table = ?", label_table), ("replicon = ?", replicon)])
+    return query(db_path, f"SELECT * FROM categories{where} ORDER BY mutations DESC, label", params)
+
+
+def write_rows(rows, file=sys.stdout):
+    if not rows:
+        return
+    writer = csv.writer(file)
+    writer.writerow(rows[0].keys())
+    for row in rows:
+        writer.writerow(row.values())
+
+
+def run_query(args):
+    # Rows of one query subcommand
+    if args.command == "positions":
+        return hot_positions(args.db, args.replicon, args.category, args.enzyme_type, args.protein_id,
+                             args.mutation_class, args.substitution_type, args.limit)
+    elif args.command == "substitutions":
+        return hot_substitutions(args.db, args.replicon, args.category, args.enzyme_type, args.limit)
+    elif args.command == "windows":
+        return hot_windows(args.db, args.replicon, args.category, args.enzyme_type, args.protein_id, args.limit)
+    elif args.command == "proteins":
+        return protein_aggregates(args.db, args.replicon, args.category, args.enzyme_type, args.protein_id,
+                                  args.limit)
+    elif args.command == "categories":
+        return category_aggregates(args.db, args.table, args.replicon)
+    else:
+        return protein_mutations(args.db, args.protein_id, args.start, args.end, args.replicon)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build and query the position-level mutation hotspot index.",
+                                     fromfile_prefix_chars="@")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build = subparsers.add_parser("build", help="Index one replicon's stage 06 mutations/ folder")
+    build.add_argument("db")
+    build.add_argument("mutation_folder")
+    build.add_argument("--replicon", required=True)
+    build.add_argument("--summary", help="mutation_summary_with_hit_defs.csv (stage 10) for the categories")
+    build.add_argument("--rules", help="Category rules file (default: stage 11 rules)")
+    build.add_argument("--window", type=int, default=WINDOW_SIZE, help="Sliding window size in residues")
+
+    queries = {
+        "positions": "Hottest original positions",
+        "substitutions": "Most frequent substitution / indel types",
+        "windows": "Densest sliding windows",
+        "proteins": "Per-protein aggregates",
+        "categories": "Per-category / enzyme type aggregates",
+        "mutations": "Mutation rows of one protein",
+    }
+    for name, help_text in queries.items():
+        sub = subparsers.add_parser(name, help=help_text)
+        sub.add_argument("db")
+        sub.add_argument("--replicon")
+        if name == "categories":
+            sub.add_argument("--table", choices=["category", "enzyme"], default="category")
+            continue
+        if name == "mutations":
+            sub.add_argument("protein_id")
+            sub.add_argument("--start", type=int)
+            sub.add_argument("--end", type=int)
+            continue
+        sub.add_argument("--category")
+        sub.add_argument("--enzyme", dest="enzyme_type")
+        sub.add_argument("--limit", type=int, default=20)
+        if name != "substitutions":
+            sub.add_argument("--protein", dest="protein_id")
+        if name == "positions":
+            sub.add_argument("--class", dest="mutation_class", choices=["substitution", "deletion", "insertion"])
+            sub.add_argument("--substitution-type")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        build_hotspot_index(args.db, args.mutation_folder, args.replicon, args.summary, args.rules, args.window)
+        return
+
+    start = time.perf_counter()
+    try:
+        rows = run_query(args)
+    except sqlite3.OperationalError as e:
+        print(f"Error: cannot query {args.db}: {e}", file=sys.stderr)
+        sys.exit(1)
+    write_rows(rows)
+    print(f"{len(rows)} rows in {(time.perf_counter() - start) * 1000:.1f} ms", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import os
+import time
+import heapq
+import asyncio
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+
+import telemetry
+
+# asyncio job scheduler for external tools and Python work under one core budget.
+# blastp / mafft run as asyncio subprocesses; Python stage functions (stage 04 filtering,
+# stage 06 extraction) run in a process pool. Every job first takes its cores from the shared
+# CoreBudget, so tools and Python work together never use more than `cores` CPUs.
+# Waiting jobs are served by priority (lower first), then in arrival order; run_pipeline.py
+# gives later stages the lower numbers, so a query that finished BLAST moves on to filtering,
+# MAFFT and extraction before new BLAST jobs start.
+#
+# A tool exiting non-zero (or failing to start) is retried up to `retries` times with a growing
+# delay; its stderr is kept. Jobs that still fail are collected in the scheduler's failures
+# list, reported at the end and written to a TSV.
+
+RETRIES = 2
+RETRY_DELAY = 2.0  # seconds, times the attempt number
+STDERR_TAIL = 2000  # characters of stderr kept per failure
+
+FAILURE_HEADER = ["stage", "item", "attempts", "returncode", "error"]
+
+
+class CoreBudget:
+    def __init__(self, cores):
+        self.cores = cores
+        self.free = cores
+        self._waiters = []  # heap of (priority, arrival, cores, future)
+        self._arrival = itertools.count()
+
+    async def acquire(self, cores, priority=0):
+        cores = min(cores, self.cores)  # a job asking for more than the budget runs alone
+        if not self._waiters and self.free >= cores:
+            self.free -= cores
+            return cores
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._arrival), cores, future))
+        await future
+        return cores
+
+    def release(self, cores):
+        self.free += cores
+        # Strict priority order: the head waiter blocks smaller jobs behind it, so big jobs never starve
+        while self._waiters and self._waiters[0][2] <= self.free:
+            _, _, cores, future = heapq.heappop(self._waiters)
+            if future.cancelled():
+                continue
+            self.free -= cores
+            future.set_result(None)
+
+    def waiting(self):
+        return len(self._waiters)
+
+
+class JobFailed(Exception):
+    def __init__(self, stage, item, attempts, returncode, error):
+        super().__init__(f"{stage} {item}: failed after {attempts} attempt(s) (exit code {returncode}): {error}")
+        self.row = [stage, item, attempts, returncode, error]
+
+
+class JobScheduler:
+    def __init__(self, cores, retries=RETRIES, retry_delay=RETRY_DELAY):
+        self.budget = CoreBudget(max(1, cores))
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.failures = []  # FAILURE_HEADER rows
+        self._pool = None
+
+    def __enter__(self):
+        self._pool = ProcessPoolExecutor(max_workers=self.budget.cores)
+        return self
+
+    def __exit__(self, *exc):
+        self._pool.shutdown()
+        self._pool = None
+
+    async def run_tool(self, cmd, stage, item, cores=1, priority=0, stdout_path=None):
+        # Runs cmd with `cores` of the budget; stdout goes to stdout_path (written through a temp file,
+        # replaced only on success) or is discarded. Raises JobFailed once the retries are used up.
+        returncode, error = None, ""
+        for attempt in range(1, self.retries + 2):
+            if attempt > 1:
+                await asyncio.sleep(self.retry_delay * (attempt - 1))
+            granted = await self.budget.acquire(cores, priority)
+            telemetry.queue_depth("scheduler", "waiting_jobs", self.budget.waiting())
+            try:
+                returncode, error = await self._run_once(cmd, stage, item, attempt, stdout_path)
+            finally:
+                self.budget.release(granted)
+            if returncode == 0:
+                return attempt
+            print(f"[{stage}] {item}: {os.path.basename(cmd[0])} attempt {attempt} failed "
+                  f"(exit code {returncode}){': ' + error.strip().splitlines()[-1] if error.strip() else ''}")
+        raise JobFailed(stage, item, self.retries + 1, returncode, error.strip()[-STDERR_TAIL:])
+
+    async def _run_once(self, cmd, stage, item, attempt, stdout_path):
+        tmp_path = f"{stdout_path}.{os.getpid()}.tmp" if stdout_path else None
+        start = time.perf_counter()
+        try:
+            out = open(tmp_path, "wb") if tmp_path else asyncio.subprocess.DEVNULL
+            try:
+                process = await asyncio.create_subprocess_exec(*cmd, stdout=out, stderr=asyncio.subprocess.PIPE)
+                _, stderr = await process.communicate()
+            finally:
+                if tmp_path:
+                    out.close()
+            returncode, error = process.returncode, stderr.decode(errors="replace")
+        except OSError as e:  # e.g. the tool is not installed
+            returncode, error = None, str(e)
+        telemetry.emit("subprocess", stage=stage, item=item, command=os.path.basename(cmd[0]),
+                       wall_s=round(time.perf_counter() - start, 6), returncode=returncode, attempt=attempt)
+
+        if tmp_path:
+            if returncode == 0:
+                os.replace(tmp_path, stdout_path)
+            elif os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return returncode, error
+
+    async def run_python(self, function, *args, stage, item, priority=0):
+        # function(*args) in the process pool with one core of the budget; exceptions become JobFailed
+        await self.budget.acquire(1, priority)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._pool, function, *args)
+        except Exception as e:
+            raise JobFailed(stage, item, 1, None, f"{type(e).__name__}: {e}") from e
+        finally:
+            self.budget.release(1)
+
+    def record_failure(self, failure):
+        self.failures.append(failure.row)
+        print(f"FAILED {failure}")
+
+
+def write_failure_report(failures, path):
+    # Tab-separated FAILURE_HEADER rows; removes a stale report when everything succeeded
+    if not failures:
+        if os.path.exists(path):
+            os.remove(path)
+        return None
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write("\t".join(FAILURE_HEADER) + "\n")
+        for row in failures:
+            f.write("\t".join(" ".join(str(value).split()) for value in row) + "\n")
+    os.replace(tmp_path, path)
+    return path
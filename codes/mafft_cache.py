@@ -0,0 +1,90 @@
+import os
+import shutil
+import hashlib
+import subprocess
+
+# Content-addressed cache of MAFFT alignments. The key is the SHA-256 of the MAFFT version,
+# the alignment options and the input FASTA bytes, so an identical input aligned the same way
+# is copied from the cache instead of being realigned. Entries live in
+# <cache_dir>/<key[:2]>/<key>.faa; a cache hit refreshes the entry's mtime and the oldest
+# entries are evicted once the cache grows past max_bytes.
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "klebsiella_mafft")
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+_mafft_version = None
+
+
+def mafft_version():
+    # "v7.490 (2021/Oct/30)", printed on stderr; looked up once per process
+    global _mafft_version
+    if _mafft_version is None:
+        result = subprocess.run(["mafft", "--version"], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        _mafft_version = (result.stderr or result.stdout).strip()
+    return _mafft_version
+
+
+class AlignmentCache:
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, version=None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.version = version  # defaults to the installed mafft's version on first use
+        self._size = None  # total bytes on disk, computed on first store
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def key(self, input_path, options):
+        sha = hashlib.sha256()
+        sha.update((self.version or mafft_version()).encode())
+        sha.update(b"\0" + "\0".join(options).encode() + b"\0")
+        with open(input_path, "rb") as handle:
+            for chunk in iter(lambda: handle.read(1 << 20), b""):
+                sha.update(chunk)
+        return sha.hexdigest()
+
+    def entry_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.faa")
+
+    def fetch(self, key, output_path):
+        # Copy a cached alignment to output_path; False on a miss
+        entry = self.entry_path(key)
+        if not os.path.exists(entry):
+            return False
+        tmp_path = f"{output_path}.tmp"
+        shutil.copyfile(entry, tmp_path)
+        os.replace(tmp_path, output_path)
+        os.utime(entry)  # mark as recently used
+        return True
+
+    def store(self, key, msa_path):
+        entry = self.entry_path(key)
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        previous_size = os.path.getsize(entry) if os.path.exists(entry) else 0  # overwritten, not added
+        tmp_path = f"{entry}.{os.getpid()}.tmp"
+        shutil.copyfile(msa_path, tmp_path)
+        os.replace(tmp_path, entry)
+
+        if self._size is None:
+            self._size = sum(size for _, size, _ in self._entries())
+        else:
+            self._size += os.path.getsize(entry) - previous_size
+        if self._size > self.max_bytes:
+            self.evict()
+
+    def _entries(self):
+        for folder in os.scandir(self.cache_dir):
+            if not folder.is_dir():
+                continue
+            for entry in os.scandir(folder.path):
+                if entry.name.endswith(".faa"):
+                    stat = entry.stat()
+                    yield entry.path, stat.st_size, stat.st_mtime
+
+    def evict(self):
+        # Least recently used first, until the cache is back under max_bytes
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        self._size = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if self._size <= self.max_bytes:
+                break
+            os.remove(path)
+            self._size -= size
@@ -0,0 +1,153 @@
+import os
+import csv
+import glob
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from fasta_index import FastaIndex
+
+# Builds the combined strain proteome (all_genomes.faa) from the NCBI datasets download, driven by
+# strains_details/data_summary.tsv. Every header gets its assembly accession as first token
+# (">GCA_002156725.1 WP_... protein name"), as the awk script in awk_fasta_header_editing_01.sh does.
+#
+# The merge is incremental: "<fasta>.assemblies" lists each assembly already appended with its byte
+# range, so a rerun after adding strains to the TSV only appends the new ones and extends the
+# "<fasta>.idx" offset index (fasta_index.py) from the old end of file instead of rebuilding it.
+# Bytes past the last recorded assembly (an interrupted append) are truncated before appending.
+
+SUMMARY_TSV = os.path.join("strains_details", "data_summary.tsv")
+DATA_DIR = os.path.join("ncbi_dataset", "ncbi_dataset", "data")
+OUTPUT_FASTA = "all_genomes.faa"
+ACCESSION_COLUMN = "Assembly Accession"
+
+
+def read_assembly_accessions(summary_tsv):
+    accessions = []
+    with open(summary_tsv, newline="") as f:
+        for row in csv.DictReader(f, delimiter="\t"):
+            accession = (row.get(ACCESSION_COLUMN) or "").strip()
+            if accession and accession not in accessions:
+                accessions.append(accession)
+    return accessions
+
+
+def find_protein_file(data_dir, accession):
+    matches = sorted(glob.glob(os.path.join(data_dir, accession, "*protein.faa")))
+    return matches[0] if matches else None
+
+
+def tag_protein_file(protein_file, accession):
+    # Whole file in one read; every header line gets the accession prepended
+    with open(protein_file, "rb") as f:
+        data = f.read()
+    if not data:
+        return data
+    if not data.endswith(b"\n"):
+        data += b"\n"
+    tag = b">" + accession.encode() + b" "
+    data = data.replace(b"\n>", b"\n" + tag)
+    if data.startswith(b">"):
+        data = tag + data[1:]
+    return data
+
+
+def load_assembly_list(list_file):
+    # accession -> (offset, length, source file), in append order
+    assemblies = {}
+    if os.path.exists(list_file):
+        with open(list_file) as f:
+            for line in f:
+                accession, offset, length, source = line.rstrip("\n").split("\t")
+                assemblies[accession] = (int(offset), int(length), source)
+    return assemblies
+
+
+def save_assembly_list(list_file, assemblies):
+    tmp_file = f"{list_file}.tmp"
+    with open(tmp_file, "w") as f:
+        for accession, (offset, length, source) in assemblies.items():
+            f.write(f"{accession}\t{offset}\t{length}\t{source}\n")
+    os.replace(tmp_file, list_file)
+
+
+def merge_genome_proteins(summary_tsv, data_dir, output_fasta, workers=4):
+    list_file = f"{output_fasta}.assemblies"
+    assemblies = load_assembly_list(list_file)
+
+    if not os.path.exists(output_fasta):
+        open(output_fasta, "wb").close()
+        assemblies = {}
+    elif os.path.exists(list_file):
+        # Drop anything an interrupted run appended after the last recorded assembly
+        committed = max((offset + length for offset, length, _ in assemblies.values()), default=0)
+        if os.path.getsize(output_fasta) != committed:
+            with open(output_fasta, "r+b") as f:
+                f.truncate(committed)
+
+    index = FastaIndex(output_fasta).load_or_build()
+    if not os.path.exists(list_file):
+        # A FASTA merged earlier (e.g. by the awk script): take the accessions from its headers
+        for header, spans in index.entries.items():
+            accession = header.split(None, 1)[0] if header else ""
+            for offset, length in spans:
+                first, last, _ = assemblies.get(accession, (offset, 0, "existing"))
+                first = min(first, offset)
+                assemblies[accession] = (first, max(first + last, offset + length) - first, "existing")
+    start = os.path.getsize(output_fasta)
+
+    accessions = read_assembly_accessions(summary_tsv)
+    new_accessions = [a for a in accessions if a not in assemblies]
+    protein_files = {a: find_protein_file(data_dir, a) for a in new_accessions}
+    missing = [a for a in new_accessions if protein_files[a] is None]
+    to_add = [a for a in new_accessions if protein_files[a] is not None]
+    print(f"{len(accessions)} assemblies listed, {len(assemblies)} already merged, "
+          f"{len(to_add)} to add, {len(missing)} without a protein file")
+    for accession in missing:
+        print(f"  No *protein.faa found for {accession} in {data_dir}")
+
+    # Files are read and tagged in parallel; appends happen in TSV order from this thread only
+    offset = start
+    with ThreadPoolExecutor(max_workers=workers) as executor, open(output_fasta, "ab") as out:
+        tagged = executor.map(lambda a: tag_protein_file(protein_files[a], a), to_add)
+        for i, (accession, data) in enumerate(zip(to_add, tagged), 1):
+            out.write(data)
+            assemblies[accession] = (offset, len(data), protein_files[accession])
+            offset += len(data)
+            print(f"[{i}/{len(to_add)}] {accession}: {data.count(b'>')} proteins")
+
+    if to_add:
+        save_assembly_list(list_file, assemblies)
+        index.extend(start)
+    elif not os.path.exists(list_file):
+        save_assembly_list(list_file, assemblies)
+
+    print(f"Merged FASTA saved as: {output_fasta} ({len(index)} proteins indexed)")
+    return to_add, missing
+
+
+def build_blast_db(fasta_file, db_name):
+    result = subprocess.run(["makeblastdb", "-in", fasta_file, "-dbtype", "prot", "-out", db_name],
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"makeblastdb failed ({result.returncode}): {result.stderr.strip()}")
+    print(f"BLAST database written to: {db_name}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Merge per-assembly protein FASTAs into one accession-tagged FASTA.",
+                                     fromfile_prefix_chars="@")
+    parser.add_argument("--summary", default=SUMMARY_TSV, help="NCBI data_summary.tsv with an 'Assembly Accession' column")
+    parser.add_argument("--data-dir", default=DATA_DIR, help="Folder holding one <accession>/ folder per assembly")
+    parser.add_argument("--output", default=OUTPUT_FASTA)
+    parser.add_argument("--workers", type=int, default=4, help="Files read and tagged in parallel")
+    parser.add_argument("--blast-db", help="Also (re)build a protein BLAST database with this name")
+    args = parser.parse_args(argv)
+
+    added, _ = merge_genome_proteins(args.summary, args.data_dir, args.output, workers=args.workers)
+    if args.blast_db and (added or not glob.glob(f"{args.blast_db}.p*")):
+        build_blast_db(args.output, args.blast_db)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import os
+import mmap
+
+import numpy as np
+
+
+# Column-tile reader for aligned FASTA files too large to hold as Python strings.
+# One pass over the memory-mapped file records a faidx-style layout per sequence:
+#   sequence byte offset, residues per line, bytes per line (terminator included), aligned length
+# Columns [start, stop) of every sequence are then byte slices of the mapping, so a tile costs
+# (sequences × tile width) bytes however wide the alignment is.
+# MAFFT writes fixed-width lines; a record with ragged lines (other than a shorter last line)
+# raises IrregularLayoutError and the caller falls back to the in-memory path.
+
+LINE_ENDINGS = b"\r\n"
+
+
+class IrregularLayoutError(ValueError):
+    pass
+
+
+class MSALayout:
+    def __init__(self, msa_path):
+        self.msa_path = msa_path
+        offsets, line_widths, line_bytes, lengths = [], [], [], []
+
+        size = os.path.getsize(msa_path)
+        self._file = open(msa_path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+        try:
+            self._read_layout(size, offsets, line_widths, line_bytes, lengths)
+        except Exception:
+            self.close()
+            raise
+
+        self.offsets = np.array(offsets, dtype=np.int64)
+        self.line_widths = np.array(line_widths, dtype=np.int64)
+        self.line_bytes = np.array(line_bytes, dtype=np.int64)
+        self.width = lengths[0] if lengths else 0
+        if any(length != self.width for length in lengths):
+            self.close()
+            raise ValueError("Aligned sequences have different lengths")
+
+    def _read_layout(self, size, offsets, line_widths, line_bytes, lengths):
+        # === Step 1: One pass over the lines, one layout entry per record ===
+        msa_path = self.msa_path
+        record = None  # [sequence offset, line width, line bytes, length, last line seen]
+        position = 0
+        while position < size:
+            end = self._map.find(b"\n", position)
+            end = size if end < 0 else end + 1
+            line = self._map[position:end]
+            residues = len(line.rstrip(LINE_ENDINGS))
+
+            if line.startswith(b">"):
+                if record is not None:
+                    self._close_record(record, offsets, line_widths, line_bytes, lengths)
+                record = [end, 0, 0, 0, False]
+            elif record is not None:
+                if record[4] or (record[1] and residues > record[1]) or not residues:
+                    raise IrregularLayoutError(f"{msa_path}: ragged sequence lines, no fixed layout")
+                if not record[1]:
+                    record[1], record[2] = residues, len(line)
+                elif residues < record[1] or len(line) != record[2]:
+                    record[4] = True  # only the last line may be short
+                record[3] += residues
+            position = end
+        if record is not None:
+            self._close_record(record, offsets, line_widths, line_bytes, lengths)
+
+    @staticmethod
+    def _close_record(record, offsets, line_widths, line_bytes, lengths):
+        offsets.append(record[0])
+        line_widths.append(max(record[1], 1))
+        line_bytes.append(max(record[2], 1))
+        lengths.append(record[3])
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def byte_positions(self, column):
+        # Byte offset of aligned column `column` (0-based) in every record
+        lines, within = np.divmod(column, self.line_widths)
+        return self.offsets + lines * self.line_bytes + within
+
+    def tile(self, start, stop):
+        # (sequences × (stop - start)) uint8 matrix of columns [start, stop), query in row 0
+        tile = np.empty((len(self), stop - start), dtype=np.uint8)
+        first = self.byte_positions(start).tolist()
+        last = self.byte_positions(stop - 1).tolist()
+        for row, (begin, end) in enumerate(zip(first, last)):
+            tile[row] = np.frombuffer(self._map[begin:end + 1].translate(None, LINE_ENDINGS), dtype=np.uint8)
+        return tile
+
+    def tiles(self, tile_columns):
+        # (first column, tile) over the whole alignment, left to right
+        for start in range(0, self.width, tile_columns):
+            yield start, self.tile(start, min(start + tile_columns, self.width))
+
+    def close(self):
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,236 @@
+import os
+import csv
+import sys
+import argparse
+
+# Optional columnar mutation store: one Parquet table per replicon, hive-partitioned as
+#   <store_root>/replicon=chromosomal/mutations.parquet
+#   <store_root>/replicon=plasmid/mutations.parquet
+# holding the rows of every per-protein stage 06 CSV with typed columns. Rows are sorted by
+# protein and position, so filters on protein_id / positions / classes are pushed down to the
+# Parquet row-group statistics instead of opening thousands of small CSV files.
+# Needs pyarrow (pip install pyarrow), imported only where used; the per-protein CSVs remain the
+# default output.
+
+from extract_mutations_06 import MUTATION_CSV_HEADER, protein_id_from_msa, write_csv_atomic
+
+STORE_FILE_NAME = "mutations.parquet"
+ROW_GROUP_SIZE = 64 * 1024
+
+COLUMNS = [
+    "protein_id", "aligned_position", "original_position", "query_residue", "mutated_residue",
+    "mutation_class", "substitution_type", "count", "total_sequences", "percentage",
+]
+
+
+def require_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError("The mutation store needs pyarrow: pip install pyarrow") from None
+
+
+def mutation_schema():
+    require_pyarrow()
+    import pyarrow as pa
+
+    return pa.schema([
+        ("protein_id", pa.string()),
+        ("aligned_position", pa.int32()),
+        ("original_position", pa.int32()),  # null for insertions
+        ("query_residue", pa.string()),
+        ("mutated_residue", pa.string()),  # "-" for deletions
+        ("mutation_class", pa.dictionary(pa.int8(), pa.string())),  # substitution / deletion / insertion
+        ("substitution_type", pa.dictionary(pa.int8(), pa.string())),
+        ("count", pa.int32()),
+        ("total_sequences", pa.int32()),
+        ("percentage", pa.float64()),
+    ])
+
+
+# One stage 06 row ([aligned, original, query, "X" / "deletion" / "insertion: X", count, total, "P%", type])
+# -> typed record
+def row_to_record(protein_id, row):
+    aligned_pos, original_pos, query_residue, mutation, count, total, percentage, substitution_type = row
+    if mutation == "deletion":
+        mutation_class, mutated_residue = "deletion", "-"
+    elif str(mutation).startswith("insertion: "):
+        mutation_class, mutated_residue = "insertion", mutation[len("insertion: "):]
+    else:
+        mutation_class, mutated_residue = "substitution", mutation
+
+    return {
+        "protein_id": protein_id,
+        "aligned_position": int(aligned_pos),
+        "original_position": None if original_pos in ("N/A", None) else int(original_pos),
+        "query_residue": query_residue,
+        "mutated_residue": mutated_residue,
+        "mutation_class": mutation_class,
+        "substitution_type": substitution_type,
+        "count": int(count),
+        "total_sequences": int(total),
+        "percentage": float(str(percentage).rstrip("%")),
+    }
+
+
+# Typed record -> stage 06 CSV row (inverse of row_to_record)
+def record_to_row(record):
+    if record["mutation_class"] == "deletion":
+        mutation = "deletion"
+    elif record["mutation_class"] == "insertion":
+        mutation = f"insertion: {record['mutated_residue']}"
+    else:
+        mutation = record["mutated_residue"]
+    original_pos = "N/A" if record["original_position"] is None else record["original_position"]
+
+    return [record["aligned_position"], original_pos, record["query_residue"], mutation,
+            record["count"], record["total_sequences"], f"{record['percentage']}%", record["substitution_type"]]
+
+
+def partition_path(store_root, replicon):
+    return os.path.join(store_root, f"replicon={replicon}", STORE_FILE_NAME)
+
+
+class MutationStoreWriter:
+    # Collects mutation rows per protein and writes the replicon partition in one go
+    def __init__(self, store_root, replicon):
+        require_pyarrow()
+        self.store_root = store_root
+        self.replicon = replicon
+        self.columns = {name: [] for name in COLUMNS}
+
+    def add(self, protein_id, mutations):
+        for row in mutations:
+            for name, value in row_to_record(protein_id, row).items():
+                self.columns[name].append(value)
+
+    def write(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        table = pa.table(self.columns, schema=mutation_schema())
+        table = table.sort_by([("protein_id", "ascending"), ("aligned_position", "ascending")])
+
+        path = partition_path(self.store_root, self.replicon)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Dot-prefixed temp name: dataset discovery ignores it, so readers never see a partial file
+        tmp_path = os.path.join(os.path.dirname(path), f".{STORE_FILE_NAME}.{os.getpid()}.tmp")
+        pq.write_table(table, tmp_path, row_group_size=ROW_GROUP_SIZE)
+        os.replace(tmp_path, path)
+        return path
+
+
+# Load existing stage 06 CSVs (mutations/MSA_<id>.csv) into the store
+def build_store_from_csvs(mutation_folder, store_root, replicon):
+    writer = MutationStoreWriter(store_root, replicon)
+    for csv_filename in sorted(os.listdir(mutation_folder)):
+        if not (csv_filename.startswith("MSA_") and csv_filename.endswith(".csv")):
+            continue  # per-protein stage 06 tables only, not mutation_summary.csv
+        with open(os.path.join(mutation_folder, csv_filename), newline="") as f:
+            reader = csv.reader(f)
+            next(reader, None)  # skip header
+            writer.add(protein_id_from_msa(csv_filename), list(reader))
+    return writer.write()
+
+
+def open_store(store_root):
+    require_pyarrow()
+    import pyarrow.dataset as ds
+
+    return ds.dataset(store_root, format="parquet", partitioning="hive")
+
+
+# Filtered read; every argument narrows the scan before any data is materialized.
+# Extra pyarrow expressions (e.g. ds.field("count") >= 10) can be passed as `where`.
+def read_mutations(store_root, replicon=None, protein_ids=None, mutation_class=None,
+                   substitution_type=None, min_count=None, where=None, columns=None):
+    dataset = open_store(store_root)
+    import pyarrow.dataset as ds
+
+    expression = None
+
+    def add(condition):
+        nonlocal expression
+        expression = condition if expression is None else expression & condition
+
+    if replicon is not None:
+        add(ds.field("replicon") == replicon)
+    if protein_ids is not None:
+        add(ds.field("protein_id").isin(list(protein_ids)))
+    if mutation_class is not None:
+        add(ds.field("mutation_class") == mutation_class)
+    if substitution_type is not None:
+        add(ds.field("substitution_type") == substitution_type)
+    if min_count is not None:
+        add(ds.field("count") >= min_count)
+    if where is not None:
+        add(where)
+
+    return dataset.to_table(filter=expression, columns=columns)
+
+
+# Number of mutation rows per protein (what stage 06 reports as "Number of Mutations")
+def mutation_counts(store_root, replicon=None):
+    import pyarrow.compute as pc
+
+    table = read_mutations(store_root, replicon=replicon, columns=["protein_id"])
+    counts = pc.value_counts(table["protein_id"])
+    return {item["values"].as_py(): item["counts"].as_py() for item in counts}
+
+
+# Write per-protein CSVs identical to the stage 06 output from the store
+def export_csvs(store_root, replicon, output_folder, protein_ids=None):
+    os.makedirs(output_folder, exist_ok=True)
+    table = read_mutations(store_root, replicon=replicon, protein_ids=protein_ids, columns=COLUMNS)
+
+    rows_by_protein = {}
+    for record in table.to_pylist():
+        rows_by_protein.setdefault(record["protein_id"], []).append(record_to_row(record))
+
+    for protein_id, rows in rows_by_protein.items():
+        write_csv_atomic(os.path.join(output_folder, f"MSA_{protein_id}.csv"), MUTATION_CSV_HEADER, rows)
+    return len(rows_by_protein)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build, query and export the columnar mutation store.",
+                                     fromfile_prefix_chars="@")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build = subparsers.add_parser("build", help="Load a stage 06 mutations/ folder into the store")
+    build.add_argument("mutation_folder")
+    build.add_argument("store_root")
+    build.add_argument("--replicon", required=True)
+
+    export = subparsers.add_parser("export", help="Write per-protein CSVs from the store")
+    export.add_argument("store_root")
+    export.add_argument("output_folder")
+    export.add_argument("--replicon", required=True)
+    export.add_argument("--protein", nargs="+", dest="protein_ids")
+
+    query = subparsers.add_parser("query", help="Print matching mutation rows as CSV")
+    query.add_argument("store_root")
+    query.add_argument("--replicon")
+    query.add_argument("--protein", nargs="+", dest="protein_ids")
+    query.add_argument("--class", dest="mutation_class", choices=["substitution", "deletion", "insertion"])
+    query.add_argument("--substitution-type")
+    query.add_argument("--min-count", type=int)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        print(f"Mutation store written to: {build_store_from_csvs(args.mutation_folder, args.store_root, args.replicon)}")
+    elif args.command == "export":
+        count = export_csvs(args.store_root, args.replicon, args.output_folder, args.protein_ids)
+        print(f"{count} protein CSVs written to: {args.output_folder}")
+    else:
+        table = read_mutations(args.store_root, args.replicon, args.protein_ids, args.mutation_class,
+                               args.substitution_type, args.min_count, columns=COLUMNS)
+        writer = csv.writer(sys.stdout)
+        writer.writerow(COLUMNS)
+        for record in table.to_pylist():
+            writer.writerow([record[name] for name in COLUMNS])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+import os
+import hashlib
+import numpy as np
+
+# Shared by the plotting stages (08, 09) and plot_figures_batch.py.
+# KDE curves are computed here with NumPy (Gaussian kernel, Scott's bandwidth, 200 points over
+# data range ± 3 bandwidths, as seaborn.kdeplot draws them) and cached by the data's hash, in memory
+# and optionally in a folder of .npz files, so reruns and batch jobs never refit the same data.
+
+KDE_GRIDSIZE = 200
+KDE_CUT = 3
+
+_kde_memory = {}
+
+
+def gaussian_kde_curve(values, gridsize=KDE_GRIDSIZE, cut=KDE_CUT):
+    # (support, density) of a 1-D Gaussian KDE; None for fewer than 2 points or zero variance
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) < 2 or values.std() == 0:
+        return None
+
+    bandwidth = values.std(ddof=1) * len(values) ** (-1 / 5)  # Scott's rule
+    support = np.linspace(values.min() - cut * bandwidth, values.max() + cut * bandwidth, gridsize)
+    density = np.zeros(gridsize)
+    for start in range(0, len(values), 4096):  # bounded (4096 × gridsize) temporaries
+        z = (support[:, None] - values[None, start:start + 4096]) / bandwidth
+        density += np.exp(-0.5 * z * z).sum(axis=1)
+    density /= len(values) * bandwidth * np.sqrt(2 * np.pi)
+    return support, density
+
+
+def cached_kde_curve(values, cache_dir=None, gridsize=KDE_GRIDSIZE, cut=KDE_CUT):
+    values = np.ascontiguousarray(values, dtype=np.float64)
+    key = hashlib.sha256(values.tobytes() + f"{gridsize}:{cut}".encode()).hexdigest()
+    if key in _kde_memory:
+        return _kde_memory[key]
+
+    cache_path = os.path.join(cache_dir, f"{key}.npz") if cache_dir else None
+    if cache_path and os.path.exists(cache_path):
+        with np.load(cache_path) as data:
+            curve = (data["support"], data["density"]) if len(data["support"]) else None
+    else:
+        curve = gaussian_kde_curve(values, gridsize, cut)
+        if cache_path:
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as handle:
+                support, density = curve if curve is not None else (np.empty(0), np.empty(0))
+                np.savez(handle, support=support, density=density)
+            os.replace(tmp_path, cache_path)
+
+    _kde_memory[key] = curve
+    return curve
+
+
+def save_or_show(plt, output_file=None):
+    # output_file: one path, a list of paths (e.g. .png and .svg), or None to show the figure
+    if not output_file:
+        plt.show()
+        return
+    for path in [output_file] if isinstance(output_file, str) else output_file:
+        plt.savefig(path)
+    plt.close()
@@ -0,0 +1,140 @@
+import os
+import glob
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Renders every figure of a run in one command, headless (Agg backend), to PNG and/or SVG:
+#   <replicon>_length_distribution   stage 08 curve from distribution_curve_<replicon>.csv
+#   <replicon>_mutation_pie          stage 09 pie from mutation_summary.csv
+#   <replicon>_categories            mutations per category (stage 11 categorized_protein_csvs/)
+#   <replicon>_enzymes               mutations per enzyme type (stage 11 top_mutated_enzymes/)
+# Figures are independent jobs spread over a process pool; matplotlib is imported once per
+# worker, never in the parent. KDE curves are cached in <output>/kde_cache (plot_common.py).
+
+FORMATS = ["png", "svg"]
+
+
+def _init_plot_worker():
+    import matplotlib
+    matplotlib.use("Agg")
+
+
+def plot_category_bars(folder, pattern, title, output_file):
+    # Horizontal bars: total mutations (and protein count) per category / enzyme CSV
+    import pandas as pd
+    import matplotlib.pyplot as plt
+    from plot_common import save_or_show
+
+    labels, totals, proteins = [], [], []
+    for path in sorted(glob.glob(os.path.join(folder, pattern))):
+        df = pd.read_csv(path)
+        label_column = df.columns[-1]  # Category / Enzyme_Type
+        labels.append(str(df[label_column].iloc[0]) if len(df) else os.path.basename(path))
+        totals.append(int(df["Number of Mutations"].sum()))
+        proteins.append(len(df))
+    order = sorted(range(len(labels)), key=lambda i: totals[i])
+
+    plt.figure(figsize=(10, max(3, 0.35 * len(labels) + 1.5)))
+    bars = plt.barh([labels[i] for i in order], [totals[i] for i in order], color="#FF6F61")
+    for bar, i in zip(bars, order):
+        plt.text(bar.get_width(), bar.get_y() + bar.get_height() / 2, f" {proteins[i]} proteins",
+                 va="center", fontsize=9)
+    plt.title(title)
+    plt.xlabel("Number of Mutations")
+    plt.tight_layout()
+    save_or_show(plt, output_file)
+
+
+def render_figure(job):
+    # Runs in a pool worker; job = (kind, source, title, output files, kde cache folder)
+    kind, source, title, output_files, kde_cache = job
+    if kind == "lengths":
+        from distribution_curve_08 import plot_length_distribution
+        plot_length_distribution(source, output_files, kde_cache=kde_cache)
+    elif kind == "pie":
+        from mutation_pie_chart_09 import plot_mutation_pie
+        plot_mutation_pie(source, title, output_files)
+    elif kind == "categories":
+        plot_category_bars(source, "*.csv", f"Mutations per Protein Category ({title})", output_files)
+    elif kind == "enzymes":
+        plot_category_bars(source, "*_detailed_mutations.csv", f"Mutations per Enzyme Type ({title})", output_files)
+    return output_files
+
+
+def workdir_sources(workdir, replicons):
+    # Inputs in the run_pipeline.py layout: <workdir>/<replicon>/mutation_results/...
+    sources = []
+    for replicon in replicons:
+        results_dir = os.path.join(workdir, replicon, "mutation_results")
+        candidates = [
+            ("lengths", os.path.join(results_dir, f"distribution_curve_{replicon}.csv")),
+            ("pie", os.path.join(results_dir, "mutation_summary.csv")),
+            ("categories", os.path.join(results_dir, "categorized_protein_csvs")),
+            ("enzymes", os.path.join(results_dir, "top_mutated_enzymes")),
+        ]
+        sources.extend((kind, replicon, path) for kind, path in candidates if os.path.exists(path))
+    return sources
+
+
+def plot_all_figures(sources, output_folder, formats=FORMATS, workers=4):
+    # sources: list of (kind, replicon, input path); returns the written files
+    os.makedirs(output_folder, exist_ok=True)
+    kde_cache = os.path.join(output_folder, "kde_cache")
+    names = {"lengths": "length_distribution", "pie": "mutation_pie", "categories": "categories",
+             "enzymes": "enzymes"}
+
+    jobs = []
+    for kind, replicon, path in sources:
+        base = os.path.join(output_folder, f"{replicon}_{names[kind]}")
+        jobs.append((kind, path, replicon, [f"{base}.{fmt}" for fmt in formats], kde_cache))
+
+    written = []
+    failed = 0
+    with ProcessPoolExecutor(max_workers=max(1, min(workers, len(jobs))), initializer=_init_plot_worker) as executor:
+        futures = {executor.submit(render_figure, job): job for job in jobs}
+        for i, future in enumerate(as_completed(futures), 1):
+            kind, path = futures[future][:2]
+            try:
+                output_files = future.result()
+            except Exception as e:  # one bad input (e.g. an empty summary) must not stop the other figures
+                failed += 1
+                print(f"[{i}/{len(jobs)}] Failed to plot {kind} from {path}: {e}")
+                continue
+            written.extend(output_files)
+            print(f"[{i}/{len(jobs)}] {', '.join(output_files)}")
+    if failed:
+        print(f"{failed} figure(s) failed")
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render all chromosome / plasmid / category figures headlessly.",
+                                     fromfile_prefix_chars="@")
+    parser.add_argument("--workdir", help="run_pipeline.py work folder; finds every replicon's inputs")
+    parser.add_argument("--replicons", nargs="+", default=["chromosomal", "plasmid"])
+    parser.add_argument("--lengths", nargs=2, action="append", default=[], metavar=("REPLICON", "CSV"),
+                        help="Stage 07 length table")
+    parser.add_argument("--summary", nargs=2, action="append", default=[], metavar=("REPLICON", "CSV"),
+                        help="Stage 06 mutation_summary.csv")
+    parser.add_argument("--categories", nargs=2, action="append", default=[], metavar=("REPLICON", "FOLDER"),
+                        help="Stage 11 output folder")
+    parser.add_argument("--output", required=True, help="Folder for the figures")
+    parser.add_argument("--formats", nargs="+", choices=FORMATS, default=["png"])
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args(argv)
+
+    sources = workdir_sources(args.workdir, args.replicons) if args.workdir else []
+    sources += [("lengths", replicon, path) for replicon, path in args.lengths]
+    sources += [("pie", replicon, path) for replicon, path in args.summary]
+    for replicon, folder in args.categories:
+        sources.append(("categories", replicon, os.path.join(folder, "categorized_protein_csvs")))
+        sources.append(("enzymes", replicon, os.path.join(folder, "top_mutated_enzymes")))
+    if not sources:
+        parser.error("nothing to plot: give --workdir or at least one input")
+
+    written = plot_all_figures(sources, args.output, args.formats, args.workers)
+    print(f"{len(written)} files written to: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
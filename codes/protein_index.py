@@ -0,0 +1,165 @@
+import os
+import json
+import shutil
+import argparse
+import numpy as np
+
+# Compact, persistent index of a protein FASTA (.faa) for id -> description / length lookups
+# without loading SeqRecords. Built once into "<faa>.pidx/" as NumPy column files:
+#   ids.npy           fixed-width byte strings, sorted (binary search)
+#   lengths.npy       int32 residue counts
+#   offsets.npy       int64 byte offset of each record's header line in the FASTA
+#   desc_offsets.npy  int64 start of each description in desc_blob.npy (n + 1 entries)
+#   desc_blob.npy     uint8 UTF-8 descriptions, concatenated
+#   meta.json         FASTA size / mtime the index was built from
+# All columns are opened with mmap_mode="r", so loading costs milliseconds whatever the proteome size.
+# Duplicate ids keep their last record. The index is rebuilt when the FASTA changes.
+
+INDEX_VERSION = 1
+COLUMNS = ["ids", "lengths", "offsets", "desc_offsets", "desc_blob"]
+
+
+def _fasta_stamp(fasta_file):
+    stat = os.stat(fasta_file)
+    return {"version": INDEX_VERSION, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def build_protein_index(fasta_file, index_dir):
+    records = {}  # id -> (offset, description, length); a later duplicate replaces the earlier one
+    protein_id = None
+    offset = 0
+
+    with open(fasta_file, "rb") as handle:
+        for line in handle:
+            if line.startswith(b">"):
+                if protein_id is not None:
+                    records[protein_id] = (header_offset, description, length)
+                parts = line[1:].strip().split(maxsplit=1)
+                protein_id = parts[0] if parts else b""
+                description = parts[1] if len(parts) == 2 else b""
+                header_offset = offset
+                length = 0
+            elif protein_id is not None:
+                length += len(line.strip().replace(b" ", b""))  # residues, as Bio.SeqIO counts them
+            offset += len(line)
+        if protein_id is not None:
+            records[protein_id] = (header_offset, description, length)
+
+    ids = sorted(records)
+    descriptions = [records[i][1] for i in ids]
+    desc_offsets = np.zeros(len(ids) + 1, dtype=np.int64)
+    np.cumsum([len(d) for d in descriptions], out=desc_offsets[1:])
+
+    columns = {
+        "ids": np.array(ids, dtype=f"S{max((len(i) for i in ids), default=1)}"),
+        "lengths": np.array([records[i][2] for i in ids], dtype=np.int32),
+        "offsets": np.array([records[i][0] for i in ids], dtype=np.int64),
+        "desc_offsets": desc_offsets,
+        "desc_blob": np.frombuffer(b"".join(descriptions), dtype=np.uint8),
+    }
+
+    # Write into a sibling folder and swap it in, so readers never see a half-built index
+    tmp_dir = f"{index_dir}.{os.getpid()}.tmp"
+    os.makedirs(tmp_dir, exist_ok=True)
+    for name, values in columns.items():
+        np.save(os.path.join(tmp_dir, f"{name}.npy"), values)
+    with open(os.path.join(tmp_dir, "meta.json"), "w") as handle:
+        json.dump(_fasta_stamp(fasta_file), handle)
+
+    if os.path.isdir(index_dir):
+        shutil.rmtree(index_dir)
+    os.replace(tmp_dir, index_dir)
+
+
+class ProteinIndex:
+    def __init__(self, fasta_file, index_dir=None):
+        self.fasta_file = fasta_file
+        self.index_dir = index_dir or f"{fasta_file}.pidx"
+        if not self._is_current():
+            build_protein_index(self.fasta_file, self.index_dir)
+
+        for name in COLUMNS:
+            path = os.path.join(self.index_dir, f"{name}.npy")
+            try:
+                values = np.load(path, mmap_mode="r")
+            except ValueError:  # empty columns cannot be memory-mapped
+                values = np.load(path)
+            setattr(self, name, values)
+
+    def _is_current(self):
+        meta_path = os.path.join(self.index_dir, "meta.json")
+        if not os.path.exists(meta_path):
+            return False
+        with open(meta_path) as handle:
+            return json.load(handle) == _fasta_stamp(self.fasta_file)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, protein_id):
+        return self.rows([protein_id])[0] >= 0
+
+    def rows(self, protein_ids):
+        # Row number of each id, -1 where missing (vectorized binary search)
+        keys = np.array([str(p).encode() if isinstance(p, str) else b"" for p in protein_ids])
+        if len(self.ids) == 0 or len(keys) == 0:
+            return np.full(len(keys), -1, dtype=np.int64)
+        rows = np.searchsorted(self.ids, keys)
+        clipped = np.minimum(rows, len(self.ids) - 1)
+        return np.where(self.ids[clipped] == keys, clipped, -1)
+
+    def lengths_for(self, protein_ids, missing=None):
+        rows = self.rows(protein_ids)
+        found = rows >= 0
+        values = np.zeros(len(rows), dtype=np.int64)
+        values[found] = self.lengths[rows[found]]
+        return [value if ok else missing for value, ok in zip(values.tolist(), found.tolist())]
+
+    def descriptions_for(self, protein_ids, missing="Unknown"):
+        descriptions = []
+        for row in self.rows(protein_ids).tolist():
+            if row < 0:
+                descriptions.append(missing)
+                continue
+            start, end = self.desc_offsets[row], self.desc_offsets[row + 1]
+            descriptions.append(bytes(self.desc_blob[start:end]).decode() or missing)
+        return descriptions
+
+    def length(self, protein_id, missing=None):
+        return self.lengths_for([protein_id], missing)[0]
+
+    def description(self, protein_id, missing="Unknown"):
+        return self.descriptions_for([protein_id], missing)[0]
+
+    def sequence(self, protein_id):
+        # Read one sequence back from the FASTA using the stored header offset
+        row = self.rows([protein_id])[0]
+        if row < 0:
+            return None
+        chunks = []
+        with open(self.fasta_file, "rb") as handle:
+            handle.seek(int(self.offsets[row]))
+            handle.readline()  # header
+            for line in handle:
+                if line.startswith(b">"):
+                    break
+                chunks.append(line.strip())
+        return b"".join(chunks).decode()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build (or refresh) the protein index of a .faa file and look up ids.",
+                                     fromfile_prefix_chars="@")
+    parser.add_argument("fasta_file")
+    parser.add_argument("protein_ids", nargs="*")
+    args = parser.parse_args(argv)
+
+    index = ProteinIndex(args.fasta_file)
+    print(f"{len(index)} proteins indexed in {index.index_dir}")
+    for protein_id, length, description in zip(args.protein_ids, index.lengths_for(args.protein_ids),
+                                               index.descriptions_for(args.protein_ids)):
+        print(f"{protein_id}\t{length}\t{description}")
+
+
+if __name__ == "__main__":
+    main()
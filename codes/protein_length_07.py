@@ -1,32 +1,49 @@
-import pandas as pd
-from Bio import SeqIO
+from protein_index import ProteinIndex
 
-# === Step 1: Load the CSV file ===
-input_csv = "chromosomal/mutation_results/mutation_summary.csv"  # <-- replace with your actual filename
-df = pd.read_csv(input_csv)
+# Default file names
+INPUT_CSV = "chromosomal/mutation_results/mutation_summary.csv"
+FASTA_FILE = "chromosomal_proteins.faa"
+OUTPUT_CSV = "distribution_curve_chromosomal.csv"
 
-print(df.columns.tolist())
 
-# === Step 2: Extract ID from 'MSA_File' column ===
-df['id'] = df['MSA File'].str.extract(r'MSA_(.+)\.faa')
+def build_length_table(input_csv, fasta_file, output_csv):
+    import pandas as pd
 
-# === Step 3: Define mutation status based on 'Number of Mutations' ===
-df['mutation_status'] = df['Number of Mutations'].apply(lambda x: 'no mutation' if x == 0 else 'mutation')
+    # === Step 1: Load the CSV file ===
+    df = pd.read_csv(input_csv)
 
-# === Step 4: Load protein sequences from FASTA file ===
-fasta_file = "chromosomal_proteins.faa"  # <-- replace with your actual FASTA file
-seq_records = SeqIO.to_dict(SeqIO.parse(fasta_file, "fasta"))
+    print(df.columns.tolist())
 
-# === Step 5: Get sequence length for each ID ===
-lengths = []
-for pid in df['id']:
-    if pid in seq_records:
-        lengths.append(len(seq_records[pid].seq))
-    else:
-        lengths.append(None)  # Or handle missing IDs as needed
+    # === Step 2: Extract ID from 'MSA_File' column ===
+    df['id'] = df['MSA File'].str.extract(r'MSA_(.+)\.faa')
 
-df['length'] = lengths
+    # === Step 3: Define mutation status based on 'Number of Mutations' ===
+    df['mutation_status'] = df['Number of Mutations'].apply(lambda x: 'no mutation' if x == 0 else 'mutation')
 
-# === Step 6: Write the final output ===
-final_df = df[['id', 'length', 'mutation_status']]
-final_df.to_csv("distribution_curve_chromosomal.csv", index=False)
\ No newline at end of file
+    # === Step 4: Open the protein index of the FASTA file (built on first use, memory-mapped) ===
+    protein_index = ProteinIndex(fasta_file)
+
+    # === Step 5: Get sequence length for each ID ===
+    df['length'] = protein_index.lengths_for(df['id'], missing=None)  # Or handle missing IDs as needed
+
+    # === Step 6: Write the final output ===
+    final_df = df[['id', 'length', 'mutation_status']]
+    final_df.to_csv(output_csv, index=False)
+    return final_df
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Protein length and mutation status table for the length distribution plot.",
+                                     fromfile_prefix_chars="@")
+    parser.add_argument("input_csv", nargs="?", default=INPUT_CSV, help="Stage 06 mutation_summary.csv")
+    parser.add_argument("fasta_file", nargs="?", default=FASTA_FILE, help="Reference protein FASTA (.faa)")
+    parser.add_argument("output_csv", nargs="?", default=OUTPUT_CSV)
+    args = parser.parse_args(argv)
+
+    build_length_table(args.input_csv, args.fasta_file, args.output_csv)
+
+
+if __name__ == "__main__":
+    main()
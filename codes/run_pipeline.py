@@ -0,0 +1,607 @@
+import os
+import json
+import glob
+import asyncio
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from fasta_index import iter_fasta
+from extract_mutations_06 import REPLICONS
+import telemetry
+
+# Resumable driver for stages 02-10. Every unit of work (one BLAST query, one filter run,
+# one MAFFT alignment, one mutation CSV, ...) is a job in pipeline_manifest.json, recorded
+# with the content hashes of its inputs and outputs. A job is skipped when its inputs hash
+# the same as last time and its outputs are still on disk unchanged, so a rerun after adding
+# one query protein or resuming an interrupted run only does the missing work.
+
+MANIFEST_NAME = "pipeline_manifest.json"
+FAILURES_NAME = "failed_jobs.tsv"
+
+# --scheduler async: stages 03-06 run per query under one core budget (job_scheduler.py), each
+# query moving on as soon as its own previous step is done. Later stages go first when cores free up.
+STAGE_PRIORITY = {"06": 0, "05": 1, "04": 2, "03": 3}
+
+
+def text_digest(text):
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def write_query_fasta(temp_dir, query_id, description, sequence):
+    fasta_path = os.path.join(temp_dir, f"{query_id}.fasta")
+    with open(fasta_path, "w") as handle:
+        handle.write(f">{description}\n")
+        for i in range(0, len(sequence), 60):
+            handle.write(sequence[i:i + 60] + "\n")
+    return fasta_path
+
+
+class Manifest:
+    def __init__(self, path):
+        self.path = path
+        self.files = {}  # path -> [size, mtime_ns, sha256], avoids rehashing unchanged files
+        self.jobs = {}  # job key -> {"inputs": {...}, "outputs": {...}, "result": ...}
+        if os.path.exists(path):
+            with open(path) as handle:
+                data = json.load(handle)
+            self.files = data.get("files", {})
+            self.jobs = data.get("jobs", {})
+
+    def digest(self, path):
+        stat = os.stat(path)
+        cached = self.files.get(path)
+        if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            return cached[2]
+
+        sha = hashlib.sha256()
+        with open(path, "rb") as handle:
+            for chunk in iter(lambda: handle.read(1 << 20), b""):
+                sha.update(chunk)
+        self.files[path] = [stat.st_size, stat.st_mtime_ns, sha.hexdigest()]
+        return sha.hexdigest()
+
+    def digest_many(self, paths):
+        return text_digest("\n".join(f"{os.path.basename(p)}:{self.digest(p)}" for p in sorted(paths)))
+
+    def is_current(self, key, inputs):
+        job = self.jobs.get(key)
+        if job is None or job["inputs"] != inputs:
+            return False
+        for path, digest in job["outputs"].items():
+            if not os.path.exists(path) or self.digest(path) != digest:
+                return False
+        return True
+
+    def result(self, key):
+        return self.jobs[key].get("result")
+
+    def record(self, key, inputs, outputs, result=None):
+        self.jobs[key] = {
+            "inputs": inputs,
+            "outputs": {path: self.digest(path) for path in outputs if os.path.exists(path)},
+            "result": result,
+        }
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as handle:
+            json.dump({"files": self.files, "jobs": self.jobs}, handle)
+        os.replace(tmp_path, self.path)
+
+
+class PipelineRunner:
+    def __init__(self, reference_fasta, genomes_fasta, blast_db, workdir, threads=4,
+                 replicons=REPLICONS, force=False, plots=False, mafft_strategy="auto", mafft_cache=None,
+                 prefilter=False, hit_thresholds=None, tile_columns=None, hotspots=False, scheduler="stages"):
+        self.reference_fasta = reference_fasta  # Reference proteome (.faa) with all query proteins
+        self.genomes_fasta = genomes_fasta  # Combined FASTA of all strain proteins
+        self.blast_db = blast_db  # BLAST database built from genomes_fasta
+        self.workdir = workdir
+        self.threads = threads
+        self.replicons = replicons
+        self.force = force  # Rerun every job regardless of the manifest
+        self.plots = plots
+        self.mafft_strategy = mafft_strategy
+        self.mafft_cache = mafft_cache  # optional content-addressed alignment cache folder
+        self.prefilter = prefilter  # resolve queries identical in every strain without BLAST / MAFFT
+        self.hit_thresholds = hit_thresholds or {}  # stage 04 overrides: min_identity / min_coverage / max_evalue
+        self.tile_columns = tile_columns  # stream stage 06 alignments in column tiles (same output)
+        self.hotspots = hotspots  # position-level SQLite index of all mutations (hotspot_index.py)
+        self.scheduler = scheduler  # "stages": one stage after the other; "async": per-query pipelines
+
+        os.makedirs(self.workdir, exist_ok=True)
+        self.manifest = Manifest(os.path.join(self.workdir, MANIFEST_NAME))
+        self.counts = {}
+        self.failures = []  # job_scheduler.FAILURE_HEADER rows, written to failed_jobs.tsv
+        self.handled = set()  # job keys already run (or found current) by the async scheduler
+        self.failed = set()  # job keys that failed in this run: not recorded, skipped by later stages
+
+    def path(self, *parts):
+        return os.path.join(self.workdir, *parts)
+
+    def replicon_fasta(self, replicon):
+        return self.path(f"{replicon}_proteins.faa")
+
+    def needs_run(self, key, inputs):
+        if key in self.handled or key in self.failed:
+            return False
+        done = not self.force and self.manifest.is_current(key, inputs)
+        stage = key.split("/", 1)[0]
+        ran, skipped = self.counts.get(stage, (0, 0))
+        self.counts[stage] = (ran, skipped + 1) if done else (ran + 1, skipped)
+        return not done
+
+    def job_failed(self, key, error):
+        # One bad input must not stop the run: the job is reported at the end, not recorded,
+        # skipped by the later stages of this run and retried on the next run
+        stage, item = key.split("_", 1)[0], key.split("/", 1)[1]
+        self.failed.add(key)
+        self.manifest.jobs.pop(key, None)  # no stale outputs / summary row from an earlier run
+        self.failures.append([stage, item, 1, None, error])
+        print(f"FAILED {stage} {item}: {error}")
+
+    # === Stage 02: split reference into chromosomal / plasmid proteins ===
+    def split_reference(self):
+        from extract_chromosomal_plasmid_faa_02 import split_reference_proteins
+
+        key = "02_split"
+        inputs = {"reference": self.manifest.digest(self.reference_fasta)}
+        outputs = [self.replicon_fasta("plasmid"), self.replicon_fasta("chromosomal")]
+        if self.needs_run(key, inputs):
+            split_reference_proteins(self.reference_fasta, *outputs)
+            self.manifest.record(key, inputs, outputs)
+
+    # === Stage 03 fast path: queries identical in every strain skip stages 03-05 ===
+    def prefilter_queries(self, replicon, queries):
+        from exact_match_prefilter import prefilter_queries
+
+        hits_dir = self.path(replicon, "filtered_hits")
+        msa_dir = self.path(replicon, "msa")
+        key = f"03_prefilter/{replicon}"
+        inputs = {"queries": self.manifest.digest(self.replicon_fasta(replicon)),
+                  "genomes": self.manifest.digest(self.genomes_fasta)}
+        if self.needs_run(key, inputs):
+            resolved, _ = prefilter_queries(self.replicon_fasta(replicon), self.genomes_fasta, hits_dir, msa_dir,
+                                            queries=queries)
+            outputs = []
+            for query_id in resolved:
+                outputs += [os.path.join(hits_dir, f"filtered_hits_{query_id}.faa"),
+                            os.path.join(hits_dir, "filtered_hits_csv", f"{query_id}_hit_defs.csv"),
+                            os.path.join(msa_dir, f"MSA_{query_id}.faa")]
+            self.manifest.record(key, inputs, outputs, result=sorted(resolved))
+        resolved = set(self.manifest.result(key))
+        return {query_id: query for query_id, query in queries.items() if query_id not in resolved}
+
+    # === Stage 03: one blastp job per query protein ===
+    def blast_queries(self, replicon, queries):
+        from blast_runner_03 import BLAST_RETRIES, run_blast
+
+        xml_dir = self.path(replicon, "blast_xml")
+        temp_dir = self.path(replicon, "temp_fastas")
+        os.makedirs(temp_dir, exist_ok=True)
+        db_digest = self.manifest.digest_many(glob.glob(f"{self.blast_db}.*"))
+
+        pending = {}
+        for query_id, (description, sequence) in queries.items():
+            key = f"03_blast/{replicon}/{query_id}"
+            inputs = {"query": text_digest(f"{description}\n{sequence}"), "db": db_digest}
+            if self.needs_run(key, inputs):
+                fasta_path = write_query_fasta(temp_dir, query_id, description, sequence)
+                pending[key] = (inputs, fasta_path, os.path.join(xml_dir, f"{query_id}.xml"))
+
+        os.makedirs(xml_dir, exist_ok=True)
+        with ThreadPoolExecutor(max_workers=self.threads) as executor:
+            futures = {executor.submit(run_blast, fasta_path, self.blast_db, xml_dir): key
+                       for key, (_, fasta_path, _) in pending.items()}
+            for future in as_completed(futures):
+                key = futures[future]
+                try:
+                    future.result()
+                except RuntimeError as e:  # reported at the end, retried on the next run
+                    print(e)
+                    self.failures.append(["03", key.split("/", 1)[1], BLAST_RETRIES + 1, None, str(e)])
+                    continue
+                inputs, _, xml_path = pending[key]
+                self.manifest.record(key, inputs, [xml_path])
+
+    # === Stage 04: filter hits and extract hit sequences per query ===
+    def filter_hits(self, replicon, queries):
+        from blast_hit_filtering_04 import BLASTProcessor
+
+        xml_dir = self.path(replicon, "blast_xml")
+        hits_dir = self.path(replicon, "filtered_hits")
+        # HSPs are cached per XML, so a threshold change refilters without parsing the XML again
+        processor = BLASTProcessor(xml_dir, self.genomes_fasta, hits_dir, self.replicon_fasta(replicon),
+                                   hsp_cache_dir=self.path(replicon, "hsp_cache"), **self.hit_thresholds)
+        genomes_digest = self.manifest.digest(self.genomes_fasta)
+
+        with processor.genome_index:
+            for query_id, (description, sequence) in queries.items():
+                xml_path = os.path.join(xml_dir, f"{query_id}.xml")
+                if not os.path.exists(xml_path):
+                    continue
+                key = f"04_filter/{replicon}/{query_id}"
+                inputs = {"xml": self.manifest.digest(xml_path), "genomes": genomes_digest,
+                          "query": text_digest(f"{description}\n{sequence}")}
+                if self.hit_thresholds:
+                    inputs["thresholds"] = self.hit_thresholds
+                if self.needs_run(key, inputs):
+                    try:
+                        processor.process_xml_file(f"{query_id}.xml")
+                    except Exception as e:
+                        self.job_failed(key, f"{type(e).__name__}: {e}")
+                        continue
+                    outputs = [os.path.join(hits_dir, f"filtered_hits_{query_id}.faa"),
+                               os.path.join(processor.csv_output_folder, f"{query_id}_hit_defs.csv")]
+                    self.manifest.record(key, inputs, outputs)
+
+    # === Stage 05: one MAFFT alignment per filtered hit file ===
+    def align_hits(self, replicon, queries):
+        from MSA_runnner_05 import run_mafft_jobs
+
+        hits_dir = self.path(replicon, "filtered_hits")
+        msa_dir = self.path(replicon, "msa")
+        os.makedirs(msa_dir, exist_ok=True)
+        log_file = self.path(replicon, "mafft_errors.log")
+        skipped_file = self.path(replicon, "skipped_files.txt")
+
+        pending = {}
+        for query_id in queries:
+            filename = f"filtered_hits_{query_id}.faa"
+            hits_path = os.path.join(hits_dir, filename)
+            if not os.path.exists(hits_path) or f"04_filter/{replicon}/{query_id}" in self.failed:
+                continue
+            key = f"05_mafft/{replicon}/{query_id}"
+            inputs = {"hits": self.manifest.digest(hits_path), "strategy": self.mafft_strategy}
+            if self.needs_run(key, inputs):
+                msa_path = os.path.join(msa_dir, f"MSA_{query_id}.faa")
+                if os.path.exists(msa_path):
+                    os.remove(msa_path)  # a rerun may skip (< 2 sequences) and must not leave the old MSA behind
+                pending[filename] = (key, inputs, hits_path, msa_path)
+
+        if not pending:
+            return
+        jobs = [(filename, hits_path, msa_path) for filename, (_, _, hits_path, msa_path) in pending.items()]
+        cache = None
+        if self.mafft_cache:
+            from mafft_cache import AlignmentCache
+            cache = AlignmentCache(self.mafft_cache)
+        statuses = run_mafft_jobs(jobs, log_file, skipped_file, max_workers=self.threads,
+                                  strategy=self.mafft_strategy, cache=cache)
+        for filename, status in statuses.items():
+            key, inputs, _, msa_path = pending[filename]
+            if status != "failed":  # failed alignments are retried on the next run
+                self.manifest.record(key, inputs, [msa_path])
+            else:
+                self.failures.append(["05", key.split("/", 1)[1], 1, None, f"see {log_file}"])
+
+    # === Stage 06: mutation CSV per alignment, summary rebuilt from recorded rows ===
+    def extract_mutations(self, replicon, queries):
+        from extract_mutations_06 import process_msa_file, write_mutation_summary
+
+        msa_dir = self.path(replicon, "msa")
+        results_dir = self.path(replicon, "mutation_results")
+        mutation_folder = os.path.join(results_dir, "mutations")
+        os.makedirs(mutation_folder, exist_ok=True)
+
+        summary_log = []
+        for query_id in sorted(queries):
+            msa_path = os.path.join(msa_dir, f"MSA_{query_id}.faa")
+            if not os.path.exists(msa_path):
+                continue
+            key = f"06_mutations/{replicon}/{query_id}"
+            if key in self.failed:
+                continue  # already reported; no summary row until it succeeds
+            inputs = {"msa": self.manifest.digest(msa_path)}
+            if self.needs_run(key, inputs):
+                mutation_csv = os.path.join(mutation_folder, f"MSA_{query_id}.csv")
+                if os.path.exists(mutation_csv):
+                    os.remove(mutation_csv)  # only rewritten when the new alignment still has mutations
+                try:
+                    summary_row = process_msa_file(msa_path, mutation_folder, tile_columns=self.tile_columns)
+                except Exception as e:
+                    self.job_failed(key, f"{type(e).__name__}: {e}")
+                    continue
+                self.manifest.record(key, inputs, [mutation_csv], result=summary_row)
+            summary_row = self.manifest.result(key)
+            if summary_row is not None:
+                summary_log.append(summary_row)
+
+        summary_path = os.path.join(results_dir, "mutation_summary.csv")
+        write_mutation_summary(summary_log, summary_path)
+        return summary_path
+
+    # === Stages 03-06 per query under one core budget (--scheduler async) ===
+    def run_queries_async(self, work):
+        # work: [(replicon, queries)]; same job keys and outputs as the stage-by-stage methods
+        from job_scheduler import JobScheduler
+
+        with JobScheduler(self.threads) as scheduler:
+            asyncio.run(self._run_queries(scheduler, work))
+        self.failures.extend(scheduler.failures)
+
+    async def _run_queries(self, scheduler, work):
+        pipelines = []
+        for replicon, queries in work:
+            context = self.async_context(replicon)
+            pipelines += [self.query_pipeline(scheduler, context, query_id, description, sequence)
+                          for query_id, (description, sequence) in queries.items()]
+
+        print(f"Scheduling {len(pipelines)} query pipelines on {scheduler.budget.cores} cores")
+        for i, pipeline in enumerate(asyncio.as_completed(pipelines), 1):
+            await pipeline
+            if i % 100 == 0 or i == len(pipelines):
+                print(f"[{i}/{len(pipelines)}] queries done")
+                self.manifest.save()
+
+    def async_context(self, replicon):
+        # Per-replicon folders, digests and stage 04 processor settings shared by its query pipelines
+        from blast_hit_filtering_04 import BLASTProcessor
+
+        context = {
+            "replicon": replicon,
+            "xml_dir": self.path(replicon, "blast_xml"),
+            "temp_dir": self.path(replicon, "temp_fastas"),
+            "hits_dir": self.path(replicon, "filtered_hits"),
+            "msa_dir": self.path(replicon, "msa"),
+            "mutation_folder": self.path(replicon, "mutation_results", "mutations"),
+            "log_file": self.path(replicon, "mafft_errors.log"),
+            "skipped_file": self.path(replicon, "skipped_files.txt"),
+            "db": self.manifest.digest_many(glob.glob(f"{self.blast_db}.*")),
+            "genomes": self.manifest.digest(self.genomes_fasta),
+            "cache": None,
+        }
+        for folder in ("xml_dir", "temp_dir", "hits_dir", "msa_dir", "mutation_folder"):
+            os.makedirs(context[folder], exist_ok=True)
+
+        # Built once here so the genome index is fresh before pool workers load it
+        processor = BLASTProcessor(context["xml_dir"], self.genomes_fasta, context["hits_dir"],
+                                   self.replicon_fasta(replicon), hsp_cache_dir=self.path(replicon, "hsp_cache"),
+                                   **self.hit_thresholds)
+        processor.genome_index.load_or_build()
+        context["processor_args"] = processor._processor_args()
+        context["processor_options"] = processor._processor_options()
+        context["csv_folder"] = processor.csv_output_folder
+        if self.mafft_cache:
+            from mafft_cache import AlignmentCache
+            context["cache"] = AlignmentCache(self.mafft_cache)
+        return context
+
+    async def query_pipeline(self, scheduler, context, query_id, description, sequence):
+        from job_scheduler import JobFailed
+        from blast_hit_filtering_04 import filter_xml_file
+        from MSA_runnner_05 import choose_mafft_options, fasta_job_size
+        from extract_mutations_06 import process_msa_file
+
+        replicon = context["replicon"]
+        item = f"{replicon}/{query_id}"
+        query_digest = text_digest(f"{description}\n{sequence}")
+        try:
+            # === 03: blastp, XML on stdout so a failed attempt never leaves a partial file ===
+            xml_path = os.path.join(context["xml_dir"], f"{query_id}.xml")
+            key = f"03_blast/{item}"
+            inputs = {"query": query_digest, "db": context["db"]}
+            if self.needs_run(key, inputs):
+                fasta_path = write_query_fasta(context["temp_dir"], query_id, description, sequence)
+                await scheduler.run_tool(["blastp", "-query", fasta_path, "-db", self.blast_db, "-outfmt", "5"],
+                                         "03", item, priority=STAGE_PRIORITY["03"], stdout_path=xml_path)
+                self.manifest.record(key, inputs, [xml_path])
+            if not os.path.exists(xml_path):
+                return
+
+            # === 04: filter hits in the process pool ===
+            hits_path = os.path.join(context["hits_dir"], f"filtered_hits_{query_id}.faa")
+            key = f"04_filter/{item}"
+            inputs = {"xml": self.manifest.digest(xml_path), "genomes": context["genomes"], "query": query_digest}
+            if self.hit_thresholds:
+                inputs["thresholds"] = self.hit_thresholds
+            if self.needs_run(key, inputs):
+                await scheduler.run_python(filter_xml_file, context["processor_args"], context["processor_options"],
+                                           f"{query_id}.xml", stage="04", item=item, priority=STAGE_PRIORITY["04"])
+                self.manifest.record(key, inputs, [hits_path, os.path.join(context["csv_folder"],
+                                                                           f"{query_id}_hit_defs.csv")])
+            if not os.path.exists(hits_path):
+                return
+
+            # === 05: MAFFT (skips, cache and log as in run_mafft_jobs) ===
+            msa_path = os.path.join(context["msa_dir"], f"MSA_{query_id}.faa")
+            key = f"05_mafft/{item}"
+            inputs = {"hits": self.manifest.digest(hits_path), "strategy": self.mafft_strategy}
+            if self.needs_run(key, inputs):
+                if os.path.exists(msa_path):
+                    os.remove(msa_path)
+                n_sequences, longest = fasta_job_size(hits_path)
+                filename = os.path.basename(hits_path)
+                if n_sequences < 2:
+                    with open(context["skipped_file"], "a") as skipped, open(context["log_file"], "a") as log:
+                        skipped.write(f"{filename}\n")
+                        log.write(f"[{filename}] Skipped: Less than 2 sequences.\n")
+                else:
+                    options = choose_mafft_options(n_sequences, longest, self.mafft_strategy)
+                    cache = context["cache"]
+                    cache_key = cache.key(hits_path, options) if cache is not None else None
+                    if cache_key is None or not cache.fetch(cache_key, msa_path):
+                        await scheduler.run_tool(["mafft", "--thread", "1", *options, hits_path], "05", item,
+                                                 priority=STAGE_PRIORITY["05"], stdout_path=msa_path)
+                        if cache_key is not None:
+                            cache.store(cache_key, msa_path)
+                self.manifest.record(key, inputs, [msa_path])
+            if not os.path.exists(msa_path):
+                return
+
+            # === 06: mutation CSV in the process pool; the summary is rebuilt by extract_mutations ===
+            key = f"06_mutations/{item}"
+            inputs = {"msa": self.manifest.digest(msa_path)}
+            if self.needs_run(key, inputs):
+                mutation_csv = os.path.join(context["mutation_folder"], f"MSA_{query_id}.csv")
+                if os.path.exists(mutation_csv):
+                    os.remove(mutation_csv)
+                self.manifest.jobs.pop(key, None)  # no stale summary row if this job fails
+                summary_row = await scheduler.run_python(process_msa_file, msa_path, context["mutation_folder"],
+                                                         self.tile_columns, stage="06", item=item,
+                                                         priority=STAGE_PRIORITY["06"])
+                self.manifest.record(key, inputs, [mutation_csv], result=summary_row)
+            self.handled.add(key)
+        except JobFailed as failure:  # the job is not recorded, so the next run retries it
+            self.failed.add(key)
+            scheduler.record_failure(failure)
+
+    # === Stages 07-10: per-replicon tables and plots ===
+    def summarize(self, replicon, summary_path):
+        from protein_length_07 import build_length_table
+        from extract_mutation_summary_10 import build_summary_with_hit_defs
+
+        results_dir = self.path(replicon, "mutation_results")
+        replicon_fasta = self.replicon_fasta(replicon)
+        hit_def_folder = self.path(replicon, "filtered_hits", "filtered_hits_csv")
+        hit_csvs = glob.glob(os.path.join(hit_def_folder, "*.csv"))
+        summary_inputs = {"summary": self.manifest.digest(summary_path),
+                          "proteins": self.manifest.digest(replicon_fasta)}
+
+        length_csv = os.path.join(results_dir, f"distribution_curve_{replicon}.csv")
+        if self.needs_run(f"07_lengths/{replicon}", summary_inputs):
+            build_length_table(summary_path, replicon_fasta, length_csv)
+            self.manifest.record(f"07_lengths/{replicon}", summary_inputs, [length_csv])
+
+        key = f"10_summary/{replicon}"
+        inputs = dict(summary_inputs, hit_defs=self.manifest.digest_many(hit_csvs))
+        if self.needs_run(key, inputs):
+            outputs = build_summary_with_hit_defs(summary_path, hit_def_folder, replicon_fasta, results_dir)
+            self.manifest.record(key, inputs, outputs)
+
+        if self.hotspots:
+            from hotspot_index import INDEX_NAME, build_hotspot_index
+
+            mutation_folder = os.path.join(results_dir, "mutations")
+            labelled_summary = os.path.join(results_dir, "mutation_summary_with_hit_defs.csv")
+            hotspot_db = os.path.join(self.workdir, INDEX_NAME)
+            hotspot_inputs = {"summary": self.manifest.digest(labelled_summary),
+                              "mutations": self.manifest.digest_many(
+                                  glob.glob(os.path.join(mutation_folder, "*.csv")))}
+            # One index for all replicons: its digest changes with every replicon, so it is not
+            # recorded as an output (a deleted index is handled in run())
+            if self.needs_run(f"12_hotspots/{replicon}", hotspot_inputs):
+                build_hotspot_index(hotspot_db, mutation_folder, replicon, labelled_summary)
+                self.manifest.record(f"12_hotspots/{replicon}", hotspot_inputs, [])
+
+        if self.plots:
+            from distribution_curve_08 import plot_length_distribution
+            from mutation_pie_chart_09 import plot_mutation_pie
+
+            curve_png = os.path.join(results_dir, f"distribution_curve_{replicon}.png")
+            curve_inputs = {"lengths": self.manifest.digest(length_csv)}
+            if self.needs_run(f"08_curve/{replicon}", curve_inputs):
+                plot_length_distribution(length_csv, curve_png)
+                self.manifest.record(f"08_curve/{replicon}", curve_inputs, [curve_png])
+
+            pie_png = os.path.join(results_dir, f"mutation_pie_{replicon}.png")
+            pie_inputs = {"summary": summary_inputs["summary"]}
+            if self.needs_run(f"09_pie/{replicon}", pie_inputs):
+                plot_mutation_pie(summary_path, replicon, pie_png)
+                self.manifest.record(f"09_pie/{replicon}", pie_inputs, [pie_png])
+
+    def run(self):
+        from hotspot_index import INDEX_NAME
+
+        if self.hotspots and not os.path.exists(os.path.join(self.workdir, INDEX_NAME)):
+            # Index deleted: rebuild every replicon's part of it
+            for key in [key for key in self.manifest.jobs if key.startswith("12_hotspots/")]:
+                del self.manifest.jobs[key]
+        try:
+            with telemetry.span("pipeline", "split_reference", event="step"):
+                self.split_reference()
+            self.manifest.save()
+
+            work = []
+            for replicon in self.replicons:
+                with open(self.replicon_fasta(replicon)) as handle:
+                    queries = {description.split(None, 1)[0]: (description, sequence)
+                               for description, sequence in iter_fasta(handle) if description}
+                if not queries:
+                    print(f"No {replicon} proteins, skipping.")
+                    continue
+
+                print(f"\n=== {replicon}: {len(queries)} proteins ===")
+                divergent = queries
+                if self.prefilter:
+                    with telemetry.span("pipeline", "prefilter_queries", item=replicon, event="step"):
+                        divergent = self.prefilter_queries(replicon, queries)
+                    self.manifest.save()
+                work.append((replicon, queries, divergent))
+
+            if self.scheduler == "async":
+                # Both replicons' queries share the core budget
+                with telemetry.span("pipeline", "run_queries_async", event="step"):
+                    self.run_queries_async([(replicon, divergent) for replicon, _, divergent in work])
+                self.manifest.save()
+
+            for replicon, queries, divergent in work:
+                if self.scheduler != "async":
+                    for step in (self.blast_queries, self.filter_hits, self.align_hits):
+                        with telemetry.span("pipeline", step.__name__, item=replicon, event="step"):
+                            step(replicon, divergent)
+                        self.manifest.save()
+                with telemetry.span("pipeline", "extract_mutations", item=replicon, event="step"):
+                    summary_path = self.extract_mutations(replicon, queries)
+                self.manifest.save()
+                with telemetry.span("pipeline", "summarize", item=replicon, event="step"):
+                    self.summarize(replicon, summary_path)
+                self.manifest.save()
+        finally:
+            # Keep whatever finished so an interrupted run resumes from here
+            self.manifest.save()
+
+        print("\nStage      ran   skipped")
+        for stage, (ran, skipped) in sorted(self.counts.items()):
+            print(f"{stage:<12} {ran:>5} {skipped:>8}")
+
+        from job_scheduler import write_failure_report
+
+        report = write_failure_report(self.failures, os.path.join(self.workdir, FAILURES_NAME))
+        if report:
+            print(f"\n{len(self.failures)} job(s) failed and will be retried on the next run; see {report}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run stages 02-10 without prompts, skipping work whose inputs are unchanged.",
+                                     fromfile_prefix_chars="@")
+    parser.add_argument("--reference", required=True, help="Reference proteome FASTA (.faa)")
+    parser.add_argument("--genomes", required=True, help="Combined FASTA of all strain proteins")
+    parser.add_argument("--blast-db", required=True, help="BLAST database built from --genomes")
+    parser.add_argument("--workdir", required=True, help="Folder for all stage outputs and the manifest")
+    parser.add_argument("--threads", type=int, default=4,
+                        help="Parallel blastp / mafft jobs (the core budget with --scheduler async)")
+    parser.add_argument("--scheduler", choices=["stages", "async"], default="stages",
+                        help="async: run stages 03-06 per query as soon as its own inputs are ready")
+    parser.add_argument("--replicons", nargs="+", choices=REPLICONS, default=REPLICONS)
+    parser.add_argument("--force", action="store_true", help="Ignore the manifest and rerun everything")
+    parser.add_argument("--plots", action="store_true", help="Also save the stage 08/09 figures as PNG")
+    parser.add_argument("--hotspots", action="store_true",
+                        help="Also index every mutation by protein / position in <workdir>/hotspots.sqlite")
+    parser.add_argument("--mafft-strategy", default="auto", choices=["auto", "adaptive", "linsi", "fftnsi", "fftns2"])
+    parser.add_argument("--mafft-cache", help="Folder for the shared MAFFT alignment cache")
+    parser.add_argument("--prefilter", action="store_true",
+                        help="Resolve queries identical in every strain without BLAST / MAFFT")
+    parser.add_argument("--min-identity", type=float, help="Stage 04 hit identity threshold (default 0.90)")
+    parser.add_argument("--min-coverage", type=float, help="Stage 04 query coverage threshold (default 0.70)")
+    parser.add_argument("--max-evalue", type=float, help="Stage 04 e-value threshold (default 1e-5)")
+    parser.add_argument("--tile-columns", type=int, nargs="?", const=1024,
+                        help="Stream stage 06 alignments in column tiles of this width (default 1024)")
+    telemetry.add_trace_arguments(parser)
+    args = parser.parse_args(argv)
+
+    telemetry.start_trace(args)
+    hit_thresholds = {name: getattr(args, name) for name in ("min_identity", "min_coverage", "max_evalue")
+                      if getattr(args, name) is not None}
+
+    PipelineRunner(args.reference, args.genomes, args.blast_db, args.workdir, threads=args.threads,
+                   replicons=args.replicons, force=args.force, plots=args.plots,
+                   mafft_strategy=args.mafft_strategy, mafft_cache=args.mafft_cache,
+                   prefilter=args.prefilter, hit_thresholds=hit_thresholds,
+                   tile_columns=args.tile_columns, hotspots=args.hotspots, scheduler=args.scheduler).run()
+    telemetry.finish_trace(args)
+
+
+if __name__ == "__main__":
+    main()
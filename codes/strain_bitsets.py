@@ -0,0 +1,262 @@
+import os
+import csv
+import argparse
+import numpy as np
+
+# Which strains carry each mutation. Stage 06 only keeps per-column counts; this records, for every
+# mutation row, the set of strains (assembly accession = first token of the MSA hit header) whose
+# hit has the mutated residue, as one bit per strain.
+#
+# Saved as a single .npz:
+#   strains             accessions, bit order of every bitset
+#   protein_ids, aligned_positions, original_positions (-1 for insertions), query_residues,
+#   mutated_residues ("-" for deletions), mutation_classes   one entry per mutation row
+#   bits                uint8 (mutations × ceil(strains / 8)), np.packbits of the carrier matrix
+# Queries work on the packed bytes: AND / OR across mutations for shared strains, and XOR / AND
+# with popcount for pairwise strain distances.
+
+if hasattr(np, "bitwise_count"):
+    popcount = np.bitwise_count
+else:
+    _POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+    def popcount(values):
+        return _POPCOUNT_TABLE[values]
+
+
+def strain_of_header(header):
+    parts = header.split(None, 1)
+    return parts[0] if parts else ""
+
+
+def mutation_residue(row):
+    # Residue a carrier has in the column: "-" for deletions, the inserted / substituted residue otherwise
+    mutation = row[3]
+    if mutation == "deletion":
+        return "-"
+    if mutation.startswith("insertion: "):
+        return mutation[len("insertion: "):]
+    return mutation
+
+
+def msa_carriers(headers, matrix, mutations, aligned_offset=0):
+    # headers: MSA record descriptions, query first; matrix: load_alignment_matrix() of the same MSA.
+    # Returns (strains, carriers) with carriers a bool (mutations × strains) matrix; paralog hits are OR-ed.
+    strains, strain_rows = np.unique([strain_of_header(h) for h in headers[1:]], return_inverse=True)
+    carriers = np.zeros((len(strains), len(mutations)), dtype=bool)
+    if mutations and len(strains):
+        columns = np.array([row[0] - 1 - aligned_offset for row in mutations], dtype=np.intp)
+        residues = np.frombuffer("".join(mutation_residue(row) for row in mutations).encode("ascii"), dtype=np.uint8)
+        np.logical_or.at(carriers, strain_rows, matrix[1:, columns] == residues)
+    return strains.tolist(), carriers.T
+
+
+def mutation_label(mutation_class, aligned_position, original_position, query_residue, mutated_residue):
+    # A123V, A123del, ins45K (insertions use the aligned position)
+    if mutation_class == "insertion":
+        return f"ins{aligned_position}{mutated_residue}"
+    if mutation_class == "deletion":
+        return f"{query_residue}{original_position}del"
+    return f"{query_residue}{original_position}{mutated_residue}"
+
+
+class StrainBitsetWriter:
+    # Collects per-MSA carrier matrices and lays them out on one strain axis
+    def __init__(self, strains=None):
+        self.strains = list(strains or [])  # fixed strain order (e.g. data_summary.tsv); extended as needed
+        self.strain_positions = {strain: i for i, strain in enumerate(self.strains)}
+        self.columns = {name: [] for name in ("protein_ids", "aligned_positions", "original_positions",
+                                              "query_residues", "mutated_residues", "mutation_classes")}
+        self.blocks = []  # (global strain columns, bool carriers)
+
+    def add(self, protein_id, mutations, strains, carriers):
+        for strain in strains:
+            if strain not in self.strain_positions:
+                self.strain_positions[strain] = len(self.strains)
+                self.strains.append(strain)
+
+        for row in mutations:
+            mutation = row[3]
+            mutation_class = ("deletion" if mutation == "deletion"
+                              else "insertion" if mutation.startswith("insertion: ") else "substitution")
+            self.columns["protein_ids"].append(protein_id)
+            self.columns["aligned_positions"].append(row[0])
+            self.columns["original_positions"].append(-1 if row[1] == "N/A" else row[1])
+            self.columns["query_residues"].append(row[2])
+            self.columns["mutated_residues"].append(mutation_residue(row))
+            self.columns["mutation_classes"].append(mutation_class)
+        self.blocks.append((np.array([self.strain_positions[s] for s in strains], dtype=np.intp), carriers))
+
+    def write(self, path):
+        carriers = np.zeros((len(self.columns["protein_ids"]), len(self.strains)), dtype=bool)
+        start = 0
+        for strain_columns, block in self.blocks:
+            carriers[start:start + len(block)][:, strain_columns] = block
+            start += len(block)
+
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as handle:
+            np.savez_compressed(
+                handle,
+                strains=np.array(self.strains, dtype=str),
+                protein_ids=np.array(self.columns["protein_ids"], dtype=str),
+                aligned_positions=np.array(self.columns["aligned_positions"], dtype=np.int32),
+                original_positions=np.array(self.columns["original_positions"], dtype=np.int32),
+                query_residues=np.array(self.columns["query_residues"], dtype=str),
+                mutated_residues=np.array(self.columns["mutated_residues"], dtype=str),
+                mutation_classes=np.array(self.columns["mutation_classes"], dtype=str),
+                bits=np.packbits(carriers, axis=1),
+            )
+        os.replace(tmp_path, path)
+        return path
+
+
+class StrainBitsets:
+    def __init__(self, path):
+        with np.load(path) as data:
+            self.strains = data["strains"]
+            self.protein_ids = data["protein_ids"]
+            self.aligned_positions = data["aligned_positions"]
+            self.original_positions = data["original_positions"]
+            self.query_residues = data["query_residues"]
+            self.mutated_residues = data["mutated_residues"]
+            self.mutation_classes = data["mutation_classes"]
+            self.bits = data["bits"]
+        self._strain_bits = None
+
+    def __len__(self):
+        return len(self.protein_ids)
+
+    def label(self, row):
+        return mutation_label(self.mutation_classes[row], self.aligned_positions[row], self.original_positions[row],
+                              self.query_residues[row], self.mutated_residues[row])
+
+    def find(self, protein_id, label=None):
+        # Row numbers of a protein's mutations, or of one mutation given as e.g. "A123V" / "A123del" / "ins45K"
+        rows = np.flatnonzero(self.protein_ids == protein_id)
+        if label is not None:
+            rows = [row for row in rows.tolist() if self.label(row) == label]
+        return np.asarray(rows, dtype=np.intp)
+
+    def find_key(self, key):
+        # "<protein_id>:<label>", e.g. "WP_002892084.1:S83I"
+        protein_id, label = key.rsplit(":", 1)
+        rows = self.find(protein_id, label)
+        if len(rows) == 0:
+            raise KeyError(f"Mutation not found: {key}")
+        return rows
+
+    def strains_in(self, packed):
+        return self.strains[np.unpackbits(packed, count=len(self.strains)).astype(bool)].tolist()
+
+    def carriers(self, row):
+        return self.strains_in(self.bits[row])
+
+    def shared_strains(self, rows):
+        # Strains carrying every one of the given mutations
+        return self.strains_in(np.bitwise_and.reduce(self.bits[rows], axis=0))
+
+    def any_strains(self, rows):
+        return self.strains_in(np.bitwise_or.reduce(self.bits[rows], axis=0))
+
+    def carrier_counts(self):
+        return popcount(self.bits).sum(axis=1, dtype=np.int64)
+
+    def strain_bits(self):
+        # The transpose, packed per strain: (strains × ceil(mutations / 8))
+        if self._strain_bits is None:
+            carriers = np.unpackbits(self.bits, axis=1, count=len(self.strains))
+            self._strain_bits = np.packbits(carriers.T, axis=1)
+        return self._strain_bits
+
+    def strain_matrix(self, op=np.bitwise_xor, block=32):
+        # Pairwise popcount(op(a, b)) over all strains; xor = mutations that differ, and = mutations shared
+        bits = self.strain_bits()
+        n = len(bits)
+        result = np.zeros((n, n), dtype=np.int64)
+        for start in range(0, n, block):
+            result[start:start + block] = popcount(op(bits[start:start + block, None, :], bits[None, :, :])).sum(
+                axis=2, dtype=np.int64)
+        return result
+
+    def distance_matrix(self):
+        return self.strain_matrix(np.bitwise_xor)
+
+    def shared_matrix(self):
+        return self.strain_matrix(np.bitwise_and)
+
+
+def write_strain_matrix(path, strains, matrix):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Strain", *strains])
+        for strain, row in zip(strains, matrix.tolist()):
+            writer.writerow([strain, *row])
+
+
+def build_strain_bitsets(msa_folder, output_path, strains=None, workers=1):
+    # Strain bitsets for every MSA in a folder, without writing any mutation CSV
+    from extract_mutations_06 import extract_msa_mutations, protein_id_from_msa
+    from concurrent.futures import ProcessPoolExecutor
+    from functools import partial
+
+    msa_paths = [os.path.join(msa_folder, f) for f in sorted(os.listdir(msa_folder)) if f.endswith(".faa")]
+    task = partial(extract_msa_mutations, carriers=True)
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(task, msa_paths, chunksize=max(1, len(msa_paths) // (workers * 8))))
+    else:
+        results = [task(msa_path) for msa_path in msa_paths]
+
+    writer = StrainBitsetWriter(strains)
+    for summary_row, mutations, (msa_strains, carriers) in results:
+        if mutations:
+            writer.add(protein_id_from_msa(summary_row[0]), mutations, msa_strains, carriers)
+    return writer.write(output_path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build and query per-mutation strain bitsets.",
+                                     fromfile_prefix_chars="@")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build = subparsers.add_parser("build", help="Bitsets for every MSA of a stage 05 folder")
+    build.add_argument("msa_folder")
+    build.add_argument("output", help="Output .npz")
+    build.add_argument("--summary", help="data_summary.tsv, to keep all 100 assemblies in a fixed bit order")
+    build.add_argument("--workers", type=int, default=1)
+
+    shared = subparsers.add_parser("shared", help="Strains carrying all given mutations (protein:label)")
+    shared.add_argument("bitsets")
+    shared.add_argument("mutations", nargs="+", help="e.g. WP_002892084.1:S83I WP_002892084.1:D87N")
+    shared.add_argument("--any", action="store_true", help="Strains carrying at least one of them instead")
+
+    distance = subparsers.add_parser("distance", help="Pairwise strain matrix as CSV")
+    distance.add_argument("bitsets")
+    distance.add_argument("output_csv")
+    distance.add_argument("--shared", action="store_true", help="Count shared mutations instead of differing ones")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        strains = None
+        if args.summary:
+            from merge_genome_proteins_01 import read_assembly_accessions
+            strains = read_assembly_accessions(args.summary)
+        print(f"Strain bitsets written to: {build_strain_bitsets(args.msa_folder, args.output, strains, args.workers)}")
+    elif args.command == "shared":
+        bitsets = StrainBitsets(args.bitsets)
+        rows = np.concatenate([bitsets.find_key(key) for key in args.mutations])
+        strains = bitsets.any_strains(rows) if args.any else bitsets.shared_strains(rows)
+        print(f"{len(strains)} strains")
+        for strain in strains:
+            print(strain)
+    else:
+        bitsets = StrainBitsets(args.bitsets)
+        matrix = bitsets.shared_matrix() if args.shared else bitsets.distance_matrix()
+        write_strain_matrix(args.output_csv, bitsets.strains.tolist(), matrix)
+        print(f"{len(bitsets.strains)} × {len(bitsets.strains)} matrix written to: {args.output_csv}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+import os
+import csv
+import time
+import argparse
+
+from blast_hit_filtering_04 import (MIN_IDENTITY, MIN_COVERAGE, MAX_EVALUE, cache_hsp_tables, load_hsp_columns,
+                                    sweep_thresholds)
+
+# How many hits / queries stage 04 would keep for a grid of thresholds, from the per-XML HSP cache
+# (blast_hit_filtering_04.py --hsp-cache) instead of re-parsing the BLAST XML for every setting.
+# Output CSV, one row per combination:
+#   Min_Identity, Min_Coverage, Max_Evalue, Accepted_Hits, Queries_With_Hits
+# The hit FASTA starts with the query itself, so every query with a hit also reaches stage 05.
+
+SWEEP_HEADER = ["Min_Identity", "Min_Coverage", "Max_Evalue", "Accepted_Hits", "Queries_With_Hits"]
+
+
+def run_sweep(cache_dir, output_csv, min_identities, min_coverages, max_evalues, xml_folder=None, workers=1):
+    # === Step 1: Fill the cache from the XML folder (only new or changed files are parsed) ===
+    if xml_folder:
+        start = time.perf_counter()
+        n_files = cache_hsp_tables(xml_folder, cache_dir, workers)
+        print(f"HSP cache up to date for {n_files} XML files ({time.perf_counter() - start:.1f}s)")
+
+    # === Step 2: One vectorized scan per threshold combination ===
+    start = time.perf_counter()
+    columns = load_hsp_columns(cache_dir, xml_folder)
+    rows = sweep_thresholds(columns, min_identities, min_coverages, max_evalues)
+    print(f"{len(rows)} threshold combinations over {len(columns['identities'])} HSPs of "
+          f"{len(columns['query_defs'])} queries ({time.perf_counter() - start:.1f}s)")
+    if columns["skipped_entries"]:
+        print(f"{columns['skipped_entries']} cache entries skipped: XML missing, changed or in another folder")
+
+    with open(output_csv, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(SWEEP_HEADER)
+        writer.writerows(rows)
+    print("Sweep written to:", output_csv)
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Count stage 04 hits for a grid of thresholds from the HSP cache.",
+                                     fromfile_prefix_chars="@")
+    parser.add_argument("cache_dir", help="HSP cache folder (blast_hit_filtering_04.py --hsp-cache)")
+    parser.add_argument("output_csv")
+    parser.add_argument("--xml-folder", help="Parse these BLAST XML files into the cache first and sweep only them")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes for parsing the XML")
+    parser.add_argument("--identity", type=float, nargs="+", default=[0.80, 0.85, MIN_IDENTITY, 0.95, 0.99])
+    parser.add_argument("--coverage", type=float, nargs="+", default=[0.50, 0.60, MIN_COVERAGE, 0.80, 0.90])
+    parser.add_argument("--evalue", type=float, nargs="+", default=[1e-3, MAX_EVALUE, 1e-10])
+    args = parser.parse_args(argv)
+
+    if not args.xml_folder and not os.path.isdir(args.cache_dir):
+        parser.error(f"{args.cache_dir} does not exist; give --xml-folder to build it")
+    run_sweep(args.cache_dir, args.output_csv, args.identity, args.coverage, args.evalue,
+              xml_folder=args.xml_folder, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
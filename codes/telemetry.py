@@ -0,0 +1,258 @@
+import os
+import sys
+import json
+import time
+import threading
+import subprocess
+from contextlib import contextmanager
+
+# Structured trace of where a run spends its time. Stages call span() / run_subprocess() /
+# queue_depth() / profiled(); without an open trace these cost next to nothing.
+#
+# The trace is JSONL, one event per line, every event with "event", "t" (epoch seconds) and "pid":
+#   span        stage, name, item, wall_s, cpu_s (thread CPU), bytes_read / bytes_written (sizes of the
+#               files the item read / wrote), error (exception class, when the item raised)
+#   subprocess  stage, item, command, wall_s, user_s, sys_s, max_rss_mb, returncode (blastp, mafft, ...)
+#   queue       stage, name, depth (jobs submitted but not finished yet)
+#   step        as span, for a whole pipeline step (run_pipeline.py); left out of the slowest items
+# Events are appended with one os.write() on an O_APPEND descriptor, so pool threads and forked
+# workers can share the file. The path (and the profile folder) is exported in the environment,
+# so spawned worker processes pick the trace up on their first event.
+#
+# Profile mode: profiled() wraps the Python hot loops (stage 04 HSP filtering, stage 06 mutation
+# extraction) in cProfile, one cumulative <stage>_<name>_<pid>.prof per process (pstats / snakeviz).
+# The loops stay plain functions in the stage process, so py-spy record --subprocesses sees them too.
+
+TRACE_ENV = "PIPELINE_TRACE"
+PROFILE_ENV = "PIPELINE_PROFILE"
+
+_fd = None
+_profile_dir = None
+_profiles = {}  # (stage, name) -> cProfile.Profile of this process
+_lock = threading.Lock()
+_checked_environment = False
+
+
+def open_trace(path=None, profile_dir=None, append=False):
+    # A new trace truncates the file unless append=True; workers always append
+    global _fd, _profile_dir, _checked_environment
+    close_trace()
+    if path:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        flags = os.O_WRONLY | os.O_CREAT | os.O_APPEND | (0 if append else os.O_TRUNC)
+        _fd = os.open(path, flags, 0o644)
+        os.environ[TRACE_ENV] = os.path.abspath(path)
+    if profile_dir:
+        os.makedirs(profile_dir, exist_ok=True)
+        _profile_dir = profile_dir
+        os.environ[PROFILE_ENV] = os.path.abspath(profile_dir)
+    _checked_environment = True
+
+
+def close_trace():
+    global _fd, _profile_dir
+    dump_profiles()
+    if _fd is not None:
+        os.close(_fd)
+    _fd = None
+    _profile_dir = None
+    _profiles.clear()
+    os.environ.pop(TRACE_ENV, None)
+    os.environ.pop(PROFILE_ENV, None)
+
+
+def enabled():
+    global _checked_environment
+    if not _checked_environment:
+        _checked_environment = True
+        if os.environ.get(TRACE_ENV) or os.environ.get(PROFILE_ENV):
+            open_trace(os.environ.get(TRACE_ENV), os.environ.get(PROFILE_ENV), append=True)
+    return _fd is not None
+
+
+def emit(event, **fields):
+    if not enabled():
+        return
+    line = json.dumps({"event": event, "t": round(time.time(), 6), "pid": os.getpid(), **fields}) + "\n"
+    os.write(_fd, line.encode())
+
+
+def file_bytes(paths):
+    return sum(os.path.getsize(path) for path in paths if path and os.path.isfile(path))
+
+
+@contextmanager
+def span(stage, name, item=None, reads=(), writes=(), event="span"):
+    # Times one work item. The yielded dict can take more "reads" / "writes" paths, or extra fields.
+    if not enabled():
+        yield {"reads": [], "writes": []}
+        return
+    record = {"reads": list(reads), "writes": list(writes)}
+    error = None
+    start = time.perf_counter()
+    cpu_start = time.thread_time()
+    try:
+        yield record
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        fields = {
+            "stage": stage,
+            "name": name,
+            "item": item,
+            "wall_s": round(time.perf_counter() - start, 6),
+            "cpu_s": round(time.thread_time() - cpu_start, 6),
+            "bytes_read": file_bytes(record.pop("reads")),
+            "bytes_written": file_bytes(record.pop("writes")),
+        }
+        if error:
+            fields["error"] = error
+        emit(event, **fields, **record)
+
+
+def queue_depth(stage, name, depth):
+    emit("queue", stage=stage, name=name, depth=depth)
+
+
+def run_subprocess(cmd, stage, item=None, stdout=None, stderr=None, text=True):
+    # subprocess.run() replacement that also reports the child's own CPU time and peak RSS (os.wait4).
+    # stdout / stderr as for subprocess.run (None, DEVNULL, PIPE or a file); returns a CompletedProcess.
+    if not hasattr(os, "wait4"):
+        start = time.perf_counter()
+        result = subprocess.run(cmd, stdout=stdout, stderr=stderr, text=text)
+        emit("subprocess", stage=stage, item=item, command=os.path.basename(cmd[0]),
+             wall_s=round(time.perf_counter() - start, 6), returncode=result.returncode)
+        return result
+
+    start = time.perf_counter()
+    process = subprocess.Popen(cmd, stdout=stdout, stderr=stderr, text=text)
+
+    # Pipes are drained in threads, so a chatty child (mafft progress on stderr) can't block on a full pipe
+    captured = {}
+    readers = []
+    for name, stream in (("stdout", process.stdout), ("stderr", process.stderr)):
+        if stream is not None:
+            reader = threading.Thread(target=lambda name=name, stream=stream: captured.__setitem__(name, stream.read()))
+            reader.start()
+            readers.append(reader)
+
+    _, status, usage = os.wait4(process.pid, 0)
+    wall = time.perf_counter() - start
+    process.returncode = os.waitstatus_to_exitcode(status)
+    for reader in readers:
+        reader.join()
+    for stream in (process.stdout, process.stderr):
+        if stream is not None:
+            stream.close()
+
+    rss_scale = 1 if sys.platform == "darwin" else 1024  # ru_maxrss: KiB on Linux, bytes on macOS
+    emit("subprocess", stage=stage, item=item, command=os.path.basename(cmd[0]), wall_s=round(wall, 6),
+         user_s=round(usage.ru_utime, 6), sys_s=round(usage.ru_stime, 6),
+         max_rss_mb=round(usage.ru_maxrss * rss_scale / 1024 ** 2, 1), returncode=process.returncode)
+    return subprocess.CompletedProcess(cmd, process.returncode, captured.get("stdout"), captured.get("stderr"))
+
+
+@contextmanager
+def profiled(stage, name):
+    # cProfile around a hot loop, only when a profile folder is set; one call at a time per process
+    enabled()
+    if _profile_dir is None:
+        yield
+        return
+    import cProfile
+
+    with _lock:
+        profile = _profiles.get((stage, name))
+        if profile is None:
+            profile = _profiles[(stage, name)] = cProfile.Profile()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        # Pool workers exit without atexit hooks, so the cumulative stats are rewritten after each call
+        profile.dump_stats(os.path.join(_profile_dir, f"{stage}_{name}_{os.getpid()}.prof"))
+
+
+def dump_profiles():
+    if _profile_dir is None:
+        return
+    for (stage, name), profile in _profiles.items():
+        profile.dump_stats(os.path.join(_profile_dir, f"{stage}_{name}_{os.getpid()}.prof"))
+
+
+def iter_trace(path):
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def summarize_trace(path, top=10):
+    # Per stage / name totals, the deepest queues and the slowest individual items
+    totals = {}
+    queues = {}
+    items = []
+    for event in iter_trace(path):
+        if event["event"] == "queue":
+            key = (event["stage"], event["name"])
+            queues[key] = max(queues.get(key, 0), event["depth"])
+            continue
+        name = event.get("name") or event.get("command")
+        total = totals.setdefault((event["stage"], event["event"], name), [0, 0.0, 0.0, 0, 0])
+        total[0] += 1
+        total[1] += event["wall_s"]
+        total[2] += event.get("cpu_s", event.get("user_s", 0.0) + event.get("sys_s", 0.0))
+        total[3] += event.get("bytes_read", 0)
+        total[4] += event.get("bytes_written", 0)
+        items.append(event)
+
+    print(f"\n{'stage':<8} {'event':<11} {'name':<24} {'items':>7} {'wall (s)':>10} {'cpu (s)':>10} "
+          f"{'read (MB)':>10} {'written (MB)':>13}")
+    for (stage, event, name), (count, wall, cpu, read, written) in sorted(totals.items()):
+        print(f"{stage:<8} {event:<11} {name:<24} {count:>7} {wall:>10.2f} {cpu:>10.2f} "
+              f"{read / 1024 ** 2:>10.1f} {written / 1024 ** 2:>13.1f}")
+    for (stage, name), depth in sorted(queues.items()):
+        print(f"Deepest queue {stage} {name}: {depth}")
+
+    items = [event for event in items if event["event"] != "step"]
+    slowest = sorted(items, key=lambda event: event["wall_s"], reverse=True)[:top]
+    if slowest:
+        print(f"\nSlowest {len(slowest)} items:")
+        for event in slowest:
+            name = event.get("name") or event.get("command")
+            print(f"{event['wall_s']:>10.3f}s  {event['stage']:<6} {name:<24} {event.get('item')}")
+    return totals, slowest
+
+
+def add_trace_arguments(parser):
+    parser.add_argument("--trace", help="Write a JSONL timing trace here and print the slowest items at the end")
+    parser.add_argument("--trace-top", type=int, default=10, help="Slowest items listed after a traced run")
+    parser.add_argument("--profile-dir", help="cProfile the Python hot loops into this folder (.prof per process)")
+
+
+def start_trace(args):
+    if args.trace or args.profile_dir:
+        open_trace(args.trace, args.profile_dir)
+
+
+def finish_trace(args):
+    close_trace()
+    if args.trace:
+        summarize_trace(args.trace, args.trace_top)
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Summarize a JSONL pipeline trace.", fromfile_prefix_chars="@")
+    parser.add_argument("trace")
+    parser.add_argument("--top", type=int, default=10, help="Number of slowest items to list")
+    args = parser.parse_args(argv)
+
+    summarize_trace(args.trace, args.top)
+
+
+if __name__ == "__main__":
+    main()